@@ -1 +1,12 @@
-from .place_homebuyers_in_neighborhood import PlaceHomeBuyersInNeighborhoods
\ No newline at end of file
+def __getattr__(name: str):
+    """
+    Imports the allocator on first use, so that the lighter modules of the package, e.g. the
+    verifier or the output writer, do not load the whole algorithm
+    """
+    if name == 'PlaceHomeBuyersInNeighborhoods':
+        from .place_homebuyers_in_neighborhood import PlaceHomeBuyersInNeighborhoods
+        return PlaceHomeBuyersInNeighborhoods
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+__all__ = ['PlaceHomeBuyersInNeighborhoods']
@@ -0,0 +1,18 @@
+def import_numpy(feature: str):
+    """
+    Imports NumPy, which is an optional dependency only needed by the vectorized features
+
+    Args:
+        feature (str): The name of the feature that needs NumPy, used in the error message
+
+    Returns:
+        module: The numpy module
+
+    Raises:
+        ImportError: If NumPy is not installed
+    """
+    try:
+        import numpy
+    except ImportError as error:
+        raise ImportError(f'{feature} requires NumPy, install it with `pip install numpy`') from error
+    return numpy
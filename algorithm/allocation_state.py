@@ -0,0 +1,82 @@
+from array import array
+from typing import Dict, Iterable
+
+from algorithm.ranked_index import RankedIndex
+
+
+class AllocationState:
+    """
+    Per-homebuyer bookkeeping of the 'recursive' engine, kept in flat arrays indexed by the position
+    (row) of each homebuyer
+
+    The engine used to test whether a homebuyer could be allocated by scanning the list of allocated
+    homebuyers and the candidates of the neighborhood, which made each test linear. With the state of
+    every homebuyer in a column, the test and every change of state are constant-time
+
+    A homebuyer is FREE until it is added to the candidates of a neighborhood (CANDIDATE), then either
+    HELD by the neighborhood or REJECTED when cut, which makes it a candidate of its next preferences.
+    A HELD homebuyer cut later by a better candidate is RELEASED: like the original engine, it is never
+    considered again
+
+    The homebuyers are indexed by the neighborhoods they rank and the rank, so each neighborhood only
+    visits the homebuyers that rank it at the priority of the pass, however long the unallocated set.
+    The `RankedIndex` also sorts them by score once, so the candidates of a neighborhood are kept as
+    positions in its order rather than sorted by score on every pass
+
+    Attributes:
+        homebuyers (list): The homebuyers, in the order of their rows
+        rows (dict): Maps homebuyer IDs to their rows
+        index (RankedIndex): The homebuyers ranking each neighborhood at each priority, best first
+        preference_counts (array): For each homebuyer, the length of its preference list
+        assigned (array): For each homebuyer, the ID of the neighborhood holding it, or -1
+        status (bytearray): For each homebuyer, one of FREE, CANDIDATE, HELD, REJECTED or RELEASED
+    """
+    FREE, CANDIDATE, HELD, REJECTED, RELEASED = range(5)
+
+    def __init__(self, homebuyers: Iterable, index: RankedIndex = None) -> None:
+        """
+        Initializes the state with every homebuyer FREE
+
+        Args:
+            homebuyers (Iterable): The homebuyers, HomeBuyer objects or views of an `EntityStore`
+            index (RankedIndex, optional): The index of the scored homebuyers, in the same rows.
+                                           Defaults to None (built from `homebuyers`)
+        """
+        self.homebuyers = list(homebuyers)
+        self.rows: Dict[int, int] = {}
+        self.preference_counts = array('l')
+        for row, homebuyer in enumerate(self.homebuyers):
+            self.rows[homebuyer.entity_id] = row
+            self.preference_counts.append(len(homebuyer.get_priority_ids()))
+        self.index = index if index is not None else RankedIndex.from_homebuyers(self.homebuyers)
+        self.assigned = array('l', [-1]) * len(self.homebuyers)
+        self.status = bytearray(len(self.homebuyers))
+
+    def can_propose(self, row: int, priority: int) -> bool:
+        """
+        Returns:
+            bool: True if the homebuyer was rejected and still has a preference at the given priority
+            or later. The others have run out of choices and are left unassigned
+        """
+        return self.status[row] == self.REJECTED and self.preference_counts[row] > priority
+
+    def propose(self, row: int) -> None:
+        """
+        Marks a FREE or REJECTED homebuyer as a candidate of the neighborhood being filled
+        """
+        self.status[row] = self.CANDIDATE
+
+    def hold(self, row: int, neighborhood_id: int) -> None:
+        """
+        Marks a homebuyer as held by a neighborhood
+        """
+        self.status[row] = self.HELD
+        self.assigned[row] = neighborhood_id
+
+    def cut(self, row: int) -> None:
+        """
+        Cuts a homebuyer from a neighborhood over its limit, a candidate is REJECTED and a held
+        homebuyer RELEASED
+        """
+        self.status[row] = self.RELEASED if self.status[row] == self.HELD else self.REJECTED
+        self.assigned[row] = -1
@@ -0,0 +1,179 @@
+import argparse
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+from algorithm.place_homebuyers_in_neighborhood import PlaceHomeBuyersInNeighborhoods
+from algorithm.stats import ExecutionStats
+from algorithm.writer import OutputWriter
+from entities.attributes import DEFAULT_SCHEMA, AttributeSchema
+
+
+class BatchResult(NamedTuple):
+    """
+    The outcome of the allocation of one input file
+
+    Attributes:
+        input_path (str): The path of the input file
+        output_path (str): The path of the output file
+        timings (dict): Maps each stage ('read', 'initialize', 'assign', 'write') to its wall time in seconds
+    """
+    input_path: str
+    output_path: str
+    timings: Dict[str, float]
+
+
+def _allocate_file(input_path: str, output_path: str, options: dict) -> BatchResult:
+    """
+    Runs the whole algorithm on one input file, in a worker process, its stages measured by an
+    `ExecutionStats`
+
+    Args:
+        input_path (str): The path of the input file
+        output_path (str): The path of the output file
+        options (dict): Keyword arguments for `PlaceHomeBuyersInNeighborhoods`
+
+    Returns:
+        BatchResult: The paths and the time spent in each stage
+    """
+    allocator = PlaceHomeBuyersInNeighborhoods(input_path, output_path=output_path, stats=ExecutionStats(), **options)
+    stats = allocator.execute()
+    return BatchResult(input_path, output_path, {name: stage.wall_time for name, stage in stats.stages.items()})
+
+
+class BatchRunner:
+    """
+    Allocates many independent input files, spread across a pool of worker processes
+
+    Each worker loads a single instance at a time, so at most `workers` instances are in memory at
+    once. Every input file gets its own output file, named after it, in `output_dir`. A matched file
+    that is the output of another matched file, written by a previous batch, is skipped rather than
+    allocated
+
+    Attributes:
+        input_paths (list): The input files, in the order they are submitted
+        skipped (list): The matched files skipped as outputs of other input files
+        output_dir (str): The directory of the output files, None to write next to each input file
+        workers (int): The number of worker processes
+        options (dict): Keyword arguments for `PlaceHomeBuyersInNeighborhoods`
+    """
+    EXTENSIONS = {'csv': '.csv', 'jsonl': '.jsonl'}
+
+    def __init__(self, inputs: str, output_dir: Optional[str] = None, workers: int = None, **options) -> None:
+        """
+        Initializes the runner with the input files matched by `inputs`
+
+        Args:
+            inputs (str): A directory (all its '*.txt' files are used) or a glob pattern
+            output_dir (str, optional): The directory of the output files. Defaults to None (next to
+                                        each input file)
+            workers (int, optional): The number of worker processes. Defaults to the number of CPUs
+            **options: Keyword arguments for `PlaceHomeBuyersInNeighborhoods`, e.g. `engine`
+
+        Raises:
+            ValueError: If no input file matches `inputs`, or if the options are rejected by
+                        `PlaceHomeBuyersInNeighborhoods`
+        """
+        self.output_dir = output_dir
+        self.workers = workers or os.cpu_count() or 1
+        self.options = options
+
+        pattern = os.path.join(inputs, '*.txt') if os.path.isdir(inputs) else inputs
+        matched = sorted(glob.glob(pattern))
+        outputs = {os.path.abspath(self.output_path(path)) for path in matched}
+        self.input_paths = [path for path in matched if os.path.abspath(path) not in outputs]
+        self.skipped = [path for path in matched if os.path.abspath(path) in outputs]
+        if not self.input_paths:
+            raise ValueError(f'No input file matches {inputs!r}')
+        # Rejects invalid options here rather than in every worker
+        PlaceHomeBuyersInNeighborhoods(self.input_paths[0], **options)
+
+    def output_path(self, input_path: str) -> str:
+        """
+        Returns the output path of an input file, e.g. 'region1_output.txt' for 'region1.txt', or
+        'region1_output.csv' with the 'csv' output format
+
+        Args:
+            input_path (str): The path of the input file
+
+        Returns:
+            str: The path of the output file
+        """
+        directory, name = os.path.split(input_path)
+        stem, extension = os.path.splitext(name)
+        extension = self.EXTENSIONS.get(self.options.get('output_format'), extension)
+        return os.path.join(self.output_dir or directory, f'{stem}_output{extension or ".txt"}')
+
+    def run(self) -> Iterator[BatchResult]:
+        """
+        Allocates every input file
+
+        Yields:
+            BatchResult: The result of each input file, in the order of `input_paths`
+        """
+        if self.output_dir:
+            os.makedirs(self.output_dir, exist_ok=True)
+
+        with ProcessPoolExecutor(max_workers=self.workers, max_tasks_per_child=1) as executor:
+            futures = [
+                executor.submit(_allocate_file, path, self.output_path(path), self.options)
+                for path in self.input_paths
+            ]
+            for future in futures:
+                yield future.result()
+
+    @staticmethod
+    def summary(results: List[BatchResult], skipped: List[str] = ()) -> str:
+        """
+        Formats the time spent on each input file and stage
+
+        Args:
+            results (List[BatchResult]): The results of `run`
+            skipped (List[str], optional): The files skipped as outputs, see `skipped`. Defaults to none
+
+        Returns:
+            str: A table with one line per input file and a total line, followed by the skipped files
+        """
+        stages = ('read', 'initialize', 'assign', 'write')
+        width = max([len(os.path.basename(result.input_path)) for result in results] + [5])
+        lines = [f'{"input":<{width}} ' + ' '.join(f'{stage:>10}' for stage in stages) + f' {"total":>10}']
+        for result in results:
+            timings = [result.timings[stage] for stage in stages]
+            lines.append(
+                f'{os.path.basename(result.input_path):<{width}} '
+                + ' '.join(f'{timing:>10.3f}' for timing in timings) + f' {sum(timings):>10.3f}'
+            )
+        totals = [sum(result.timings[stage] for result in results) for stage in stages]
+        lines.append(f'{"total":<{width}} ' + ' '.join(f'{total:>10.3f}' for total in totals) + f' {sum(totals):>10.3f}')
+        if skipped:
+            lines.append('skipped, outputs of other inputs: ' + ', '.join(map(os.path.basename, skipped)))
+        return '\n'.join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Allocates homebuyers for many input files in parallel')
+    parser.add_argument('inputs', help="A directory of '*.txt' input files or a glob pattern")
+    parser.add_argument('--output-dir', help='The directory of the output files (defaults to next to each input)')
+    parser.add_argument('--workers', type=int, help='The number of worker processes (defaults to the number of CPUs)')
+    parser.add_argument('--engine', choices=PlaceHomeBuyersInNeighborhoods.ENGINES, default='recursive')
+    parser.add_argument('--format', choices=OutputWriter.FORMATS, default='text', help='The format of the output files')
+    parser.add_argument(
+        '--attributes', type=AttributeSchema.parse, default=DEFAULT_SCHEMA,
+        help="The attributes of the entities as 'KEY=name' pairs, e.g. 'E=energy,W=water,R=resilience'",
+    )
+    args = parser.parse_args()
+
+    runner = BatchRunner(
+        args.inputs, output_dir=args.output_dir, workers=args.workers, engine=args.engine, output_format=args.format,
+        schema=args.attributes,
+    )
+    results = []
+    for result in runner.run():
+        print(f'{result.input_path} -> {result.output_path}', flush=True)
+        results.append(result)
+    print(BatchRunner.summary(results, runner.skipped))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+import os
+import struct
+import sys
+from array import array
+from typing import Dict, NamedTuple
+
+from algorithm.snapshot import Snapshot
+
+
+class CheckpointError(Exception):
+    """
+    Raised when a checkpoint is missing, corrupt, written by another version, by another engine or
+    for a different input file
+    """
+
+
+class CheckpointState(NamedTuple):
+    """
+    The content of a checkpoint
+
+    Attributes:
+        engine (str): The engine that wrote the checkpoint
+        progress (int): Where the engine resumes, the next pass of the 'recursive' engine or the next
+                        proposing homebuyer of the 'deferred_acceptance' engine
+        sections (dict): Maps the name of each saved array to a copy of it
+    """
+    engine: str
+    progress: int
+    sections: Dict[str, array]
+
+
+class Checkpoint:
+    """
+    Compact binary checkpoint of the state of a running allocation
+
+    The layout follows `Snapshot`: a header holding a magic number, the format version, the byte
+    order, the engine, the progress of the engine and the size and SHA-256 checksum of the input
+    file, then a table of sections, each the raw content of one array. Every write goes to a
+    temporary file that is synced and then renamed over the previous checkpoint, so a crash leaves
+    either the previous or the new checkpoint, never a partial one
+
+    Attributes:
+        file_path (str): The path of the checkpoint file
+    """
+    MAGIC = b'NBHCKPT\x00'
+    VERSION = 1
+    HEADER = struct.Struct('<8sHc24sxqQ32sI')
+    SECTION = struct.Struct('<24scxxxxxxxQQ')
+    ALIGNMENT = 8
+
+    def __init__(self, file_path: str) -> None:
+        """
+        Initialize the class setting default attributes
+        """
+        self.file_path = file_path
+        self._source = None
+
+    def _checksum(self, source_path: str) -> tuple:
+        """
+        Returns the size and digest of the input file, computed on the first call only so that
+        frequent checkpoints do not read the input again
+        """
+        if self._source is None:
+            self._source = Snapshot.checksum(source_path)
+        return self._source
+
+    def write(self, source_path: str, engine: str, progress: int, sections: Dict[str, array]) -> None:
+        """
+        Writes a checkpoint, replacing the previous one atomically
+
+        Args:
+            source_path (str): The path of the input file being allocated
+            engine (str): The engine whose state is saved
+            progress (int): Where the engine resumes
+            sections (Dict[str, array]): The arrays holding the state of the engine
+        """
+        size, digest = self._checksum(source_path)
+        buffers = [(name, memoryview(buffer)) for name, buffer in sections.items()]
+        offset = self.HEADER.size + self.SECTION.size * len(buffers)
+
+        table = []
+        for name, buffer in buffers:
+            offset += -offset % self.ALIGNMENT
+            table.append(self.SECTION.pack(name.encode(), buffer.format.encode(), offset, len(buffer)))
+            offset += buffer.nbytes
+
+        temp_path = f'{self.file_path}.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(self.HEADER.pack(
+                self.MAGIC, self.VERSION, sys.byteorder[0].encode(), engine.encode(), progress, size, digest, len(buffers),
+            ))
+            file.write(b''.join(table))
+            for name, buffer in buffers:
+                file.write(b'\x00' * (-file.tell() % self.ALIGNMENT))
+                file.write(buffer.cast('B'))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.file_path)
+
+    def load(self, source_path: str, engine: str) -> CheckpointState:
+        """
+        Reads a checkpoint back
+
+        Args:
+            source_path (str): The path of the input file the checkpoint must have been written for
+            engine (str): The engine the checkpoint must have been written by
+
+        Returns:
+            CheckpointState: The saved state, with writable copies of the arrays
+
+        Raises:
+            CheckpointError: If the checkpoint is missing, corrupt, written by another version of the
+                             format or by another engine, or for a different input file
+        """
+        try:
+            with open(self.file_path, 'rb') as file:
+                buffer = file.read()
+        except OSError as error:
+            raise CheckpointError(f'Cannot open checkpoint {self.file_path}: {error}') from error
+
+        try:
+            magic, version, byteorder, saved_engine, progress, size, digest, count = self.HEADER.unpack_from(buffer)
+        except struct.error as error:
+            raise CheckpointError(f'Corrupt checkpoint {self.file_path}') from error
+        if magic != self.MAGIC or version != self.VERSION or byteorder != sys.byteorder[0].encode():
+            raise CheckpointError(f'Checkpoint {self.file_path} was written by another version of the format')
+        saved_engine = saved_engine.rstrip(b'\x00').decode()
+        if saved_engine != engine:
+            raise CheckpointError(f'Checkpoint {self.file_path} was written by the {saved_engine!r} engine')
+        if os.path.getsize(source_path) != size or self._checksum(source_path) != (size, digest):
+            raise CheckpointError(f'Checkpoint {self.file_path} is stale, {source_path} has changed')
+
+        sections = {}
+        try:
+            for idx in range(count):
+                name, typecode, offset, length = self.SECTION.unpack_from(buffer, self.HEADER.size + idx * self.SECTION.size)
+                section = array(typecode.decode())
+                end = offset + length * section.itemsize
+                if end > len(buffer):
+                    raise ValueError('section out of bounds')
+                section.frombytes(buffer[offset:end])
+                sections[name.rstrip(b'\x00').decode()] = section
+        except (struct.error, TypeError, ValueError) as error:
+            raise CheckpointError(f'Corrupt checkpoint {self.file_path}') from error
+        return CheckpointState(saved_engine, progress, sections)
+
+    def remove(self) -> None:
+        """
+        Removes the checkpoint, if any
+        """
+        try:
+            os.remove(self.file_path)
+        except FileNotFoundError:
+            pass
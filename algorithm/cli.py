@@ -0,0 +1,194 @@
+"""
+Allocates the homebuyers of an input file to neighborhoods
+
+A directory or a glob pattern of input files is allocated by the batch runner, spread across
+`--workers` processes, while a single input file is parsed by `--workers` processes with the 'bulk'
+reader. Input files may be compressed with gzip, xz, bzip2 or Zstandard. The algorithm is only
+imported once the arguments are parsed, so `--help` and argument errors return immediately
+
+Usage:
+    python main.py data/input.txt --output data/output.txt --engine deferred_acceptance
+    python main.py data/regions/ --workers 4 --output-dir data/outputs/
+    python main.py data/input.txt --stats --profile data/profile.out
+"""
+import argparse
+import os
+import sys
+from collections.abc import Callable, Sequence
+
+# The choices of `PlaceHomeBuyersInNeighborhoods` and `OutputWriter`, repeated so that parsing the
+# arguments does not import the algorithm
+ENGINES = ('recursive', 'deferred_acceptance')
+SCORINGS = ('python', 'vectorized')
+STORAGES = ('objects', 'columnar')
+READERS = ('lines', 'bulk')
+FORMATS = ('text', 'csv', 'jsonl')
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Returns:
+        argparse.ArgumentParser: The parser of the command-line arguments
+    """
+    parser = argparse.ArgumentParser(prog='main.py', description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        'input', nargs='?', default='data/input.txt',
+        help="The input file, possibly compressed, or a directory or glob pattern of input files (default: data/input.txt)",
+    )
+    parser.add_argument('-o', '--output', default='data/output.txt', help='The output file, gzip-compressed when it ends with .gz (default: data/output.txt)')
+    parser.add_argument('--engine', choices=ENGINES, default='recursive')
+    parser.add_argument('--scoring', choices=SCORINGS, default='python', help="'vectorized' requires NumPy")
+    parser.add_argument('--storage', choices=STORAGES, default='objects')
+    parser.add_argument('--reader', choices=READERS, default='lines', help="'bulk' requires the 'columnar' storage")
+    parser.add_argument('--format', choices=FORMATS, default='text', help='The format of the output')
+    parser.add_argument(
+        '--attributes', help="The attributes of the entities as 'KEY=name' pairs (default: 'E=energy,W=water,R=resilience')",
+    )
+    parser.add_argument('--snapshot', help="A binary snapshot of the parsed input, requires the 'columnar' storage")
+    parser.add_argument('--checkpoint', help='Periodically save the assignment there')
+    parser.add_argument('--resume', action='store_true', help='Continue from the last checkpoint of an interrupted run')
+    parser.add_argument('--previous-output', help='Only write the changes against this output of a previous run')
+    parser.add_argument(
+        '--workers', type=int,
+        help=(
+            "The worker processes of a directory or glob pattern of inputs (default: the number of CPUs), "
+            "or the processes parsing a single input with the 'bulk' reader (default: 1)"
+        ),
+    )
+    parser.add_argument('--output-dir', help='The directory of the outputs of a batch (default: next to each input)')
+    parser.add_argument('--stats', action='store_true', help='Print the time of each stage and the work of the assignment')
+    parser.add_argument(
+        '--trace-memory', action='store_true',
+        help='With --stats, also measure the peak memory of each stage with tracemalloc, which slows the run down',
+    )
+    parser.add_argument(
+        '--profile', nargs='?', const='', metavar='PATH',
+        help='Profile the run with cProfile, print the costliest functions and dump the raw stats to PATH if given',
+    )
+    parser.add_argument('--profile-limit', type=int, default=25, help='The functions printed by --profile (default: 25)')
+    return parser
+
+
+def is_batch(input_path: str) -> bool:
+    """
+    Returns:
+        bool: True if the input is a directory or a glob pattern rather than a single file
+    """
+    return os.path.isdir(input_path) or (not os.path.exists(input_path) and any(char in input_path for char in '*?['))
+
+
+def prepare_batch(args: argparse.Namespace, options: dict) -> Callable[[], None]:
+    """
+    Prepares the allocation of every input file of a directory or glob pattern with the `BatchRunner`
+
+    Returns:
+        Callable[[], None]: Runs the batch
+
+    Raises:
+        ValueError: If no input file matches or the options are invalid
+    """
+    from algorithm.batch import BatchRunner
+
+    runner = BatchRunner(args.input, output_dir=args.output_dir, workers=args.workers, **options)
+
+    def run() -> None:
+        results = []
+        for result in runner.run():
+            print(f'{result.input_path} -> {result.output_path}', flush=True)
+            results.append(result)
+        print(BatchRunner.summary(results))
+
+    return run
+
+
+def prepare_single(args: argparse.Namespace, options: dict) -> Callable[[], None]:
+    """
+    Prepares the allocation of one input file in this process
+
+    Returns:
+        Callable[[], None]: Runs the allocation
+
+    Raises:
+        ValueError: If the options are invalid
+    """
+    from algorithm.place_homebuyers_in_neighborhood import PlaceHomeBuyersInNeighborhoods
+    from algorithm.stats import ExecutionStats
+
+    allocator = PlaceHomeBuyersInNeighborhoods(
+        args.input,
+        output_path=args.output,
+        snapshot_path=args.snapshot,
+        checkpoint_path=args.checkpoint,
+        previous_output=args.previous_output,
+        workers=args.workers or 1,
+        stats=ExecutionStats(trace_memory=args.trace_memory) if args.stats else None,
+        **options,
+    )
+
+    def run() -> None:
+        stats = allocator.resume() if args.resume else allocator.execute()
+        if stats is not None:
+            print(stats, file=sys.stderr)
+
+    return run
+
+
+def main(argv: Sequence[str] = None) -> int:
+    """
+    Runs the command line. Invalid arguments and options exit with a usage error, and a malformed or
+    missing input file with status 1. Any other error propagates with its traceback
+
+    Args:
+        argv (Sequence[str], optional): The arguments. Defaults to None (`sys.argv[1:]`)
+
+    Returns:
+        int: The exit status
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    batch = is_batch(args.input)
+    if batch and (args.snapshot or args.checkpoint or args.resume or args.previous_output or args.stats):
+        parser.error('--snapshot, --checkpoint, --resume, --previous-output and --stats apply to a single input')
+    if args.trace_memory and not args.stats:
+        parser.error('--trace-memory requires --stats')
+    if args.workers is not None and args.workers < 1:
+        parser.error('--workers must be at least 1')
+
+    options = dict(engine=args.engine, scoring=args.scoring, storage=args.storage, reader=args.reader, output_format=args.format)
+    if args.attributes is not None:
+        from entities.attributes import AttributeSchema
+        try:
+            options['schema'] = AttributeSchema.parse(args.attributes)
+        except ValueError as error:
+            parser.error(f'--attributes: {error}')
+
+    try:
+        run = (prepare_batch if batch else prepare_single)(args, options)
+    except ValueError as error:
+        parser.error(str(error))
+
+    from entities.reader import InputFormatError
+
+    profiler = None
+    if args.profile is not None:
+        import cProfile
+        profiler = cProfile.Profile()
+    try:
+        if profiler is None:
+            run()
+        else:
+            profiler.runcall(run)
+    except (InputFormatError, FileNotFoundError) as error:
+        print(f'{parser.prog}: error: {error}', file=sys.stderr)
+        return 1
+    finally:
+        if profiler is not None:
+            import pstats
+            if args.profile:
+                profiler.dump_stats(args.profile)
+            pstats.Stats(profiler, stream=sys.stderr).sort_stats('cumulative').print_stats(args.profile_limit)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,392 @@
+from heapq import heapify, heappop, heappush, heapreplace
+from typing import Callable, Dict, List, Sequence, Set
+
+
+class DeferredAcceptance:
+    """
+    Queue-driven, buyer-proposing deferred acceptance engine
+
+    Free buyers are kept in a queue and propose to the neighborhoods in their preference list, in
+    order. Each neighborhood holds a bounded min-heap of the buyers it has tentatively accepted,
+    keyed on the buyer's score for that neighborhood, so a new proposal is either held, rejected or
+    displaces the weakest held buyer in O(log(limit)). The engine never recurses and runs in
+    O(H * N * log(limit)) time in the worst case
+
+    Buyers are referred to by their position (0..H-1) and neighborhoods by their index (0..N-1).
+    Ties on score are broken in favour of the buyer with the lowest tie breaker (the entity ID). Every
+    preference must be the index of a neighborhood: `PlaceHomeBuyersInNeighborhoods` rejects the
+    homebuyers ranking an unknown neighborhood before either engine runs, see
+    `HomeBuyer.check_priority_ids`
+
+    Once `run` has completed, the allocation can be repaired after a buyer is added or removed, a
+    neighborhood is rescored or a capacity changes, by re-running only the chains of proposals and
+    vacancies affected by the change. The result is the same as running the engine from scratch on
+    the modified instance (the buyer-optimal stable allocation). The neighborhoods and buyers
+    affected by the last repair are recorded in `changed_neighborhoods` and `changed_buyers`
+
+    Attributes:
+        preferences (list): For each buyer, the sequence of neighborhood indices in order of preference
+        scores (list): For each buyer, a mapping from neighborhood index to the buyer's score
+        tie_breakers (list): For each buyer, the value used to break ties on score
+        capacities (list): For each neighborhood, the maximum number of buyers it can hold
+        next_choice (list): For each buyer, the position in its preference list of the next proposal
+        assigned (list): For each buyer, the neighborhood holding it, or -1
+        held (list): For each neighborhood, the min-heap of (score, -tie_breaker, buyer) entries it holds
+        removed (set): The positions of the buyers removed with `remove_buyer`
+        changed_neighborhoods (set): The neighborhoods whose held buyers changed during the last repair
+        changed_buyers (set): The buyers whose neighborhood changed during the last repair
+        displacements (int): The number of held buyers displaced by a better proposal so far
+    """
+    def __init__(
+        self,
+        preferences: Sequence[Sequence[int]],
+        scores: Sequence,
+        tie_breakers: Sequence[int],
+        capacities: Sequence[int],
+    ) -> None:
+        """
+        Initializes the engine with the preferences, scores and capacities of the instance
+
+        Args:
+            preferences (Sequence[Sequence[int]]): For each buyer, the neighborhood indices in order
+                                                   of preference
+            scores (Sequence): For each buyer, a mapping from neighborhood index to score
+            tie_breakers (Sequence[int]): For each buyer, the value used to break ties on score
+            capacities (Sequence[int]): For each neighborhood, the maximum number of buyers it can hold
+        """
+        self.preferences = preferences
+        self.scores = scores
+        self.tie_breakers = tie_breakers
+        self.capacities = list(capacities)
+        self.next_choice = [0] * len(preferences)
+        self.assigned = [-1] * len(preferences)
+        self.held = [[] for _ in range(len(self.capacities))]
+        self.removed = set()
+        self.changed_neighborhoods = set()
+        self.changed_buyers = set()
+        self.displacements = 0
+        self._proposals = None
+
+    def _entry(self, buyer: int, neighborhood: int) -> tuple:
+        """
+        Returns the heap entry of a buyer for a neighborhood, ordered by score then tie breaker
+        """
+        return (self.scores[buyer][neighborhood], -self.tie_breakers[buyer], buyer)
+
+    def _propose(self, buyer: int) -> None:
+        """
+        Lets a buyer propose down its preference list until it is held or runs out of choices
+
+        A buyer displaced by the proposal keeps proposing in the same loop, so a whole chain of
+        displacements is resolved without recursion
+
+        Args:
+            buyer (int): The position of the buyer that proposes
+        """
+        proposals = self._proposals
+        while buyer is not None:
+            preferences = self.preferences[buyer]
+            choice = self.next_choice[buyer]
+            proposer = buyer
+            buyer = None
+            self.assigned[proposer] = -1
+
+            while choice < len(preferences):
+                neighborhood = preferences[choice]
+                if proposals is not None:
+                    proposals[neighborhood].append((proposer, choice))
+                choice += 1
+                heap = self.held[neighborhood]
+                entry = (self.scores[proposer][neighborhood], -self.tie_breakers[proposer], proposer)
+
+                if len(heap) < self.capacities[neighborhood]:
+                    heappush(heap, entry)
+                elif heap and entry > heap[0]:
+                    buyer = heapreplace(heap, entry)[2]
+                    self.assigned[buyer] = -1
+                    self.displacements += 1
+                else:
+                    continue
+
+                self.assigned[proposer] = neighborhood
+                if proposals is not None:
+                    self.changed_neighborhoods.add(neighborhood)
+                break
+
+            self.next_choice[proposer] = choice
+            if proposals is not None:
+                self.changed_buyers.add(proposer)
+
+    def run(self, start: int = 0, checkpoint: Callable[[int], None] = None, every: int = 4096) -> List[List[int]]:
+        """
+        Runs the engine until every buyer is held or has exhausted its preference list
+
+        The buyers propose in order, and each one's chain of displacements is resolved before the
+        next buyer proposes, so the whole state of the run between two buyers is `next_choice`,
+        `assigned` and the position of the next buyer
+
+        Args:
+            start (int, optional): The position of the first buyer to propose, when resuming a run
+                                   restored with `restore`. Defaults to 0
+            checkpoint (Callable[[int], None], optional): Called every `every` buyers with the
+                                                          position of the next buyer, e.g. to save
+                                                          the state. Defaults to None
+            every (int, optional): The number of buyers between two calls of `checkpoint`.
+                                   Defaults to 4096
+
+        Returns:
+            List[List[int]]: For each neighborhood, the held buyers sorted by score in descending order
+        """
+        for buyer in range(start, len(self.preferences)):
+            if checkpoint is not None and buyer != start and (buyer - start) % every == 0:
+                checkpoint(buyer)
+            self._propose(buyer)
+        return self.allocation()
+
+    def restore(self, next_choice: Sequence[int], assigned: Sequence[int], displacements: int = 0) -> None:
+        """
+        Restores the state saved between two buyers of a run, the held heaps are rebuilt from the
+        neighborhood of each buyer
+
+        Args:
+            next_choice (Sequence[int]): For each buyer, the position of its next proposal
+            assigned (Sequence[int]): For each buyer, the neighborhood holding it, or -1
+            displacements (int, optional): The displacements counted so far. Defaults to 0
+        """
+        self.next_choice = list(next_choice)
+        self.assigned = list(assigned)
+        self.displacements = displacements
+        self.held = [[] for _ in range(len(self.capacities))]
+        for buyer, neighborhood in enumerate(self.assigned):
+            if neighborhood != -1:
+                self.held[neighborhood].append(self._entry(buyer, neighborhood))
+        for heap in self.held:
+            heapify(heap)
+
+    def allocation(self) -> List[List[int]]:
+        """
+        Returns the current allocation of the engine
+
+        Returns:
+            List[List[int]]: For each neighborhood, the held buyers sorted by score in descending order
+        """
+        return [self.held_by(neighborhood) for neighborhood in range(len(self.held))]
+
+    def held_by(self, neighborhood: int) -> List[int]:
+        """
+        Returns the buyers held by a neighborhood
+
+        Args:
+            neighborhood (int): The index of the neighborhood
+
+        Returns:
+            List[int]: The held buyers sorted by score in descending order
+        """
+        return [entry[2] for entry in sorted(self.held[neighborhood], reverse=True)]
+
+    def _start_repair(self) -> None:
+        """
+        Resets the change tracking and builds, on the first repair, the index of the proposals
+        received by each neighborhood, used to find the buyers it rejected
+        """
+        self.changed_neighborhoods = set()
+        self.changed_buyers = set()
+        if self._proposals is None:
+            self._proposals = [[] for _ in range(len(self.held))]
+            for buyer, preferences in enumerate(self.preferences):
+                for choice in range(self.next_choice[buyer]):
+                    self._proposals[preferences[choice]].append((buyer, choice))
+
+    def _release(self, buyer: int) -> None:
+        """
+        Removes a buyer from the heap of the neighborhood holding it
+
+        Args:
+            buyer (int): The position of the buyer
+        """
+        neighborhood = self.assigned[buyer]
+        heap = self.held[neighborhood]
+        position = next(idx for idx, entry in enumerate(heap) if entry[2] == buyer)
+        heap[position] = heap[-1]
+        heap.pop()
+        heapify(heap)
+        self.assigned[buyer] = -1
+        self.changed_neighborhoods.add(neighborhood)
+        self.changed_buyers.add(buyer)
+
+    def _rejected_by(self, neighborhood: int) -> Dict[int, int]:
+        """
+        Returns the buyers rejected by a neighborhood, who all prefer it to their current neighborhood
+
+        Args:
+            neighborhood (int): The index of the neighborhood
+
+        Returns:
+            Dict[int, int]: Maps the positions of the rejected buyers to the position of the 
+            neighborhood in their preference list
+        """
+        proposals = self._proposals[neighborhood]
+        rejected = {
+            buyer: choice for buyer, choice in proposals
+            if buyer not in self.removed
+            and choice < self.next_choice[buyer]
+            and self.preferences[buyer][choice] == neighborhood
+            and self.assigned[buyer] != neighborhood
+        }
+        self._proposals[neighborhood] = [
+            (buyer, choice) for buyer, choice in proposals
+            if buyer in rejected or self.assigned[buyer] == neighborhood
+        ]
+        return rejected
+
+    def _affected_by(self, neighborhoods: Set[int]) -> Set[int]:
+        """
+        Returns the neighborhoods whose held buyers may change when places free up in the given ones
+
+        A neighborhood with a free place may take back one of the buyers it rejected, which withdraws
+        every proposal that buyer made further down its list, including the displacements those
+        proposals caused. The result is the closure of `neighborhoods` over these proposals
+
+        Args:
+            neighborhoods (Set[int]): The neighborhoods with free places
+
+        Returns:
+            Set[int]: The neighborhoods that may be affected, including the given ones
+        """
+        affected, pending = set(neighborhoods), list(neighborhoods)
+        while pending:
+            for buyer, choice in self._rejected_by(pending.pop()).items():
+                preferences = self.preferences[buyer]
+                for later in range(choice + 1, self.next_choice[buyer]):
+                    neighborhood = preferences[later]
+                    if neighborhood not in affected:
+                        affected.add(neighborhood)
+                        pending.append(neighborhood)
+        return affected
+
+    def _fill_vacancies(self, neighborhoods: Set[int]) -> None:
+        """
+        Repairs the allocation after places free up in some neighborhoods
+
+        Every neighborhood that may be affected is emptied, and its buyers, along with the buyers it
+        had rejected, propose again from the first affected neighborhood in their preference list.
+        The other neighborhoods keep their buyers, so only the affected chains are re-run
+
+        Args:
+            neighborhoods (Set[int]): The neighborhoods with free places
+        """
+        affected = self._affected_by(neighborhoods)
+        restart = {}
+        for neighborhood in affected:
+            for buyer, choice in self._rejected_by(neighborhood).items():
+                restart[buyer] = min(choice, restart.get(buyer, choice))
+            for _, _, buyer in self.held[neighborhood]:
+                choice = self.next_choice[buyer] - 1
+                restart[buyer] = min(choice, restart.get(buyer, choice))
+                self.assigned[buyer] = -1
+            self.held[neighborhood] = []
+            self.changed_neighborhoods.add(neighborhood)
+
+        for buyer, choice in sorted(restart.items()):
+            self.next_choice[buyer] = choice
+            self._propose(buyer)
+
+    def _reject_surplus(self, neighborhood: int) -> None:
+        """
+        Rejects the weakest buyers of a neighborhood above its capacity, who propose further down
+
+        Args:
+            neighborhood (int): The index of the neighborhood
+        """
+        heap = self.held[neighborhood]
+        while len(heap) > self.capacities[neighborhood]:
+            buyer = heappop(heap)[2]
+            self.assigned[buyer] = -1
+            self.changed_neighborhoods.add(neighborhood)
+            self._propose(buyer)
+
+    def add_buyer(self, preferences: Sequence[int], scores, tie_breaker: int) -> int:
+        """
+        Adds a buyer and lets it propose
+
+        Args:
+            preferences (Sequence[int]): The buyer's neighborhood indices in order of preference
+            scores: A mapping from neighborhood index to the buyer's score
+            tie_breaker (int): The value used to break ties on score
+
+        Returns:
+            int: The position of the new buyer
+        """
+        self._start_repair()
+        buyer = len(self.preferences)
+        self.preferences.append(preferences)
+        self.scores.append(scores)
+        self.tie_breakers.append(tie_breaker)
+        self.next_choice.append(0)
+        self.assigned.append(-1)
+        self._propose(buyer)
+        return buyer
+
+    def remove_buyer(self, buyer: int) -> None:
+        """
+        Removes a buyer and repairs every neighborhood it proposed to
+
+        Even a buyer that ended up rejected everywhere may have displaced other buyers on its way
+        down, and those displacements can be undone once it is gone
+
+        Args:
+            buyer (int): The position of the buyer
+        """
+        self._start_repair()
+        self.removed.add(buyer)
+        proposed_to = set(self.preferences[buyer][:self.next_choice[buyer]])
+        if self.assigned[buyer] != -1:
+            self._release(buyer)
+        self.next_choice[buyer] = len(self.preferences[buyer])
+        self.changed_buyers.add(buyer)
+        if proposed_to:
+            self._fill_vacancies(proposed_to)
+
+    def set_capacities(self, capacities: Sequence[int]) -> None:
+        """
+        Changes the capacities of the neighborhoods, filling new places or rejecting surplus buyers
+
+        Args:
+            capacities (Sequence[int]): For each neighborhood, the maximum number of buyers it can hold
+        """
+        self._start_repair()
+        increased = set()
+        for neighborhood, capacity in enumerate(capacities):
+            previous, self.capacities[neighborhood] = self.capacities[neighborhood], capacity
+            if capacity > previous:
+                increased.add(neighborhood)
+            elif capacity < previous:
+                self._reject_surplus(neighborhood)
+        if increased:
+            self._fill_vacancies(increased)
+
+    def update_neighborhood(self, neighborhood: int, rescore: Callable[[], None]) -> None:
+        """
+        Repairs the allocation after the scores of the buyers for a neighborhood change
+
+        The neighborhood first rejects all its buyers, which propose further down, then `rescore`
+        updates the scores and the neighborhood is filled again with the best buyers that want it
+
+        Args:
+            neighborhood (int): The index of the neighborhood
+            rescore (Callable[[], None]): Updates `scores` for the neighborhood
+        """
+        self._start_repair()
+        capacity = self.capacities[neighborhood]
+        self.capacities[neighborhood] = 0
+        self._reject_surplus(neighborhood)
+        rescore()
+        self.capacities[neighborhood] = capacity
+        self._fill_vacancies({neighborhood})
+
+    def assigned_buyers(self) -> Set[int]:
+        """
+        Returns:
+            Set[int]: The positions of the buyers currently held by a neighborhood
+        """
+        return {entry[2] for heap in self.held for entry in heap}
@@ -0,0 +1,337 @@
+"""
+Applies change logs written by `write_output_file(previous_output=...)` to a full output
+
+Usage:
+    python -m algorithm.delta data/output.txt data/delta-1.txt data/delta-2.txt
+"""
+import argparse
+import csv
+import json
+import os
+from typing import IO, Iterable, Iterator, List, NamedTuple, Sequence, Tuple, Union
+
+from algorithm.writer import Allocation, OutputReader, OutputWriter
+from entities import HomeBuyer, Neighborhood
+
+
+class NeighborhoodDelta(NamedTuple):
+    """
+    The changes of one neighborhood between two allocations
+
+    Attributes:
+        neighborhood (int): The ID of the neighborhood
+        added (list): The (ID, score) of the homebuyers it gained, best first
+        removed (list): The IDs of the homebuyers it lost
+        rescored (list): The (ID, new score) of the homebuyers it kept with another score
+        dropped (bool): Whether the neighborhood is no longer in the allocation, with all its
+                        homebuyers, which are then not listed in `removed`
+    """
+    neighborhood: int
+    added: List[Tuple[int, int]]
+    removed: List[int]
+    rescored: List[Tuple[int, int]]
+    dropped: bool = False
+
+
+def _ascending(allocation: Iterable, name: str) -> Iterator:
+    """
+    Checks lazily that the neighborhoods come in ascending ID order, as the merges require
+    """
+    last = None
+    for item in allocation:
+        if last is not None and item[0] <= last:
+            raise ValueError(f'The {name} is not in ascending neighborhood order: {Neighborhood.prefix}{item[0]} after {Neighborhood.prefix}{last}')
+        last = item[0]
+        yield item
+
+
+def diff_allocations(previous: Allocation, current: Allocation) -> Iterator[NeighborhoodDelta]:
+    """
+    Compares two allocations with a merge on the neighborhood IDs, so that only one neighborhood of
+    each side is held in memory at a time
+
+    Args:
+        previous (Allocation): The previous allocation, e.g. from `OutputReader.read`
+        current (Allocation): The current allocation, e.g. from `allocation()` of an allocator
+
+    Yields:
+        NeighborhoodDelta: The changes of each neighborhood that differs, in ascending ID order. A
+        neighborhood only in the current allocation is added, even when empty
+
+    Raises:
+        ValueError: If an allocation is not in ascending neighborhood order
+    """
+    end = (float('inf'), None)
+    previous = _ascending(previous, 'previous allocation')
+    current = _ascending(current, 'current allocation')
+    old = next(previous, end)
+    new = next(current, end)
+    while old is not end or new is not end:
+        if old[0] < new[0]:
+            yield NeighborhoodDelta(old[0], [], [], [], dropped=True)
+            old = next(previous, end)
+        elif new[0] < old[0]:
+            yield NeighborhoodDelta(new[0], list(new[1]), [], [])
+            new = next(current, end)
+        else:
+            scores = dict(old[1])
+            added, rescored = [], []
+            for hb, score in new[1]:
+                if hb not in scores:
+                    added.append((hb, score))
+                elif scores.pop(hb) != score:
+                    rescored.append((hb, score))
+            if added or scores or rescored:
+                yield NeighborhoodDelta(new[0], added, list(scores), rescored)
+            old = next(previous, end)
+            new = next(current, end)
+
+
+def apply_delta(allocation: Allocation, deltas: Iterable[NeighborhoodDelta]) -> Iterator[Tuple[int, List[Tuple[int, int]]]]:
+    """
+    Applies a change log to an allocation with a merge on the neighborhood IDs. The homebuyers of a
+    changed neighborhood are sorted again by score, ties broken by lowest ID as in the engines
+
+    Args:
+        allocation (Allocation): The allocation the change log was computed against
+        deltas (Iterable[NeighborhoodDelta]): The change log, e.g. from `DeltaReader.read`
+
+    Yields:
+        Tuple[int, List[Tuple[int, int]]]: The ID of each neighborhood and the (ID, score) of its
+        homebuyers, best first
+
+    Raises:
+        ValueError: If either side is not in ascending neighborhood order, or the change log does
+                    not apply to the allocation
+    """
+    end = (float('inf'), None)
+    allocation = _ascending(allocation, 'allocation')
+    deltas = _ascending(deltas, 'change log')
+    base = next(allocation, end)
+    delta = next(deltas, end)
+    while base is not end or delta is not end:
+        if base[0] < delta[0]:
+            yield base
+            base = next(allocation, end)
+            continue
+
+        neighb = delta.neighborhood
+        if base[0] == neighb:
+            homebuyers = dict(base[1])
+            base = next(allocation, end)
+        elif delta.dropped or delta.removed or delta.rescored:
+            raise ValueError(f'The change log does not apply: {Neighborhood.prefix}{neighb} is not in the allocation')
+        else:
+            homebuyers = {}
+
+        for hb in delta.removed:
+            if homebuyers.pop(hb, None) is None:
+                raise ValueError(f'The change log does not apply: {HomeBuyer.prefix}{hb} is not in {Neighborhood.prefix}{neighb}')
+        for hb, score in delta.rescored:
+            if hb not in homebuyers:
+                raise ValueError(f'The change log does not apply: {HomeBuyer.prefix}{hb} is not in {Neighborhood.prefix}{neighb}')
+            homebuyers[hb] = score
+        for hb, score in delta.added:
+            if hb in homebuyers:
+                raise ValueError(f'The change log does not apply: {HomeBuyer.prefix}{hb} is already in {Neighborhood.prefix}{neighb}')
+            homebuyers[hb] = score
+        if not delta.dropped:
+            yield neighb, sorted(homebuyers.items(), key=lambda item: (-item[1], item[0]))
+        delta = next(deltas, end)
+
+
+class DeltaWriter(OutputWriter):
+    """
+    Streams a change log to a file, one changed neighborhood at a time. The formats follow the
+    `OutputWriter` ones:
+        'text': one 'N{id}: +H{id}({score}) -H{id} ~H{id}({score})' line per neighborhood, for the
+                added, removed and rescored homebuyers, or 'N{id}: dropped'
+        'csv': a 'neighborhood,homebuyer,change,score' header then one row per change, the change
+               being 'added', 'removed', 'rescored', 'created' (a new empty neighborhood) or
+               'dropped'
+        'jsonl': one JSON object per neighborhood, e.g. {"neighborhood": "N0", "added":
+                 [{"homebuyer": "H5", "score": 161}], "removed": ["H7"], "rescored": []}
+    """
+    def write(self, deltas: Iterable[NeighborhoodDelta]) -> int:
+        """
+        Writes a change log
+
+        Args:
+            deltas (Iterable[NeighborhoodDelta]): The changes of each neighborhood, in order
+
+        Returns:
+            int: The number of neighborhoods written
+        """
+        write_delta = getattr(self, f'_write_{self.format}')
+        count = 0
+        with self._open() as file:
+            if self.format == 'csv':
+                file = csv.writer(file)
+                file.writerow(('neighborhood', 'homebuyer', 'change', 'score'))
+            for delta in deltas:
+                write_delta(file, delta)
+                count += 1
+        return count
+
+    @staticmethod
+    def _write_text(file: IO[str], delta: NeighborhoodDelta) -> None:
+        if delta.dropped:
+            changes = 'dropped'
+        else:
+            changes = ' '.join([
+                *(f'+{HomeBuyer.prefix}{hb}({score})' for hb, score in delta.added),
+                *(f'-{HomeBuyer.prefix}{hb}' for hb in delta.removed),
+                *(f'~{HomeBuyer.prefix}{hb}({score})' for hb, score in delta.rescored),
+            ])
+        file.write(f'{Neighborhood.prefix}{delta.neighborhood}: {changes}\n')
+
+    @staticmethod
+    def _write_csv(writer, delta: NeighborhoodDelta) -> None:
+        neighb = f'{Neighborhood.prefix}{delta.neighborhood}'
+        if delta.dropped:
+            writer.writerow((neighb, '', 'dropped', ''))
+        elif not (delta.added or delta.removed or delta.rescored):
+            writer.writerow((neighb, '', 'created', ''))
+        writer.writerows((neighb, f'{HomeBuyer.prefix}{hb}', 'added', score) for hb, score in delta.added)
+        writer.writerows((neighb, f'{HomeBuyer.prefix}{hb}', 'removed', '') for hb in delta.removed)
+        writer.writerows((neighb, f'{HomeBuyer.prefix}{hb}', 'rescored', score) for hb, score in delta.rescored)
+
+    @staticmethod
+    def _write_jsonl(file: IO[str], delta: NeighborhoodDelta) -> None:
+        record = {'neighborhood': f'{Neighborhood.prefix}{delta.neighborhood}'}
+        if delta.dropped:
+            record['dropped'] = True
+        else:
+            record['added'] = [{'homebuyer': f'{HomeBuyer.prefix}{hb}', 'score': score} for hb, score in delta.added]
+            record['removed'] = [f'{HomeBuyer.prefix}{hb}' for hb in delta.removed]
+            record['rescored'] = [{'homebuyer': f'{HomeBuyer.prefix}{hb}', 'score': score} for hb, score in delta.rescored]
+        file.write(json.dumps(record) + '\n')
+
+
+class DeltaReader(OutputReader):
+    """
+    Streams a change log written by `DeltaWriter`, `read` yielding one `NeighborhoodDelta` per
+    neighborhood, in the order of the file
+    """
+
+    @staticmethod
+    def _read_text(file: IO[str]) -> Iterator[NeighborhoodDelta]:
+        for line in file:
+            if line.strip():
+                neighb, _, changes = line.partition(':')
+                neighb = int(neighb.strip().lstrip(Neighborhood.prefix))
+                if changes.strip() == 'dropped':
+                    yield NeighborhoodDelta(neighb, [], [], [], dropped=True)
+                    continue
+                delta = NeighborhoodDelta(neighb, [], [], [])
+                for change in changes.split():
+                    hb, _, score = change[1:].lstrip(HomeBuyer.prefix).partition('(')
+                    if change[0] == '+':
+                        delta.added.append((int(hb), int(score.rstrip(')'))))
+                    elif change[0] == '-':
+                        delta.removed.append(int(hb))
+                    elif change[0] == '~':
+                        delta.rescored.append((int(hb), int(score.rstrip(')'))))
+                    else:
+                        raise ValueError(f'Invalid change {change!r} for {Neighborhood.prefix}{neighb}')
+                yield delta
+
+    @staticmethod
+    def _read_csv(file: IO[str]) -> Iterator[NeighborhoodDelta]:
+        delta = None
+        for row in csv.DictReader(file):
+            neighb = int(row['neighborhood'].lstrip(Neighborhood.prefix))
+            if delta is None or neighb != delta.neighborhood:
+                if delta is not None:
+                    yield delta
+                delta = NeighborhoodDelta(neighb, [], [], [], dropped=row['change'] == 'dropped')
+            change = row['change']
+            if change in ('added', 'removed', 'rescored'):
+                hb = int(row['homebuyer'].lstrip(HomeBuyer.prefix))
+                if change == 'removed':
+                    delta.removed.append(hb)
+                else:
+                    getattr(delta, change).append((hb, int(row['score'])))
+            elif change not in ('created', 'dropped'):
+                raise ValueError(f'Invalid change {change!r} for {Neighborhood.prefix}{neighb}')
+        if delta is not None:
+            yield delta
+
+    @staticmethod
+    def _read_jsonl(file: IO[str]) -> Iterator[NeighborhoodDelta]:
+        for line in file:
+            if line.strip():
+                record = json.loads(line)
+                yield NeighborhoodDelta(
+                    int(record['neighborhood'].lstrip(Neighborhood.prefix)),
+                    [(int(hb['homebuyer'].lstrip(HomeBuyer.prefix)), hb['score']) for hb in record.get('added', [])],
+                    [int(hb.lstrip(HomeBuyer.prefix)) for hb in record.get('removed', [])],
+                    [(int(hb['homebuyer'].lstrip(HomeBuyer.prefix)), hb['score']) for hb in record.get('rescored', [])],
+                    dropped=record.get('dropped', False),
+                )
+
+
+def compact_output(
+    base: Union[str, IO[str]],
+    deltas: Sequence[Union[str, IO[str]]],
+    destination: Union[str, IO] = None,
+    format: str = None,
+) -> int:
+    """
+    Rebuilds a full output from the output of a previous run and the change logs written since, in
+    order. Every file is streamed, so only one neighborhood of each is held in memory at a time.
+    When the destination is a path, the output is written to a temporary file then renamed over
+    it, so the base output itself can be replaced
+
+    Args:
+        base (Union[str, IO[str]]): The full output the first change log was computed against
+        deltas (Sequence[Union[str, IO[str]]]): The change logs, oldest first, their format guessed
+                                                from their extension
+        destination (Union[str, IO], optional): Where the full output is written. Defaults to None
+                                                (the base output, which must then be a path)
+        format (str, optional): The format of the base output and of the rebuilt one. Defaults to
+                                None (guessed from the extension of the base output)
+
+    Returns:
+        int: The number of neighborhoods written
+
+    Raises:
+        ValueError: If no destination is given for a base output that is a file object, or a
+                    change log does not apply
+    """
+    if destination is None:
+        if not isinstance(base, str):
+            raise ValueError('A destination is required when the base output is a file object')
+        destination = base
+    reader = OutputReader(base, format)
+    allocation = reader.read()
+    for delta in deltas:
+        allocation = apply_delta(allocation, DeltaReader(delta).read())
+
+    if not isinstance(destination, str):
+        return OutputWriter(destination, reader.format).write(allocation)
+    temp_path = f'{destination}.tmp'
+    try:
+        count = OutputWriter(temp_path, reader.format, compress=destination.endswith('.gz')).write(allocation)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    os.replace(temp_path, destination)
+    return count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('base', help='The full output the first change log was computed against')
+    parser.add_argument('deltas', nargs='+', help='The change logs, oldest first')
+    parser.add_argument('--output', help='The rebuilt output, defaults to replacing the base output')
+    parser.add_argument('--format', choices=OutputWriter.FORMATS, help='Defaults to the extension of the base output')
+    args = parser.parse_args()
+
+    count = compact_output(args.base, args.deltas, args.output, args.format)
+    print(f'{count} neighborhoods written to {args.output or args.base}')
+
+
+if __name__ == '__main__':
+    main()
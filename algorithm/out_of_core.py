@@ -0,0 +1,400 @@
+import heapq
+import mmap
+import os
+import struct
+import tempfile
+from operator import mul
+from typing import IO, Iterator, List, Tuple, Union
+
+from algorithm.stats import ExecutionStats
+from algorithm.writer import OutputWriter
+from entities.attributes import DEFAULT_SCHEMA, AttributeSchema
+from entities.reader import BulkReader
+
+
+class OutOfCoreAllocator:
+    """
+    Disk-backed allocation for inputs whose homebuyers do not fit in memory
+
+    Only the neighborhoods are kept in memory. The input file is streamed in blocks and every
+    homebuyer is written to a temporary file as a fixed-size record (its ID, its number of
+    preferences and its attribute vector) followed by its preferences. The
+    allocation then runs buyer-proposing deferred acceptance in rounds: the free homebuyers propose
+    to their next choice, the proposals are sorted by (neighborhood, score, ID) in runs of at most
+    `run_length` entries spilled to temporary files, and the runs are merged with the homebuyers
+    held so far. Each neighborhood keeps its best proposals up to its capacity, and the others
+    become the free homebuyers of the next round. The result is the buyer-optimal stable allocation,
+    the same as the 'deferred_acceptance' engine of `PlaceHomeBuyersInNeighborhoods`, ties included
+
+    The memory used is about `memory_limit` bytes, plus the neighborhoods, plus one neighborhood's
+    homebuyers when the output is written
+
+    Attributes:
+        file_path (str): The path of the input file
+        memory_limit (int): The approximate peak memory of the parsed blocks and the proposal runs
+        run_length (int): The maximum number of proposals sorted in memory at a time
+        temp_dir (str): The directory of the temporary files, e.g. on a large local disk
+        output_path (Union[str, IO]): The path of the output file, or a file object
+        output_format (str): The format of the output file, one of `OutputWriter.FORMATS`
+        stats (ExecutionStats): The instrumentation of the stages, the rounds and the temporary files
+        schema (AttributeSchema): The attributes of the entities
+        neighborhood_attributes (list): For each neighborhood ID, its attribute vector
+        capacities (list): For each neighborhood ID, the maximum number of homebuyers it can hold
+        homebuyer_count (int): The number of homebuyers read
+        unassigned_count (int): The number of homebuyers left without a neighborhood
+    """
+    BUYER = struct.Struct('=qi')
+    PRIORITY = struct.Struct('=i')
+    ENTRY = struct.Struct('=iqqqiB')
+    FREE = struct.Struct('=qi')
+    ENTRY_MEMORY = 200
+    READ_SIZE = 1 << 16
+
+    def __init__(
+        self,
+        file_path: str,
+        memory_limit: int = 256 * 2 ** 20,
+        temp_dir: str = None,
+        output_path: Union[str, IO] = 'data/output.txt',
+        output_format: str = 'text',
+        stats: ExecutionStats = None,
+        schema: AttributeSchema = DEFAULT_SCHEMA,
+    ) -> None:
+        """
+        Initializes the allocator
+
+        Args:
+            file_path (str): The path of the input file
+            memory_limit (int, optional): The approximate peak memory in bytes, half of it for the
+                                          parsed blocks of the input file and half for the proposal
+                                          runs. Defaults to 256 MiB
+            temp_dir (str, optional): Where the temporary files are created. Defaults to None (the
+                                      system's temporary directory)
+            output_path (Union[str, IO], optional): The path of the output file, or a file object.
+                                                    Defaults to 'data/output.txt'
+            output_format (str, optional): Either 'text', 'csv' or 'jsonl'. Defaults to 'text'
+            stats (ExecutionStats, optional): Records the stages, the rounds and the temporary files.
+                                              Defaults to None (nothing is measured)
+            schema (AttributeSchema, optional): The attributes of the entities. Defaults to energy,
+                                                water and resilience
+
+        Raises:
+            ValueError: If the memory limit is not positive or the output format is unknown
+        """
+        if memory_limit <= 0:
+            raise ValueError('The memory limit must be positive')
+        if output_format not in OutputWriter.FORMATS:
+            raise ValueError(f'Unknown output format {output_format!r}, expected one of {OutputWriter.FORMATS}')
+
+        self.file_path = file_path
+        self.memory_limit = memory_limit
+        self.run_length = max(memory_limit // 2 // self.ENTRY_MEMORY, 1)
+        self.temp_dir = temp_dir
+        self.output_path = output_path
+        self.output_format = output_format
+        self.stats = stats
+        self.schema = schema
+        self.neighborhood_attributes = []
+        self.capacities = []
+        self.homebuyer_count = 0
+        self.unassigned_count = 0
+        self._directory = None
+        self._buyers = None
+        self._buyers_file = None
+        self._held_path = None
+        self._unassigned_path = None
+        self._file_count = 0
+        self._cutoffs = []
+        self._vector = struct.Struct(f'={len(schema)}q')
+        self._record_size = self.BUYER.size + self._vector.size
+
+    def __enter__(self) -> 'OutOfCoreAllocator':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Removes the temporary files
+        """
+        if self._buyers_file is not None:
+            # An input without homebuyers leaves an empty file, which cannot be memory-mapped
+            if isinstance(self._buyers, mmap.mmap):
+                self._buyers.close()
+            self._buyers_file.close()
+            self._buyers = self._buyers_file = None
+        if self._directory is not None:
+            self._directory.cleanup()
+            self._directory = None
+
+    def _count(self, **counters) -> None:
+        if self.stats is not None:
+            self.stats.count(**counters)
+
+    def _new_path(self, kind: str) -> str:
+        """
+        Returns the path of a new temporary file
+        """
+        self._file_count += 1
+        self._count(temp_files=1)
+        return os.path.join(self._directory.name, f'{kind}-{self._file_count}.bin')
+
+    def _write(self, path: str, records: Iterator[bytes]) -> None:
+        """
+        Writes packed records to a temporary file
+        """
+        written = 0
+        with open(path, 'wb', buffering=self.READ_SIZE) as file:
+            for record in records:
+                written += file.write(record)
+        self._count(temp_bytes_written=written)
+
+    def _read(self, path: str, layout: struct.Struct) -> Iterator[tuple]:
+        """
+        Streams the records of a temporary file, `READ_SIZE` bytes at a time
+        """
+        size = layout.size * max(self.READ_SIZE // layout.size, 1)
+        with open(path, 'rb') as file:
+            for data in iter(lambda: file.read(size), b''):
+                self._count(temp_bytes_read=len(data))
+                yield from layout.iter_unpack(data)
+
+    def read_input_file(self) -> None:
+        """
+        Streams the input file in blocks, keeps the neighborhoods and writes the homebuyers' records
+
+        Raises:
+            InputFormatError: If a line is malformed or a neighborhood is out of order
+        """
+        self.close()
+        self._directory = tempfile.TemporaryDirectory(prefix='allocation-', dir=self.temp_dir)
+        buyers_path = self._new_path('homebuyers')
+        self.neighborhood_attributes = []
+
+        def records() -> Iterator[bytes]:
+            reader = BulkReader(self.file_path, block_size=max(self.memory_limit // 16, 1), schema=self.schema)
+            for store in reader.chunks():
+                # The reader checks that the neighborhoods come in the order of their IDs
+                self.neighborhood_attributes.extend(map(store.neighborhood_vector, range(store.neighborhood_count)))
+
+                offsets = store.priority_offsets
+                for row, entity_id in enumerate(store.homebuyer_columns['entity_id']):
+                    priorities = store.priorities[offsets[row]:offsets[row + 1]]
+                    yield self.BUYER.pack(entity_id, len(priorities))
+                    yield self._vector.pack(*store.homebuyer_vector(row))
+                    yield priorities.tobytes()
+                self.homebuyer_count += store.homebuyer_count
+
+        self.homebuyer_count = 0
+        self._write(buyers_path, records())
+
+        self._buyers_file = open(buyers_path, 'rb')
+        if os.path.getsize(buyers_path):
+            self._buyers = mmap.mmap(self._buyers_file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._buyers = b''
+
+    def initialize_algorithm(self) -> None:
+        """
+        Sets the capacity of every neighborhood to `homebuyer_count // neighborhood_count`
+        """
+        limit = self.homebuyer_count // max(len(self.neighborhood_attributes), 1)
+        self.capacities = [limit] * len(self.neighborhood_attributes)
+        self.unassigned_count = 0
+        self._held_path = None
+        self._unassigned_path = None
+        self._cutoffs = [None if capacity else (float('-inf'), 0) for capacity in self.capacities]
+
+    def _first_proposals(self) -> Iterator[Tuple[int, int]]:
+        """
+        Walks the homebuyers' records in order
+
+        Yields:
+            Tuple[int, int]: The offset of each homebuyer's record and the position of its first choice
+        """
+        offset, size = 0, len(self._buyers)
+        while offset < size:
+            yield offset, 0
+            offset += self._record_size + self.BUYER.unpack_from(self._buyers, offset)[1] * self.PRIORITY.size
+
+    def _spill_proposals(self, proposals: Iterator[Tuple[int, int]], unassigned: List[int]) -> List[str]:
+        """
+        Turns the proposals of the free homebuyers into sorted runs on disk
+
+        A proposal to a full neighborhood that is not better than the weakest homebuyer it held at the
+        end of the last round is rejected right away, and the homebuyer proposes to its next choice
+
+        Args:
+            proposals (Iterator[Tuple[int, int]]): The offset of each proposing homebuyer's record and
+                                                   the position of the proposal in its preferences
+            unassigned (List[int]): Receives the IDs of the homebuyers without choices left
+
+        Returns:
+            List[str]: The paths of the runs, each sorted by neighborhood, best proposal first
+        """
+        runs, run = [], []
+        buyers, attributes, cutoffs = self._buyers, self.neighborhood_attributes, self._cutoffs
+        priorities_offset, priority_size = self._record_size, self.PRIORITY.size
+        candidates = 0
+
+        def spill() -> None:
+            run.sort()
+            path = self._new_path('run')
+            self._write(path, (self.ENTRY.pack(*entry) for entry in run))
+            runs.append(path)
+            run.clear()
+
+        for offset, choice in proposals:
+            entity_id, count = self.BUYER.unpack_from(buyers, offset)
+            vector = self._vector.unpack_from(buyers, offset + self.BUYER.size)
+            while choice < count:
+                candidates += 1
+                neighb = self.PRIORITY.unpack_from(buyers, offset + priorities_offset + choice * priority_size)[0]
+                key = (-sum(map(mul, vector, attributes[neighb])), entity_id)
+                cutoff = cutoffs[neighb]
+                if cutoff is None or key < cutoff:
+                    run.append((neighb, *key, offset, choice, 0))
+                    break
+                choice += 1
+            else:
+                unassigned.append(entity_id)
+            if len(run) >= self.run_length:
+                spill()
+        if run:
+            spill()
+        self._count(candidates=candidates)
+        return runs
+
+    def _merge_round(self, runs: List[str]) -> str:
+        """
+        Merges the runs of a round with the homebuyers held so far and keeps the best of each
+        neighborhood, up to its capacity. The weakest homebuyer held by a full neighborhood becomes
+        its cutoff for the next rounds
+
+        Args:
+            runs (List[str]): The sorted runs of the round's proposals
+
+        Returns:
+            str: The path of the file listing the rejected homebuyers, who propose to their next
+            choice in the next round
+        """
+        streams = [self._read(path, self.ENTRY) for path in runs]
+        if self._held_path is not None:
+            streams.append(self._read(self._held_path, self.ENTRY))
+        held_path, free_path = self._new_path('held'), self._new_path('free')
+        held, free, written = [], [], 0
+
+        with open(held_path, 'wb', buffering=self.READ_SIZE) as held_file, \
+                open(free_path, 'wb', buffering=self.READ_SIZE) as free_file:
+            current, count = -1, 0
+            for entry in heapq.merge(*streams):
+                neighb = entry[0]
+                if neighb != current:
+                    current, count = neighb, 0
+                if count < self.capacities[neighb]:
+                    count += 1
+                    held.append(self.ENTRY.pack(*entry[:5], 1))
+                    if count == self.capacities[neighb]:
+                        self._cutoffs[neighb] = entry[1:3]
+                else:
+                    if entry[5]:
+                        self._count(displacements=1)
+                    free.append(self.FREE.pack(entry[3], entry[4] + 1))
+
+                if len(held) + len(free) >= self.run_length:
+                    written += held_file.write(b''.join(held)) + free_file.write(b''.join(free))
+                    held.clear()
+                    free.clear()
+            written += held_file.write(b''.join(held)) + free_file.write(b''.join(free))
+        self._count(temp_bytes_written=written)
+
+        for path in runs + ([self._held_path] if self._held_path else []):
+            os.remove(path)
+        self._held_path = held_path
+        return free_path
+
+    def assign_homebuyers(self) -> None:
+        """
+        Runs the rounds of proposals until no free homebuyer has a choice left
+        """
+        unassigned = []
+        proposals = self._first_proposals()
+        free_path = None
+        while True:
+            runs = self._spill_proposals(proposals, unassigned)
+            if free_path is not None:
+                os.remove(free_path)
+            if not runs:
+                break
+            self._count(iterations=1)
+            free_path = self._merge_round(runs)
+            proposals = self._read(free_path, self.FREE)
+            if len(unassigned) >= self.run_length:
+                self._append_unassigned(unassigned)
+
+        self._append_unassigned(unassigned)
+
+    def _append_unassigned(self, unassigned: List[int]) -> None:
+        """
+        Moves the IDs of unassigned homebuyers from memory to their temporary file
+        """
+        if self._unassigned_path is None:
+            self._unassigned_path = self._new_path('unassigned')
+        with open(self._unassigned_path, 'ab') as file:
+            written = file.write(b''.join(struct.pack('=q', entity_id) for entity_id in unassigned))
+        self._count(temp_bytes_written=written)
+        self.unassigned_count += len(unassigned)
+        unassigned.clear()
+
+    def unassigned_homebuyers(self) -> Iterator[int]:
+        """
+        Yields:
+            int: The ID of each homebuyer left without a neighborhood, in no particular order
+        """
+        if self._unassigned_path is not None:
+            for (entity_id,) in self._read(self._unassigned_path, struct.Struct('=q')):
+                yield entity_id
+
+    def allocation(self) -> Iterator[Tuple[int, List[Tuple[int, int]]]]:
+        """
+        Streams the allocation one neighborhood at a time, from the file of the held homebuyers
+
+        Yields:
+            Tuple[int, List[Tuple[int, int]]]: The ID of a neighborhood and the (ID, score) of its
+            homebuyers, best first
+        """
+        entries = self._read(self._held_path, self.ENTRY) if self._held_path is not None else iter(())
+        entry = next(entries, None)
+        for neighb in range(len(self.neighborhood_attributes)):
+            homebuyers = []
+            while entry is not None and entry[0] == neighb:
+                homebuyers.append((entry[2], -entry[1]))
+                entry = next(entries, None)
+            yield neighb, homebuyers
+
+    def write_output_file(self) -> None:
+        """
+        Streams the final allocation to the output file
+        """
+        OutputWriter(self.output_path, self.output_format).write(self.allocation())
+
+    def execute(self) -> ExecutionStats:
+        """
+        Executes the full algorithm, the temporary files are kept until `close`
+
+        Returns:
+            ExecutionStats: The `stats` of the run, or None when the instrumentation is disabled
+        """
+        for stage, run in zip(ExecutionStats.STAGES, (
+            self.read_input_file,
+            self.initialize_algorithm,
+            self.assign_homebuyers,
+            self.write_output_file,
+        )):
+            if self.stats is None:
+                run()
+            else:
+                with self.stats.stage(stage):
+                    run()
+        return self.stats
@@ -1,4 +1,22 @@
-from entities import HomeBuyer, Neighborhood
+import os
+import time
+from array import array
+from operator import is_
+from typing import IO, Iterator, List, Tuple, Union
+
+from algorithm.allocation_state import AllocationState
+from algorithm.checkpoint import Checkpoint, CheckpointError, CheckpointState
+from algorithm.deferred_acceptance import DeferredAcceptance
+from algorithm.delta import DeltaWriter, diff_allocations
+from algorithm.ranked_index import RankedIndex
+from algorithm.score_matrix import ScoreMatrix
+from algorithm.snapshot import Snapshot, SnapshotError
+from algorithm.stats import ExecutionStats
+from algorithm.writer import OutputReader, OutputWriter
+from entities import EntityStore, HomeBuyer, Neighborhood
+from entities.attributes import DEFAULT_SCHEMA, AttributeSchema
+from entities.compression import open_input
+from entities.reader import BulkReader, InputFormatError
 
 
 class PlaceHomeBuyersInNeighborhoods:
@@ -7,27 +25,175 @@ class PlaceHomeBuyersInNeighborhoods:
 
     Attributes:
         file_path (str): The path to the file containing the data for neighborhoods and homebuyers 
+        engine (str): The allocation engine used by `assign_homebuyers`, one of `ENGINES` 
+        scoring (str): How the homebuyers' scores are computed, one of `SCORINGS` 
+        score_matrix (ScoreMatrix): The score matrix, only set by the 'vectorized' scoring 
+        storage (str): How the parsed entities are stored, one of `STORAGES` 
+        store (EntityStore): The columnar store, only set by the 'columnar' storage 
+        reader (str): How the input file is read, one of `READERS` 
+        snapshot_path (str): The path of the binary `Snapshot` of the parsed input, if any 
+        output_path (Union[str, IO]): The path of the output file written by `write_output_file`, or a 
+                                      file object 
+        output_format (str): The format of the output file, one of `OutputWriter.FORMATS` 
+        previous_output (Union[str, IO]): The output of a previous run, when `write_output_file` 
+                                          writes only the changes against it 
+        stats (ExecutionStats): The instrumentation of the stages and of the assignment, if enabled 
+        checkpoint_path (str): The path of the `Checkpoint` of the running assignment, if any 
+        checkpoint_interval (float): The minimum number of seconds between two checkpoints 
+        schema (AttributeSchema): The attributes declared for the entities of the input file 
+        workers (int): The number of processes parsing the input file with the 'bulk' reader 
+        ranked_index (RankedIndex): The homebuyers ranking each neighborhood sorted by score, built 
+                                    once after parsing for the 'recursive' engine 
         neighborhoods (dict): A dictionary mapping neighborhood IDs to Neighborhood objects 
         homebuyers (dict): A dictionary mapping homebuyer IDs to HomeBuyer objects 
         priority_buyers (dict): A dictionary mapping neighborhood IDs to lists of prioritized HomeBuyer objects 
         neighb_limit (int): The maximum number of homebuyers that can be allocated to each neighborhood 
-        _allocated_homebuyers (list): A list of homebuyers that have been allocated to neighborhoods 
+        _allocated_homebuyers (set): A set of homebuyers that have been allocated to neighborhoods 
         _unallocated_homebuyers (set): A set of homebuyers that have not yet been allocated to any neighborhood 
+        _buyer_state (AllocationState): The per-homebuyer state of the 'recursive' engine 
+        _held_positions (dict): Maps neighborhood IDs to the positions of their candidates in the 
+                                `ranked_index`, best first 
+        _ranked_entities (tuple): The homebuyers and neighborhoods the `ranked_index` was built from, 
+                                  with the 'objects' storage 
     """
-    def __init__(self, file_path: str) -> None:
+    ENGINES = ('recursive', 'deferred_acceptance')
+    SCORINGS = ('python', 'vectorized')
+    STORAGES = ('objects', 'columnar')
+    READERS = ('lines', 'bulk')
+    CHECKPOINT_STRIDE = 4096
+
+    def __init__(
+        self,
+        file_path: str,
+        engine: str = 'recursive',
+        scoring: str = 'python',
+        storage: str = 'objects',
+        reader: str = 'lines',
+        snapshot_path: str = None,
+        output_path: Union[str, IO] = 'data/output.txt',
+        output_format: str = 'text',
+        previous_output: Union[str, IO] = None,
+        stats: ExecutionStats = None,
+        checkpoint_path: str = None,
+        checkpoint_interval: float = 60.0,
+        schema: AttributeSchema = DEFAULT_SCHEMA,
+        workers: int = 1,
+    ) -> None:
         """
         Initializes the PlaceHomeBuyersInNeighborhoods instance with the given file path 
 
         Args:
-            file_path (str): The path to the file containing the data for neighborhoods and homebuyers 
+            file_path (str): The path to the file containing the data for neighborhoods and homebuyers, 
+                             which may be compressed with gzip, xz, bzip2 or Zstandard 
+            engine (str, optional): The allocation engine, either 'recursive' (the original 
+                                    neighborhood scan) or 'deferred_acceptance' (the queue-driven 
+                                    engine). Defaults to 'recursive'
+            scoring (str, optional): Either 'python' (each homebuyer is scored while parsed) or 
+                                     'vectorized' (all the scores are computed at once in a NumPy 
+                                     `ScoreMatrix` after parsing). Defaults to 'python'
+            storage (str, optional): Either 'objects' (one HomeBuyer/Neighborhood per entity) or 
+                                     'columnar' (an `EntityStore`, exposed through `neighborhoods` 
+                                     and `homebuyers` as views). Defaults to 'objects'
+            reader (str, optional): Either 'lines' (each line is parsed with `create_from_string`) or 
+                                    'bulk' (the file is memory-mapped and parsed by blocks with 
+                                    `BulkReader`, which requires the 'columnar' storage). 
+                                    Defaults to 'lines'
+            snapshot_path (str, optional): The path of a binary `Snapshot` of the parsed input (and 
+                                           of the score matrix with the 'vectorized' scoring). It is 
+                                           loaded instead of parsing the input file, and rebuilt 
+                                           when missing or stale. Requires the 'columnar' storage. 
+                                           Defaults to None (no snapshot)
+            output_path (Union[str, IO], optional): The path of the output file, compressed with gzip 
+                                                    when it ends with '.gz', or a file object open 
+                                                    for writing. Defaults to 'data/output.txt'
+            output_format (str, optional): Either 'text' (the original format), 'csv' or 'jsonl' 
+                                           (JSON Lines). Defaults to 'text'
+            previous_output (Union[str, IO], optional): The path of the output of a previous run, 
+                                                        its format guessed from its extension, or a 
+                                                        file object open for reading. The output 
+                                                        file then holds a `DeltaWriter` change log 
+                                                        against it rather than the full allocation. 
+                                                        Defaults to None (the full allocation)
+            stats (ExecutionStats, optional): Records the cost of each stage of `execute` and the 
+                                              work done by `assign_homebuyers`. Defaults to None 
+                                              (nothing is measured)
+            checkpoint_path (str, optional): The path of a `Checkpoint` where the state of 
+                                             `assign_homebuyers` is saved periodically, so that 
+                                             `resume` can continue an interrupted run. It is removed 
+                                             once the assignment completes. Defaults to None (no 
+                                             checkpoint)
+            checkpoint_interval (float, optional): The minimum number of seconds between two 
+                                                   checkpoints, taken between two passes of the 
+                                                   'recursive' engine or every 
+                                                   `CHECKPOINT_STRIDE` proposing homebuyers of the 
+                                                   'deferred_acceptance' engine. Defaults to 60
+            schema (AttributeSchema, optional): The attributes of the entities, given as 'KEY:value' 
+                                                tokens in the input file. Defaults to energy (E), 
+                                                water (W) and resilience (R)
+            workers (int, optional): The number of processes parsing blocks of the input file, which 
+                                     requires the 'bulk' reader. Defaults to 1 (parsed in this 
+                                     process)
+
+        Raises:
+            ValueError: If the engine, scoring, storage, reader or output format is not one of 
+                        `ENGINES`, `SCORINGS`, `STORAGES`, `READERS` or `OutputWriter.FORMATS`, if 
+                        the 'bulk' reader or a snapshot is used without the 'columnar' storage, if 
+                        the checkpoint interval is negative, or if there are several workers without 
+                        the 'bulk' reader or none
         """
+        if engine not in self.ENGINES:
+            raise ValueError(f'Unknown engine {engine!r}, expected one of {self.ENGINES}')
+        if scoring not in self.SCORINGS:
+            raise ValueError(f'Unknown scoring {scoring!r}, expected one of {self.SCORINGS}')
+        if storage not in self.STORAGES:
+            raise ValueError(f'Unknown storage {storage!r}, expected one of {self.STORAGES}')
+        if reader not in self.READERS:
+            raise ValueError(f'Unknown reader {reader!r}, expected one of {self.READERS}')
+        if output_format not in OutputWriter.FORMATS:
+            raise ValueError(f'Unknown output format {output_format!r}, expected one of {OutputWriter.FORMATS}')
+        if reader == 'bulk' and storage != 'columnar':
+            raise ValueError("The 'bulk' reader parses into the 'columnar' storage")
+        if snapshot_path is not None and storage != 'columnar':
+            raise ValueError("Snapshots hold the 'columnar' storage")
+        if checkpoint_interval < 0:
+            raise ValueError('The checkpoint interval cannot be negative')
+        if workers < 1:
+            raise ValueError('There must be at least one worker')
+        if workers > 1 and reader != 'bulk':
+            raise ValueError("Only the 'bulk' reader parses with several workers")
+
         self.file_path = file_path
+        self.engine = engine
+        self.scoring = scoring
+        self.score_matrix = None
+        self.storage = storage
+        self.store = EntityStore(schema) if storage == 'columnar' else None
+        self.reader = reader
+        self.snapshot_path = snapshot_path
+        self.output_path = output_path
+        self.output_format = output_format
+        self.previous_output = previous_output
+        self.stats = stats
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_interval = checkpoint_interval
+        self.schema = schema
+        self.workers = workers
+        self.ranked_index = None
+        self._ranked_entities = None
         self.neighborhoods = dict()
         self.homebuyers = dict()
         self.priority_buyers = dict()
         self.neighb_limit = 0
-        self._allocated_homebuyers = []
+        self._allocated_homebuyers = set()
         self._unallocated_homebuyers = set()
+        self._buyer_state = None
+        self._held_positions = dict()
+        self._deferred_acceptance = None
+        self._engine_homebuyers = []
+        self._engine_positions = dict()
+        self._checkpoint = Checkpoint(checkpoint_path) if checkpoint_path is not None else None
+        self._last_checkpoint = 0.0
+        self._resume_state = None
     
     def initialize_algorithm(self) -> None:
         """
@@ -37,6 +203,13 @@ class PlaceHomeBuyersInNeighborhoods:
             i: [] for i in range(len(self.neighborhoods))
         }
         self.neighb_limit = len(self.homebuyers) // len(self.neighborhoods)
+        self._allocated_homebuyers = set()
+        self._unallocated_homebuyers = set()
+        self._buyer_state = None
+        self._held_positions = dict()
+        self._deferred_acceptance = None
+        self._last_checkpoint = time.monotonic()
+        self._resume_state = None
 
     def _parse_line(self, line: str) -> None:
         """
@@ -45,107 +218,655 @@ class PlaceHomeBuyersInNeighborhoods:
         Args:
             line (str): A line of text from the file, expected to start with 'N' for Neighborhood 
                         or 'H' for HomeBuyer 
+
+        Raises:
+            ValueError: If the line is malformed or a homebuyer ranks a neighborhood not declared 
+                        before it
         """
-        if line.startswith('N'):
-            neighborhood = Neighborhood.create_from_string(line) 
+        if self.store is not None:
+            self._parse_line_into_store(line)
+        elif line.startswith('N'):
+            neighborhood = Neighborhood.create_from_string(line, self.schema)
             self.neighborhoods[neighborhood.entity_id] = neighborhood
         elif line.startswith('H'):
-            homebuyer = HomeBuyer.create_from_string(line)
-            homebuyer.set_neighborhoods_score(self.neighborhoods)
+            homebuyer = HomeBuyer.create_from_string(line, self.schema)
+            HomeBuyer.check_priority_ids(homebuyer.get_priority_ids(), self.neighborhoods)
+            if self.scoring == 'python':
+                homebuyer.set_neighborhoods_score(self.neighborhoods)
             self.homebuyers[homebuyer.entity_id] = homebuyer
 
+    def _parse_line_into_store(self, line: str) -> None:
+        """
+        Parses a line from the input file and appends the entity to the columnar `store` 
+
+        Args:
+            line (str): A line of text from the file, expected to start with 'N' for Neighborhood 
+                        or 'H' for HomeBuyer 
+        """
+        if line.startswith('N'):
+            attrs = Neighborhood._parse_base_attributes(line, self.schema)
+            self.store.add_neighborhood(attrs['entity_id'], attrs['attributes'])
+        elif line.startswith('H'):
+            attrs = HomeBuyer._parse_base_attributes(line, self.schema)
+            priority_ids = HomeBuyer.to_priority_ids(attrs['neighborhood_priority'])
+            HomeBuyer.check_priority_ids(priority_ids, range(self.store.neighborhood_count))
+            self.store.add_homebuyer(attrs['entity_id'], attrs['attributes'], priority_ids)
+
+    def _score_homebuyers(self) -> None:
+        """
+        Exposes the columnar store's views and computes the scores of all homebuyers at once when 
+        the 'vectorized' scoring is used. The 'recursive' engine's `ranked_index` is then built, 
+        unless the store was loaded with it 
+        """
+        if self.store is not None:
+            self.neighborhoods = self.store.neighborhoods
+            self.homebuyers = self.store.homebuyers
+            if self.scoring == 'vectorized' and self.store.score_matrix is None:
+                self.store.score_matrix = ScoreMatrix.from_store(self.store)
+            self.score_matrix = self.store.score_matrix
+            self.ranked_index = self.store.ranked_index
+        else:
+            if self.scoring == 'vectorized':
+                homebuyers = list(self.homebuyers.values())
+                self.score_matrix = ScoreMatrix.from_entities(homebuyers, self.neighborhoods, schema=self.schema)
+                self.score_matrix.assign_to(homebuyers)
+            self.ranked_index = None
+        if self.engine == 'recursive':
+            self._ranked_index()
+
+    def _ranked_index(self) -> RankedIndex:
+        """
+        Returns the `ranked_index`, built first if it is missing or was built for other entities. 
+        With the 'columnar' storage, which is append-only, it is kept in the store to be saved in its 
+        snapshot. With the 'objects' storage, the entities can be replaced in `homebuyers` and 
+        `neighborhoods` directly (e.g. by `AllocationService`), so the index is only reused while 
+        they hold the very objects it was built from 
+
+        Returns:
+            RankedIndex: The index of the scored homebuyers
+        """
+        index = self.ranked_index
+        if self.store is not None:
+            if index is None or not index.fits(len(self.homebuyers), len(self.neighborhoods)):
+                index = self.ranked_index = self.store.ranked_index = RankedIndex.from_store(self.store)
+            return index
+
+        entities = (list(self.homebuyers.values()), list(self.neighborhoods.values()))
+        if index is None or not self._same_entities(entities):
+            index = self.ranked_index = RankedIndex.from_homebuyers(entities[0], len(self.neighborhoods))
+            self._ranked_entities = entities
+        return index
+
+    def _same_entities(self, entities: Tuple[list, list]) -> bool:
+        """
+        Returns:
+            bool: True if the homebuyers and neighborhoods are the objects the `ranked_index` was 
+            built from, in the same order
+        """
+        if self._ranked_entities is None:
+            return False
+        return all(
+            len(current) == len(indexed) and all(map(is_, current, indexed))
+            for current, indexed in zip(entities, self._ranked_entities)
+        )
+
     def read_input_file(self) -> None:
         """
-        Reads and parses the file specified by `file_path` 
+        Reads and parses the file specified by `file_path`, or loads its snapshot when 
+        `snapshot_path` is set and the snapshot is up to date. A missing or stale snapshot is 
+        rebuilt after parsing, with the `ranked_index` of the 'recursive' engine, and a snapshot 
+        saved without it is rewritten once it is built
+
+        Raises:
+            InputFormatError: If a line is malformed, see `_parse_input_file`
+        """
+        if self.snapshot_path is None:
+            self._parse_input_file()
+            return
+
+        snapshot = Snapshot(self.snapshot_path)
+        try:
+            self.store = snapshot.load(self.file_path, self.schema)
+        except SnapshotError:
+            self._parse_input_file()
+            snapshot.write(self.store, self.file_path)
+        else:
+            indexed = self.store.ranked_index is not None
+            self._score_homebuyers()
+            if self.store.ranked_index is not None and not indexed:
+                snapshot.write(self.store, self.file_path)
+
+    def _parse_input_file(self) -> None:
         """
-        with open(self.file_path, 'r') as file:
-            for line in file:
-                self._parse_line(line)
+        Parses the file specified by `file_path` with the configured reader and scores the homebuyers. 
+        A compressed file is decompressed as it is read, in the order of its lines 
 
-    def _buyer_can_be_allocated(self, homebuyer: HomeBuyer, neighborhood_index: int) -> bool:
+        Raises:
+            InputFormatError: If a line is malformed, a homebuyer ranks a neighborhood not declared 
+                              before it, or a neighborhood is out of order with the 'columnar' storage
         """
-        Checks if a homebuyer can be allocated to a given neighborhood based on current allocations 
+        if self.reader == 'bulk':
+            BulkReader(self.file_path, schema=self.schema, workers=self.workers).read(self.store)
+        else:
+            with open_input(self.file_path, text=True) as file:
+                for line_number, line in enumerate(file, 1):
+                    try:
+                        self._parse_line(line)
+                    except ValueError as error:
+                        raise InputFormatError(self.file_path, line_number, line.rstrip('\n'), str(error)) from None
+        self._score_homebuyers()
+
+    def _buyer_can_be_allocated(self, row: int) -> bool:
+        """
+        Checks if a homebuyer can be allocated to the neighborhood being filled, i.e. it has never 
+        been allocated and is not already one of its candidates 
 
         Args:
-            homebuyer (HomeBuyer): The homebuyer to be checked
-            neighborhood_index (int): The index of the neighborhood to check against
+            row (int): The row of the homebuyer in `_buyer_state`
 
         Returns:
             bool: True if the homebuyer can be allocated
         """
-        return (homebuyer not in self._allocated_homebuyers) and (homebuyer not in self.priority_buyers[neighborhood_index])
+        return self._buyer_state.status[row] in (AllocationState.FREE, AllocationState.REJECTED)
 
     def _update_allocation(self, neighborhood_index: int) -> None:
         """
         Updates the allocation of homebuyers to the specified neighborhood and manages 
-        unallocated homebuyers
+        unallocated homebuyers. The candidates are positions in the `ranked_index`, where a lower 
+        position is a higher score, so they are ordered without computing any key: sorting merges 
+        the held homebuyers with the runs of new candidates, each already in order 
 
         Args:
             neighborhood_index (int): The index of the neighborhood to update
 
         """
-        self.priority_buyers[neighborhood_index] = list(set(self.priority_buyers[neighborhood_index]))
-        self.priority_buyers[neighborhood_index].sort(key = lambda obj: obj.neighborhood_scores[neighborhood_index], reverse=True)
-        self._unallocated_homebuyers = (
-            set(list(self._unallocated_homebuyers) + self.priority_buyers[neighborhood_index][self.neighb_limit:]) 
-            - set(self.priority_buyers[neighborhood_index][:self.neighb_limit])
-        )
+        state = self._buyer_state
+        order = state.index.order
+        positions = self._held_positions[neighborhood_index]
+        positions.sort()
+        if self.stats is not None:
+            self.stats.count(displacements=max(len(positions) - self.neighb_limit, 0))
+
+        for position in positions[self.neighb_limit:]:
+            row = order[position]
+            state.cut(row)
+            self._unallocated_homebuyers.add(state.homebuyers[row])
+        del positions[self.neighb_limit:]
+        homebuyers = []
+        for position in positions:
+            row = order[position]
+            hb = state.homebuyers[row]
+            if state.status[row] == AllocationState.CANDIDATE:
+                state.hold(row, neighborhood_index)
+                self._unallocated_homebuyers.discard(hb)
+                self._allocated_homebuyers.add(hb)
+            homebuyers.append(hb)
 
-        self.priority_buyers[neighborhood_index] = self.priority_buyers[neighborhood_index][:self.neighb_limit]
-        self._allocated_homebuyers.extend(self.priority_buyers[neighborhood_index])
+        self.priority_buyers[neighborhood_index] = homebuyers
+
+    def _start_recursive(self) -> AllocationState:
+        """
+        Creates the state of the 'recursive' engine over the `ranked_index`, with the homebuyers 
+        already in `priority_buyers` as candidates 
+
+        Returns:
+            AllocationState: The state, every homebuyer FREE
+        """
+        state = self._buyer_state = AllocationState(self.homebuyers.values(), self._ranked_index())
+        self._held_positions = {
+            neighb: state.index.positions_of(neighb, [state.rows[hb.entity_id] for hb in homebuyers])
+            for neighb, homebuyers in self.priority_buyers.items()
+        }
+        return state
+
+    def _assign_with_deferred_acceptance(self) -> None:
+        """
+        Assigns homebuyers to neighborhoods using the queue-driven `DeferredAcceptance` engine and
+        stores the result in `priority_buyers` 
+        """
+        capacities = [self.neighb_limit] * len(self.priority_buyers)
+        if self.store is not None:
+            engine = DeferredAcceptance(
+                preferences=self.store.priority_rows,
+                scores=self.store.score_rows,
+                tie_breakers=self.store.homebuyer_columns['entity_id'],
+                capacities=capacities,
+            )
+            homebuyer = self.store.homebuyer
+        else:
+            homebuyers = list(self.homebuyers.values())
+            engine = DeferredAcceptance(
+                preferences=[hb.get_priority_ids() for hb in homebuyers],
+                scores=[hb.neighborhood_scores for hb in homebuyers],
+                tie_breakers=[hb.entity_id for hb in homebuyers],
+                capacities=capacities,
+            )
+            homebuyer = homebuyers.__getitem__
+            self._engine_homebuyers = homebuyers
+            self._engine_positions = {hb.entity_id: idx for idx, hb in enumerate(homebuyers)}
+
+        self._deferred_acceptance = engine
+        start = 0
+        if self._resume_state is not None:
+            sections = self._resume_state.sections
+            engine.restore(sections['next_choice'], sections['assigned'], sections['displacements'][0])
+            start = self._resume_state.progress
+            self._resume_state = None
+        checkpoint = self._checkpoint_deferred_acceptance if self._checkpoint is not None else None
+        allocation = engine.run(start, checkpoint, self.CHECKPOINT_STRIDE)
+        self._remove_checkpoint()
+        if self.stats is not None:
+            self.stats.count(
+                iterations=len(engine.preferences) + engine.displacements,
+                candidates=sum(engine.next_choice),
+                displacements=engine.displacements,
+            )
+        for neighb, rows in enumerate(allocation):
+            self.priority_buyers[neighb] = [homebuyer(row) for row in rows]
+
+        self._allocated_homebuyers = {hb for buyers in self.priority_buyers.values() for hb in buyers}
+        self._unallocated_homebuyers = {homebuyer(row) for row, neighb in enumerate(engine.assigned) if neighb == -1}
+
+    def _repair_allocation(self, repair) -> None:
+        """
+        Applies a repair to the current allocation and refreshes the neighborhoods and homebuyers
+        it changed. With the 'recursive' engine, the allocation is recomputed from scratch instead 
+
+        Args:
+            repair (Callable[[DeferredAcceptance], None]): Repairs the engine's allocation
+        """
+        engine = self._deferred_acceptance
+        if engine is None:
+            if self.priority_buyers:
+                self.initialize_algorithm()
+                self.assign_homebuyers()
+            return
+
+        repair(engine)
+        for neighb in engine.changed_neighborhoods:
+            self.priority_buyers[neighb] = [self._engine_homebuyers[idx] for idx in engine.held_by(neighb)]
+        for idx in engine.changed_buyers:
+            hb = self._engine_homebuyers[idx]
+            if engine.assigned[idx] != -1:
+                self._allocated_homebuyers.add(hb)
+                self._unallocated_homebuyers.discard(hb)
+            else:
+                self._allocated_homebuyers.discard(hb)
+                if idx in engine.removed:
+                    self._unallocated_homebuyers.discard(hb)
+                else:
+                    self._unallocated_homebuyers.add(hb)
+
+    def _repair_limit(self) -> None:
+        """
+        Updates `neighb_limit` after homebuyers are added or removed and repairs the allocation. 
+        Without a repairable allocation, the limit is left to `initialize_algorithm` 
+        """
+        if self._deferred_acceptance is None:
+            return
+        neighb_limit = len(self.homebuyers) // len(self.neighborhoods)
+        if neighb_limit != self.neighb_limit:
+            self.neighb_limit = neighb_limit
+            self._repair_allocation(lambda engine: engine.set_capacities([neighb_limit] * len(self.neighborhoods)))
+
+    def _check_incremental(self) -> None:
+        """
+        Raises:
+            ValueError: If the entities are kept in the 'columnar' storage, which is append-only
+        """
+        if self.store is not None:
+            raise ValueError("Incremental updates need the 'objects' storage")
+
+    def add_homebuyer(self, homebuyer: HomeBuyer) -> None:
+        """
+        Adds a homebuyer and repairs the current allocation, the result is the same as running the 
+        whole algorithm again 
+
+        Args:
+            homebuyer (HomeBuyer): The new homebuyer 
+
+        Raises:
+            ValueError: If a homebuyer with the same ID exists, it ranks an unknown neighborhood, or 
+                        with the 'columnar' storage
+        """
+        self._check_incremental()
+        if homebuyer.entity_id in self.homebuyers:
+            raise ValueError(f'Homebuyer H{homebuyer.entity_id} already exists')
+        HomeBuyer.check_priority_ids(homebuyer.get_priority_ids(), self.neighborhoods)
+
+        homebuyer.set_neighborhoods_score(self.neighborhoods)
+        self.homebuyers[homebuyer.entity_id] = homebuyer
+        self.ranked_index = None
+        self._repair_limit()
+
+        def repair(engine: DeferredAcceptance) -> None:
+            self._engine_positions[homebuyer.entity_id] = len(self._engine_homebuyers)
+            self._engine_homebuyers.append(homebuyer)
+            engine.add_buyer(homebuyer.get_priority_ids(), homebuyer.neighborhood_scores, homebuyer.entity_id)
+
+        self._repair_allocation(repair)
+
+    def remove_homebuyer(self, entity_id: int) -> HomeBuyer:
+        """
+        Removes a homebuyer and repairs the current allocation, the result is the same as running 
+        the whole algorithm again 
+
+        Args:
+            entity_id (int): The ID of the homebuyer 
+
+        Returns:
+            HomeBuyer: The removed homebuyer 
+
+        Raises:
+            KeyError: If there is no homebuyer with this ID
+            ValueError: With the 'columnar' storage
+        """
+        self._check_incremental()
+        homebuyer = self.homebuyers.pop(entity_id)
+        self.ranked_index = None
+        self._repair_allocation(lambda engine: engine.remove_buyer(self._engine_positions.pop(entity_id)))
+        self._repair_limit()
+        return homebuyer
+
+    def update_neighborhood(self, neighborhood: Neighborhood) -> None:
+        """
+        Replaces the attributes of a neighborhood, rescores the homebuyers for it and repairs the 
+        current allocation, the result is the same as running the whole algorithm again 
+
+        Args:
+            neighborhood (Neighborhood): The neighborhood with its new attributes 
+
+        Raises:
+            KeyError: If there is no neighborhood with this ID
+            ValueError: With the 'columnar' storage
+        """
+        self._check_incremental()
+        if neighborhood.entity_id not in self.neighborhoods:
+            raise KeyError(neighborhood.entity_id)
+        self.neighborhoods[neighborhood.entity_id] = neighborhood
+        self.ranked_index = None
+
+        def rescore() -> None:
+            for hb in self.homebuyers.values():
+                hb.set_neighborhoods_score({neighborhood.entity_id: neighborhood})
+
+        if self._deferred_acceptance is None:
+            rescore()
+        self._repair_allocation(lambda engine: engine.update_neighborhood(neighborhood.entity_id, rescore))
 
     def assign_homebuyers(self, iteration: int = 0) -> None:
         """
         Assigns homebuyers to neighborhoods based on their preferences and scores
 
+        Homebuyers who run out of choices are left unassigned, see `unassigned_homebuyers`. The 
+        passes stop as soon as no unassigned homebuyer has a preference left to try 
+
         Args:
             iteration (int, optional): The current iteration level for checking preferences. 
-                                       Defaults to 0
+                                       Defaults to 0. Ignored by the 'deferred_acceptance' engine
         """
+        if self.engine == 'deferred_acceptance':
+            self._assign_with_deferred_acceptance()
+            return
+
+        if self.stats is not None:
+            self.stats.count(iterations=1)
+
+        state = self._buyer_state
+        if state is None:
+            state = self._start_recursive()
+        index, order = state.index, state.index.order
         next_priority = iteration
         for neighb in self.neighborhoods.values():
-            if len(self.priority_buyers[neighb.entity_id]) != self.neighb_limit:
-                for hb in self.homebuyers.values():
-                    if (
-                        hb.is_preferred_neighborhood(neighb.entity_id) 
-                        and self._buyer_can_be_allocated(hb, neighb.entity_id)
-                    ):
-                        self.priority_buyers[neighb.entity_id].append(hb)
+            candidates = self._held_positions[neighb.entity_id]
+            if len(candidates) != self.neighb_limit:
+                first_choices = index.ranked_at(neighb.entity_id, 0)
+                for position in first_choices:
+                    row = order[position]
+                    if self._buyer_can_be_allocated(row):
+                        state.propose(row)
+                        candidates.append(position)
 
                 if self._unallocated_homebuyers:
-                    for rm in self._unallocated_homebuyers:
-                        if (
-                            rm.is_preferred_neighborhood(neighb.entity_id, priority=next_priority) 
-                            and self._buyer_can_be_allocated(rm, neighb.entity_id)
-                        ):
-                            self.priority_buyers[neighb.entity_id].append(rm)
+                    next_choices = index.ranked_at(neighb.entity_id, next_priority)
+                    for position in next_choices:
+                        row = order[position]
+                        if state.status[row] == AllocationState.REJECTED:
+                            state.propose(row)
+                            candidates.append(position)
                     next_priority += 1
+                else:
+                    next_choices = ()
+                if self.stats is not None:
+                    self.stats.count(candidates=len(first_choices) + len(next_choices))
 
                 self._update_allocation(neighb.entity_id)
-                
-        if self._unallocated_homebuyers and iteration < len(self.neighborhoods):
+
+        if iteration < len(self.neighborhoods) and any(
+            state.can_propose(state.rows[hb.entity_id], iteration + 1) for hb in self._unallocated_homebuyers
+        ):
+            self._checkpoint_recursive(iteration + 1)
             self.assign_homebuyers(iteration + 1)
+        else:
+            self._remove_checkpoint()
         
-    def write_output_file(self) -> None:
+    def _checkpoint_due(self) -> bool:
         """
-        Writes the final allocation of homebuyers to neighborhoods to the output file
+        Returns:
+            bool: True if checkpoints are enabled and the last one is at least `checkpoint_interval` 
+            seconds old
         """
-        file_name = 'data/output.txt'
-        output_string = ''
-        
-        with open(file_name, 'w') as file:
-            for neighb, homebuyers in self.priority_buyers.items():
-                homebuyers_string = ' '.join(f'H{hb.entity_id}({hb.neighborhood_scores[neighb]})' for hb in homebuyers)
-                output_string += f'N{neighb}: {homebuyers_string}\n'
-            
-            file.write(output_string)
+        return self._checkpoint is not None and time.monotonic() - self._last_checkpoint >= self.checkpoint_interval
+
+    def _save_checkpoint(self, progress: int, sections: dict) -> None:
+        """
+        Writes the checkpoint and restarts the interval
+        """
+        self._checkpoint.write(self.file_path, self.engine, progress, sections)
+        self._last_checkpoint = time.monotonic()
+
+    def _remove_checkpoint(self) -> None:
+        """
+        Removes the checkpoint of a completed assignment, resuming it again would start over
+        """
+        if self._checkpoint is not None:
+            self._checkpoint.remove()
+
+    def _checkpoint_recursive(self, iteration: int) -> None:
+        """
+        Saves the state of the 'recursive' engine between two passes: the status and neighborhood of 
+        every homebuyer and the homebuyers held by each neighborhood, in order. The allocated and 
+        unallocated sets are rebuilt from the statuses 
+
+        Args:
+            iteration (int): The next pass
+        """
+        if not self._checkpoint_due():
+            return
+        state = self._buyer_state
+        held, offsets = array('l'), array('l', [0])
+        for neighb in range(len(self.neighborhoods)):
+            held.extend(state.rows[hb.entity_id] for hb in self.priority_buyers[neighb])
+            offsets.append(len(held))
+        self._save_checkpoint(iteration, {
+            'status': array('B', state.status), 
+            'assigned': state.assigned, 
+            'held': held, 
+            'held_offsets': offsets,
+        })
+
+    def _checkpoint_deferred_acceptance(self, buyer: int) -> None:
+        """
+        Saves the state of the 'deferred_acceptance' engine before a homebuyer proposes 
+
+        Args:
+            buyer (int): The position of the next proposing homebuyer
+        """
+        if not self._checkpoint_due():
+            return
+        engine = self._deferred_acceptance
+        self._save_checkpoint(buyer, {
+            'next_choice': array('l', engine.next_choice), 
+            'assigned': array('l', engine.assigned), 
+            'displacements': array('q', [engine.displacements]),
+        })
+
+    def _load_checkpoint(self) -> CheckpointState:
+        """
+        Loads the checkpoint and checks that it fits the parsed input 
+
+        Returns:
+            CheckpointState: The saved state
 
-    def execute(self) -> None:
+        Raises:
+            CheckpointError: If the checkpoint cannot be loaded or does not fit the input
+        """
+        state = self._checkpoint.load(self.file_path, self.engine)
+        homebuyers, neighborhoods = len(self.homebuyers), len(self.neighborhoods)
+        if self.engine == 'deferred_acceptance':
+            lengths = {'next_choice': homebuyers, 'assigned': homebuyers, 'displacements': 1}
+        else:
+            lengths = {'status': homebuyers, 'assigned': homebuyers, 'held_offsets': neighborhoods + 1}
+        for name, length in lengths.items():
+            if len(state.sections.get(name, ())) != length:
+                raise CheckpointError(f'Checkpoint {self.checkpoint_path} does not fit the input, bad {name!r}')
+        return state
+
+    def _restore_recursive(self, checkpoint: CheckpointState) -> None:
+        """
+        Restores the state of the 'recursive' engine saved by `_checkpoint_recursive` 
+        """
+        sections = checkpoint.sections
+        state = self._buyer_state = AllocationState(self.homebuyers.values(), self._ranked_index())
+        state.status[:] = sections['status'].tobytes()
+        state.assigned = sections['assigned']
+        held, offsets = sections['held'], sections['held_offsets']
+        for neighb in range(len(self.neighborhoods)):
+            rows = held[offsets[neighb]:offsets[neighb + 1]]
+            self.priority_buyers[neighb] = [state.homebuyers[row] for row in rows]
+            self._held_positions[neighb] = state.index.positions_of(neighb, rows)
+        # A pass leaves no candidate: held homebuyers were allocated, cut ones unallocated for good
+        for hb, status in zip(state.homebuyers, state.status):
+            if status in (AllocationState.HELD, AllocationState.RELEASED):
+                self._allocated_homebuyers.add(hb)
+            if status in (AllocationState.REJECTED, AllocationState.RELEASED):
+                self._unallocated_homebuyers.add(hb)
+
+    def resume_homebuyers(self) -> None:
+        """
+        Continues `assign_homebuyers` from the checkpoint at `checkpoint_path`. Without a usable 
+        checkpoint (missing, stale, corrupt or written by another engine) the assignment starts 
+        over. Either way, the allocation is the one of an uninterrupted run 
+
+        Raises:
+            ValueError: If no `checkpoint_path` is set
+        """
+        if self._checkpoint is None:
+            raise ValueError('Resuming requires a checkpoint_path')
+        try:
+            checkpoint = self._load_checkpoint()
+        except CheckpointError:
+            self.assign_homebuyers()
+            return
+
+        if self.engine == 'deferred_acceptance':
+            self._resume_state = checkpoint
+            self.assign_homebuyers()
+        else:
+            self._restore_recursive(checkpoint)
+            self.assign_homebuyers(checkpoint.progress)
+
+    def unassigned_homebuyers(self) -> List[int]:
+        """
+        Returns the homebuyers left without a neighborhood once `assign_homebuyers` has run, e.g. 
+        because every neighborhood in their (possibly truncated) preference list is full 
+
+        Returns:
+            List[int]: The IDs of the unassigned homebuyers, in ascending order
+        """
+        return sorted(hb.entity_id for hb in self._unallocated_homebuyers)
+
+    def allocation(self) -> Iterator[Tuple[int, List[Tuple[int, int]]]]:
+        """
+        Yields the current allocation one neighborhood at a time 
+
+        Yields:
+            Tuple[int, List[Tuple[int, int]]]: The ID of a neighborhood and the (ID, score) of its 
+            homebuyers, best first. The scores are plain ints, even when the 'vectorized' scoring 
+            stored NumPy integers
+        """
+        for neighb, homebuyers in self.priority_buyers.items():
+            yield neighb, [(hb.entity_id, int(hb.neighborhood_scores[neighb])) for hb in homebuyers]
+
+    def write_output_file(self, previous_output: Union[str, IO] = None) -> None:
+        """
+        Streams the final allocation of homebuyers to neighborhoods to the output file, one 
+        neighborhood at a time. Given the output of a previous run, only the homebuyers added, 
+        removed and rescored in each neighborhood are written, as a `DeltaWriter` change log that 
+        `compact_output` applies to the previous output to rebuild the full one. Both allocations 
+        are streamed side by side in neighborhood order, so neither is held in memory as a whole
+
+        Args:
+            previous_output (Union[str, IO], optional): The path of the output of a previous run or 
+                                                        a file object open for reading. Defaults to 
+                                                        None (`previous_output` of the instance)
+
+        Raises:
+            ValueError: If the previous output is the output file itself
+        """
+        if previous_output is None:
+            previous_output = self.previous_output
+        if previous_output is None:
+            OutputWriter(self.output_path, self.output_format).write(self.allocation())
+            return
+
+        if isinstance(previous_output, str) and isinstance(self.output_path, str) and (
+            os.path.realpath(previous_output) == os.path.realpath(self.output_path)
+        ):
+            raise ValueError(f'The previous output {previous_output} cannot be overwritten by its own change log')
+        previous = OutputReader(previous_output).read()
+        DeltaWriter(self.output_path, self.output_format).write(diff_allocations(previous, self.allocation()))
+
+    def execute(self) -> ExecutionStats:
         """
         Executes the full algorithm to match homebuyers with neighborhoods based on preferences 
         and scores
+
+        Returns:
+            ExecutionStats: The `stats` of the run, with each stage measured, or None when the 
+            instrumentation is disabled
+        """
+        return self._run_stages(self.assign_homebuyers)
+
+    def resume(self) -> ExecutionStats:
+        """
+        Executes the full algorithm like `execute`, but continues the assignment from the last 
+        checkpoint of an interrupted run, see `resume_homebuyers` 
+
+        Returns:
+            ExecutionStats: The `stats` of the run, with each stage measured, or None when the 
+            instrumentation is disabled. The counters of the 'recursive' engine only cover the resumed passes
+
+        Raises:
+            ValueError: If no `checkpoint_path` is set
+        """
+        if self._checkpoint is None:
+            raise ValueError('Resuming requires a checkpoint_path')
+        return self._run_stages(self.resume_homebuyers)
+
+    def _run_stages(self, assign) -> ExecutionStats:
+        """
+        Runs the four stages, measured when `stats` is set, with the given assignment stage
         """
-        self.read_input_file()
-        self.initialize_algorithm()
-        self.assign_homebuyers()
-        self.write_output_file()
+        for stage, run in zip(ExecutionStats.STAGES, (
+            self.read_input_file, 
+            self.initialize_algorithm, 
+            assign,
+            self.write_output_file,
+        )):
+            if self.stats is None:
+                run()
+            else:
+                with self.stats.stage(stage):
+                    run()
+        return self.stats
@@ -0,0 +1,207 @@
+from array import array
+from operator import itemgetter
+from typing import Dict, Iterable, Mapping, Sequence
+
+
+class RankedIndex:
+    """
+    The homebuyers ranking each neighborhood, sorted once by score for the 'recursive' engine
+
+    For each neighborhood, `order` lists the rows of the homebuyers ranking it, best first: by
+    descending score, ties broken by lowest homebuyer ID. Each (neighborhood, priority) group holds
+    the positions in `order` of the homebuyers ranking the neighborhood at that priority, in
+    ascending order, so a group is already sorted by score. The engine walks the groups and keeps
+    the candidates of a neighborhood as positions, and comparing two positions compares the scores
+    and IDs of the two homebuyers
+
+    Every part is a flat array, saved as is in a `Snapshot` and loaded back without copying
+
+    Attributes:
+        order (array): The rows of the homebuyers ranking each neighborhood, best first,
+                       neighborhood after neighborhood
+        order_offsets (array): Neighborhood `n`'s rows are `order[order_offsets[n]:order_offsets[n + 1]]`
+        group_keys (array): The (neighborhood ID, priority) of each group, flattened
+        group_offsets (array): Group `g`'s positions are `positions[group_offsets[g]:group_offsets[g + 1]]`
+        positions (array): The positions in `order` of the homebuyers of each group, group after group
+        homebuyer_count (int): The number of homebuyers the index was built for
+    """
+    SECTIONS = ('shape', 'order', 'order_offsets', 'group_keys', 'group_offsets', 'positions')
+
+    def __init__(
+        self,
+        homebuyer_count: int,
+        order: Sequence[int],
+        order_offsets: Sequence[int],
+        group_keys: Sequence[int],
+        group_offsets: Sequence[int],
+        positions: Sequence[int],
+    ) -> None:
+        """
+        Initialize the index from its arrays, see `build`
+        """
+        self.homebuyer_count = homebuyer_count
+        self.order = order
+        self.order_offsets = order_offsets
+        self.group_keys = group_keys
+        self.group_offsets = group_offsets
+        self.positions = positions
+        self._groups = {
+            (group_keys[2 * group], group_keys[2 * group + 1]): group for group in range(len(group_offsets) - 1)
+        }
+
+    @property
+    def neighborhood_count(self) -> int:
+        return len(self.order_offsets) - 1
+
+    @classmethod
+    def build(
+        cls,
+        preferences: Sequence[Sequence[int]],
+        scores: Sequence[Mapping[int, int]],
+        tie_breakers: Sequence[int],
+        neighborhood_count: int = None,
+    ) -> 'RankedIndex':
+        """
+        Sorts the homebuyers ranking each neighborhood, in O(P log P) for P preferences in total
+
+        Args:
+            preferences (Sequence[Sequence[int]]): The neighborhood IDs ranked by each homebuyer, by row
+            scores (Sequence[Mapping[int, int]]): The scores of each homebuyer, indexed by neighborhood ID
+            tie_breakers (Sequence[int]): The ID of each homebuyer, the lowest wins a tie
+            neighborhood_count (int, optional): The number of neighborhoods, the preferences for other
+                                                IDs are ignored. Defaults to None (the highest ranked
+                                                ID + 1)
+
+        Returns:
+            RankedIndex: The index
+        """
+        if neighborhood_count is None:
+            neighborhood_count = max((max(ids) + 1 for ids in preferences if len(ids)), default=0)
+
+        entries = [[] for _ in range(neighborhood_count)]
+        for row, ids in enumerate(preferences):
+            row_scores, tie_breaker = scores[row], tie_breakers[row]
+            for priority, neighb in enumerate(ids):
+                if 0 <= neighb < neighborhood_count:
+                    entries[neighb].append((-row_scores[neighb], tie_breaker, row, priority))
+
+        order, order_offsets = array('i'), array('q', [0])
+        groups: Dict[tuple, list] = {}
+        for neighb, neighborhood_entries in enumerate(entries):
+            neighborhood_entries.sort()
+            start = len(order)
+            order.extend(map(itemgetter(2), neighborhood_entries))
+            order_offsets.append(len(order))
+            for position, entry in enumerate(neighborhood_entries, start):
+                groups.setdefault((neighb, entry[3]), []).append(position)
+            entries[neighb] = None
+
+        group_keys, group_offsets, positions = array('q'), array('q', [0]), array('i')
+        for key in sorted(groups):
+            group_keys.extend(key)
+            positions.extend(groups[key])
+            group_offsets.append(len(positions))
+        return cls(len(preferences), order, order_offsets, group_keys, group_offsets, positions)
+
+    @classmethod
+    def from_homebuyers(cls, homebuyers: Iterable, neighborhood_count: int = None) -> 'RankedIndex':
+        """
+        Builds the index of HomeBuyer objects or views of an `EntityStore`, whose rows are their
+        positions in `homebuyers`
+
+        Args:
+            homebuyers (Iterable): The scored homebuyers
+            neighborhood_count (int, optional): The number of neighborhoods. Defaults to None
+
+        Returns:
+            RankedIndex: The index
+        """
+        homebuyers = list(homebuyers)
+        return cls.build(
+            [hb.get_priority_ids() for hb in homebuyers],
+            [hb.neighborhood_scores for hb in homebuyers],
+            [hb.entity_id for hb in homebuyers],
+            neighborhood_count,
+        )
+
+    @classmethod
+    def from_store(cls, store) -> 'RankedIndex':
+        """
+        Builds the index of an `EntityStore`, read straight from its columns
+
+        Args:
+            store (EntityStore): The parsed entities
+
+        Returns:
+            RankedIndex: The index
+        """
+        return cls.build(
+            store.priority_rows, store.score_rows, store.homebuyer_columns['entity_id'], store.neighborhood_count
+        )
+
+    def fits(self, homebuyer_count: int, neighborhood_count: int) -> bool:
+        """
+        Returns:
+            bool: True if the index was built for as many homebuyers and neighborhoods
+        """
+        return (self.homebuyer_count, self.neighborhood_count) == (homebuyer_count, neighborhood_count)
+
+    def ranked_at(self, neighborhood_id: int, priority: int) -> Sequence[int]:
+        """
+        Returns:
+            Sequence[int]: The positions in `order` of the homebuyers ranking the neighborhood at the
+            given priority, best first
+        """
+        group = self._groups.get((neighborhood_id, priority))
+        if group is None:
+            return ()
+        return self.positions[self.group_offsets[group]:self.group_offsets[group + 1]]
+
+    def positions_of(self, neighborhood_id: int, rows: Sequence[int]) -> list:
+        """
+        Returns:
+            list: The positions in `order` of the given homebuyers ranking the neighborhood, best first
+        """
+        if not rows:
+            return []
+        start, end = self.order_offsets[neighborhood_id], self.order_offsets[neighborhood_id + 1]
+        positions = {row: position for position, row in enumerate(self.order[start:end], start)}
+        return sorted(positions[row] for row in rows)
+
+    def sections(self) -> Dict[str, Sequence[int]]:
+        """
+        Returns:
+            Dict[str, Sequence[int]]: The arrays of the index by name, as saved in a `Snapshot`
+        """
+        return {
+            'shape': array('q', [self.homebuyer_count, self.neighborhood_count]),
+            'order': self.order,
+            'order_offsets': self.order_offsets,
+            'group_keys': self.group_keys,
+            'group_offsets': self.group_offsets,
+            'positions': self.positions,
+        }
+
+    @classmethod
+    def from_sections(cls, sections: Mapping[str, Sequence[int]]) -> 'RankedIndex':
+        """
+        Rebuilds an index from the arrays of `sections`, which are used without being copied
+
+        Args:
+            sections (Mapping[str, Sequence[int]]): The arrays by name
+
+        Returns:
+            RankedIndex: The index
+
+        Raises:
+            KeyError: If an array is missing
+            ValueError: If the arrays do not fit together
+        """
+        shape, order, order_offsets = sections['shape'], sections['order'], sections['order_offsets']
+        group_keys, group_offsets, positions = sections['group_keys'], sections['group_offsets'], sections['positions']
+        if (
+            len(shape) != 2 or len(order_offsets) != shape[1] + 1 or order_offsets[-1] != len(order)
+            or len(group_keys) != 2 * (len(group_offsets) - 1) or group_offsets[-1] != len(positions)
+        ):
+            raise ValueError('The arrays of the ranked index do not fit together')
+        return cls(shape[0], order, order_offsets, group_keys, group_offsets, positions)
@@ -0,0 +1,267 @@
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from operator import mul
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from algorithm._optional import import_numpy
+from algorithm.deferred_acceptance import DeferredAcceptance
+from entities import EntityStore
+from entities.attributes import DEFAULT_SCHEMA, AttributeSchema
+from entities.reader import BulkReader
+
+
+class Scenario(NamedTuple):
+    """
+    A variant of the allocation
+
+    Attributes:
+        name (str): The name of the scenario, used in the results
+        weights (Tuple[int, ...]): The weight of each attribute's product in the scores, in the order of
+                                   the schema, e.g. (1, 1, 2) to count resilience double. None
+                                   weighs every attribute 1
+        capacities (Dict[int, int]): Maps neighborhood IDs to their capacity, the other neighborhoods
+                                     keep the default `len(homebuyers) // len(neighborhoods)`
+    """
+    name: str
+    weights: Optional[Tuple[int, ...]] = None
+    capacities: Optional[Dict[int, int]] = None
+
+
+class ScenarioResult(NamedTuple):
+    """
+    The allocation of one scenario
+
+    Attributes:
+        name (str): The name of the scenario
+        allocation (dict): Maps each neighborhood ID to the IDs of its homebuyers, best first
+        unassigned (list): The IDs of the homebuyers left without a neighborhood, in ascending order
+        moved (dict): Maps the ID of each homebuyer placed differently than in the baseline to its
+                      (baseline, scenario) neighborhood IDs, -1 meaning unassigned
+    """
+    name: str
+    allocation: Dict[int, List[int]]
+    unassigned: List[int]
+    moved: Dict[int, Tuple[int, int]]
+
+
+_shared = {}
+
+
+def _load_shared(priorities: array, offsets: array, tie_breakers: array) -> None:
+    """
+    Rebuilds the preference lists once per worker process, they are shared by all its scenarios
+    """
+    _shared['offsets'] = offsets
+    _shared['tie_breakers'] = tie_breakers
+    _shared['preferences'] = [priorities[offsets[row]:offsets[row + 1]].tolist() for row in range(len(offsets) - 1)]
+
+
+def _allocate_scenario(scores: array, capacities: List[int]) -> Tuple[List[List[int]], List[int]]:
+    """
+    Runs the `DeferredAcceptance` engine on one scenario, in a worker process
+
+    Args:
+        scores (array): The scores of every homebuyer for its ranked neighborhoods, in the layout
+                        of `EntityStore.priorities`
+        capacities (List[int]): The capacity of each neighborhood
+
+    Returns:
+        Tuple[List[List[int]], List[int]]: For each neighborhood, its homebuyer rows best first, and
+        for each homebuyer row, the neighborhood holding it or -1
+    """
+    offsets, preferences = _shared['offsets'], _shared['preferences']
+    rows = [
+        dict(zip(ranked, scores[offsets[row]:offsets[row + 1]])) for row, ranked in enumerate(preferences)
+    ]
+    engine = DeferredAcceptance(preferences, rows, _shared['tie_breakers'], capacities)
+    return engine.run(), engine.assigned
+
+
+class ScenarioRunner:
+    """
+    Runs many variants of the allocation on entities loaded once
+
+    The scores of every scenario are only computed for the neighborhoods each homebuyer ranked. The
+    attribute products of these (homebuyer, neighborhood) pairs are computed once, then the scores
+    of all the scenarios come out of a single (pairs x D) by (D x K) product, D being the number of
+    attributes of the store's schema, with NumPy when the 'vectorized' scoring is used. The
+    allocations run with the `DeferredAcceptance` engine across a pool of worker processes, which
+    receive the preference lists once
+
+    Attributes:
+        store (EntityStore): The entities shared by all the scenarios
+        workers (int): The number of worker processes
+        scoring (str): How the scores are computed, one of `SCORINGS`
+    """
+    SCORINGS = ('python', 'vectorized')
+
+    def __init__(self, store: EntityStore, workers: int = None, scoring: str = 'python') -> None:
+        """
+        Initializes the runner with the entities of a store
+
+        Args:
+            store (EntityStore): The entities shared by all the scenarios
+            workers (int, optional): The number of worker processes. Defaults to None (the number
+                                     of CPUs)
+            scoring (str, optional): Either 'python' or 'vectorized' (NumPy). Defaults to 'python'
+
+        Raises:
+            ValueError: If the scoring is not one of `SCORINGS`
+        """
+        if scoring not in self.SCORINGS:
+            raise ValueError(f'Unknown scoring {scoring!r}, expected one of {self.SCORINGS}')
+
+        self.store = store
+        self.workers = workers or os.cpu_count() or 1
+        self.scoring = scoring
+        self._products = None
+
+    @classmethod
+    def from_file(cls, file_path: str, schema: AttributeSchema = DEFAULT_SCHEMA, **kwargs) -> 'ScenarioRunner':
+        """
+        Parses an input file once with the `BulkReader`
+
+        Args:
+            file_path (str): The path of the input file
+            schema (AttributeSchema, optional): The attributes of the entities. Defaults to energy,
+                                                water and resilience
+            **kwargs: Keyword arguments for `ScenarioRunner`
+
+        Returns:
+            ScenarioRunner: A runner over the file's entities
+
+        Raises:
+            InputFormatError: If a line is malformed
+        """
+        return cls(BulkReader(file_path, schema=schema).read(), **kwargs)
+
+    def _attribute_products(self) -> List[array]:
+        """
+        Returns, for each attribute, the product of the homebuyer's and the neighborhood's values for
+        every ranked (homebuyer, neighborhood) pair, in the layout of `EntityStore.priorities`. They
+        are computed on the first call only. The ranked neighborhood IDs are also the rows of the
+        neighborhood columns, see `EntityStore`
+        """
+        if self._products is None:
+            store, offsets = self.store, self.store.priority_offsets
+            rows = [row for row in range(store.homebuyer_count) for _ in range(offsets[row + 1] - offsets[row])]
+            self._products = [
+                array('q', (
+                    buyer_column[row] * neighborhood_column[neighb]
+                    for row, neighb in zip(rows, store.priorities)
+                ))
+                for buyer_column, neighborhood_column in zip(
+                    store.attribute_columns(store.homebuyer_columns),
+                    store.attribute_columns(store.neighborhood_columns),
+                )
+            ]
+        return self._products
+
+    def weights(self, scenario: Scenario) -> Tuple[int, ...]:
+        """
+        Returns:
+            Tuple[int, ...]: The weight of each attribute in the scenario
+
+        Raises:
+            ValueError: If the scenario does not give one weight per attribute of the schema
+        """
+        if scenario.weights is None:
+            return (1,) * len(self.store.schema)
+        if len(scenario.weights) != len(self.store.schema):
+            raise ValueError(
+                f'Scenario {scenario.name!r} has {len(scenario.weights)} weights for {len(self.store.schema)} attributes'
+            )
+        return tuple(scenario.weights)
+
+    def scores(self, scenarios: Sequence[Scenario]) -> List[array]:
+        """
+        Computes the scores of all the scenarios at once
+
+        Args:
+            scenarios (Sequence[Scenario]): The scenarios
+
+        Returns:
+            List[array]: For each scenario, the scores of every homebuyer for its ranked
+            neighborhoods, in the layout of `EntityStore.priorities`
+
+        Raises:
+            ValueError: If a scenario does not give one weight per attribute of the schema
+        """
+        weights = [self.weights(scenario) for scenario in scenarios]
+        products = self._attribute_products()
+        if self.scoring == 'vectorized':
+            np = import_numpy('ScenarioRunner')
+            weights = np.array(weights, dtype=np.int64)
+            matrix = np.column_stack([np.frombuffer(product, dtype=np.int64) for product in products])
+            scores = (matrix @ weights.T).T
+            return [array('q', np.ascontiguousarray(row).tobytes()) for row in scores]
+
+        return [
+            array('q', (sum(map(mul, scenario_weights, values)) for values in zip(*products)))
+            for scenario_weights in weights
+        ]
+
+    def capacities(self, scenario: Scenario) -> List[int]:
+        """
+        Returns:
+            List[int]: The capacity of each neighborhood in the scenario
+
+        Raises:
+            ValueError: If the scenario sets the capacity of a neighborhood that is not in the store
+        """
+        limit = self.store.homebuyer_count // max(self.store.neighborhood_count, 1)
+        capacities = [limit] * self.store.neighborhood_count
+        for neighb, capacity in (scenario.capacities or {}).items():
+            if not 0 <= neighb < len(capacities):
+                raise ValueError(f'Scenario {scenario.name!r} sets the capacity of an unknown neighborhood N{neighb}')
+            capacities[neighb] = capacity
+        return capacities
+
+    def run(self, scenarios: Sequence[Scenario], baseline: Scenario = Scenario('baseline')) -> List[ScenarioResult]:
+        """
+        Allocates the baseline and every scenario
+
+        Args:
+            scenarios (Sequence[Scenario]): The scenarios
+            baseline (Scenario, optional): The scenario the others are compared with. Defaults to
+                                           the original weights and capacities
+
+        Returns:
+            List[ScenarioResult]: The result of the baseline, then of each scenario
+
+        Raises:
+            ValueError: If a scenario has invalid weights or capacities
+        """
+        scenarios = [baseline, *scenarios]
+        store = self.store
+        shared = (store.priorities, store.priority_offsets, store.homebuyer_columns['entity_id'])
+        scores = self.scores(scenarios)
+        capacities = [self.capacities(scenario) for scenario in scenarios]
+        with ProcessPoolExecutor(
+            max_workers=min(self.workers, len(scenarios)), initializer=_load_shared, initargs=shared,
+        ) as executor:
+            outcomes = list(executor.map(_allocate_scenario, scores, capacities))
+        baseline_assigned = outcomes[0][1]
+        return [
+            self._result(scenario, allocation, assigned, baseline_assigned)
+            for scenario, (allocation, assigned) in zip(scenarios, outcomes)
+        ]
+
+    def _result(
+        self, scenario: Scenario, allocation: List[List[int]], assigned: List[int], baseline: List[int]
+    ) -> ScenarioResult:
+        """
+        Builds the result of a scenario from the rows held by each neighborhood and the neighborhood
+        of each row, compared with the neighborhood of each row in the baseline
+        """
+        entity_ids = self.store.homebuyer_columns['entity_id']
+        return ScenarioResult(
+            name=scenario.name,
+            allocation={neighb: [entity_ids[row] for row in rows] for neighb, rows in enumerate(allocation)},
+            unassigned=sorted(entity_ids[row] for row, neighb in enumerate(assigned) if neighb == -1),
+            moved={
+                entity_ids[row]: (before, after)
+                for row, (before, after) in enumerate(zip(baseline, assigned)) if before != after
+            },
+        )
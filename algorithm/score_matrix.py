@@ -0,0 +1,130 @@
+from typing import Dict, List
+
+from algorithm._optional import import_numpy
+from entities import EntityStore, HomeBuyer, Neighborhood
+from entities.attributes import DEFAULT_SCHEMA, AttributeSchema
+
+
+class ScoreMatrix:
+    """
+    Dense H x N matrix with the score of every homebuyer for every neighborhood, computed with NumPy 
+
+    The homebuyers' attribute vectors are stacked in an (H x D) array and the neighborhoods' ones in
+    an (N x D) array in the order of their IDs, D being the number of attributes of the schema, so 
+    all the scores come out of a single matrix product. The product is computed in blocks of 
+    `chunk_size` rows, which keeps the temporary arrays bounded regardless of H 
+
+    Attributes:
+        matrix (numpy.ndarray): The (H x N) score matrix, row `i` belongs to the i-th homebuyer and 
+                                column `j` to the neighborhood with ID `j` 
+        chunk_size (int): The number of homebuyer rows multiplied at a time 
+    """
+    def __init__(self, buyer_attributes, neighborhood_attributes, chunk_size: int = 65536) -> None:
+        """
+        Computes the score matrix from the attribute arrays
+
+        Args:
+            buyer_attributes (numpy.ndarray): The (H x D) homebuyers' attributes, in row order 
+            neighborhood_attributes (numpy.ndarray): The (N x D) neighborhoods' attributes, in ID order 
+            chunk_size (int, optional): The number of rows multiplied at a time. Defaults to 65536
+        """
+        np = import_numpy('ScoreMatrix')
+        self.chunk_size = chunk_size
+
+        self.matrix = np.empty((len(buyer_attributes), len(neighborhood_attributes)), dtype=np.int64)
+        for start in range(0, len(buyer_attributes), chunk_size):
+            stop = start + chunk_size
+            np.matmul(buyer_attributes[start:stop], neighborhood_attributes.T, out=self.matrix[start:stop])
+
+    @classmethod
+    def from_entities(
+        cls,
+        homebuyers: List[HomeBuyer],
+        neighborhoods: Dict[int, Neighborhood],
+        chunk_size: int = 65536,
+        schema: AttributeSchema = DEFAULT_SCHEMA,
+    ) -> 'ScoreMatrix':
+        """
+        Builds the attribute arrays from the vectors of Neighborhood and HomeBuyer objects and 
+        computes the matrix
+
+        Args:
+            homebuyers (List[HomeBuyer]): The homebuyers, in row order 
+            neighborhoods (Dict[int, Neighborhood]): Maps the neighborhood IDs (0..N-1) to Neighborhood objects 
+            chunk_size (int, optional): The number of rows multiplied at a time. Defaults to 65536
+            schema (AttributeSchema, optional): The attributes of the entities. Defaults to energy, 
+                                                water and resilience
+
+        Returns:
+            ScoreMatrix: The score matrix of the entities
+        """
+        np = import_numpy('ScoreMatrix')
+
+        def stack(entities: list):
+            vectors = b''.join(entity.attributes.tobytes() for entity in entities)
+            return np.frombuffer(vectors, dtype=np.int64).reshape(len(entities), len(schema))
+
+        neighborhoods = [neighborhoods[idx] for idx in range(len(neighborhoods))]
+        return cls(stack(homebuyers), stack(neighborhoods), chunk_size)
+
+    @classmethod
+    def from_store(cls, store: EntityStore, chunk_size: int = 65536) -> 'ScoreMatrix':
+        """
+        Builds the attribute arrays straight from the columns of an `EntityStore` and computes the 
+        matrix. The store's neighborhood rows are their IDs (see `EntityStore`), so its columns are 
+        already in ID order
+
+        Args:
+            store (EntityStore): The store holding the entities 
+            chunk_size (int, optional): The number of rows multiplied at a time. Defaults to 65536
+
+        Returns:
+            ScoreMatrix: The score matrix of the store's entities
+        """
+        np = import_numpy('ScoreMatrix')
+
+        def stack(columns: dict):
+            return np.column_stack([np.frombuffer(column, dtype=np.int64) for column in store.attribute_columns(columns)])
+
+        return cls(stack(store.homebuyer_columns), stack(store.neighborhood_columns), chunk_size)
+
+    @classmethod
+    def from_buffer(cls, buffer, rows: int, columns: int) -> 'ScoreMatrix':
+        """
+        Wraps scores that were already computed, e.g. memory-mapped from a `Snapshot`, without copying them
+
+        Args:
+            buffer: A buffer holding the (rows x columns) int64 scores in row-major order 
+            rows (int): The number of homebuyers 
+            columns (int): The number of neighborhoods 
+
+        Returns:
+            ScoreMatrix: The score matrix over the buffer
+        """
+        np = import_numpy('ScoreMatrix')
+        score_matrix = cls.__new__(cls)
+        score_matrix.chunk_size = 65536
+        score_matrix.matrix = np.frombuffer(buffer, dtype=np.int64).reshape(rows, columns)
+        return score_matrix
+
+    def row(self, index: int):
+        """
+        Returns a view over the scores of a homebuyer, indexable by neighborhood ID
+
+        Args:
+            index (int): The row of the homebuyer 
+
+        Returns:
+            numpy.ndarray: A view over the homebuyer's row, no data is copied 
+        """
+        return self.matrix[index]
+
+    def assign_to(self, homebuyers: List[HomeBuyer]) -> None:
+        """
+        Points the `neighborhood_scores` of each homebuyer to its row of the matrix 
+
+        Args:
+            homebuyers (List[HomeBuyer]): The homebuyers, in the same order used to build the matrix
+        """
+        for index, homebuyer in enumerate(homebuyers):
+            homebuyer.neighborhood_scores = self.row(index)
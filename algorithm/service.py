@@ -0,0 +1,495 @@
+"""
+Long-running allocation service, keeping a parsed and allocated input in memory
+
+Clients send one JSON request per line and receive one JSON response per line, over a localhost TCP
+port or a Unix socket. Each request has an "op":
+
+    {"op": "lookup", "homebuyer": 5}                 where a homebuyer lands
+    {"op": "neighborhood", "neighborhood": 0}        the homebuyers of a neighborhood
+    {"op": "add", "line": "H H12 E:1 W:1 R:1 N0>N1"} adds a homebuyer
+    {"op": "remove", "homebuyer": 3}                 removes a homebuyer
+    {"op": "update", "line": "N N0 E:1 W:2 R:3"}     changes the attributes of a neighborhood
+    {"op": "what_if", "changes": [...]}              the homebuyers the changes would move
+    {"op": "health"} / {"op": "metrics"}             status, sizes, counters and latencies
+
+Usage:
+    python -m algorithm.service data/input.txt --engine deferred_acceptance --port 8765
+    python -m algorithm.service --port 8765 --query '{"op": "lookup", "homebuyer": 5}'
+"""
+import argparse
+import asyncio
+import copy
+import json
+import socket
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from algorithm.place_homebuyers_in_neighborhood import PlaceHomeBuyersInNeighborhoods
+from entities import HomeBuyer, Neighborhood
+from entities.attributes import DEFAULT_SCHEMA, AttributeSchema
+
+
+class LatencyStats:
+    """
+    Counts the requests of one kind and keeps the latencies of the most recent ones
+
+    Attributes:
+        count (int): The number of requests
+        errors (int): The number of requests that failed
+        latencies (deque): The latencies in seconds of the last `WINDOW` requests
+    """
+    WINDOW = 1024
+
+    def __init__(self) -> None:
+        """
+        Initialize the class setting default attributes
+        """
+        self.count = 0
+        self.errors = 0
+        self.latencies: Deque[float] = deque(maxlen=self.WINDOW)
+
+    def record(self, latency: float, ok: bool) -> None:
+        self.count += 1
+        self.errors += not ok
+        self.latencies.append(latency)
+
+    def as_dict(self) -> Dict[str, float]:
+        """
+        Returns:
+            Dict[str, float]: The counters and the mean, median, 99th percentile and maximum latency
+            of the recent requests, in milliseconds
+        """
+        latencies = sorted(self.latencies)
+        if not latencies:
+            return {'count': self.count, 'errors': self.errors}
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'mean_ms': sum(latencies) / len(latencies) * 1e3,
+            'p50_ms': latencies[len(latencies) // 2] * 1e3,
+            'p99_ms': latencies[min(len(latencies) * 99 // 100, len(latencies) - 1)] * 1e3,
+            'max_ms': latencies[-1] * 1e3,
+        }
+
+
+class AllocationService:
+    """
+    Answers queries about an allocation kept in memory and applies changes to it
+
+    Lookups are answered from an index of the allocation, rebuilt after each re-allocation. The
+    changes ('add', 'remove', 'update') received within `batch_window` seconds of each other are
+    applied together to a copy of the allocator, followed by a single re-allocation, and each client
+    gets its response once the copy has replaced the allocator. A batch whose re-allocation fails
+    leaves the allocator untouched. A 'what_if' query applies its changes with the incremental repairs
+    of the allocator, records the homebuyers they move and reverts them, leaving the allocation
+    unchanged. Everything runs on one event loop, so a query never sees a half-applied change
+
+    Changes need the 'objects' storage of the allocator, and the 'deferred_acceptance' engine makes
+    'what_if' queries cheap since only the affected neighborhoods are re-run
+
+    Attributes:
+        allocator (PlaceHomeBuyersInNeighborhoods): The allocator, with its allocation computed
+        batch_window (float): How long, in seconds, the first change of a batch waits for others
+        version (int): The number of allocations computed since the service started
+        metrics (dict): Maps each op to its `LatencyStats`
+        batches (int): The number of batches of changes applied
+        batched_changes (int): The number of changes applied in these batches
+        reallocation_time (float): The duration of the last re-allocation in seconds
+    """
+    MUTATIONS = ('add', 'remove', 'update')
+    QUERIES = ('lookup', 'neighborhood', 'what_if', 'health', 'metrics')
+    COMPACT_AFTER = 1024
+
+    def __init__(self, allocator: PlaceHomeBuyersInNeighborhoods, batch_window: float = 0.005) -> None:
+        """
+        Initializes the service with an allocator whose allocation has been computed
+
+        Args:
+            allocator (PlaceHomeBuyersInNeighborhoods): The allocator, after `assign_homebuyers`
+            batch_window (float, optional): How long, in seconds, the first change of a batch waits
+                                            for others. Defaults to 0.005
+        """
+        self.allocator = allocator
+        self.batch_window = batch_window
+        self.version = 1
+        self.metrics = {op: LatencyStats() for op in self.MUTATIONS + self.QUERIES}
+        self.batches = 0
+        self.batched_changes = 0
+        self.reallocation_time = 0.0
+        self._placement: Dict[int, Tuple[int, int, int]] = {}
+        self._pending: List[Tuple[dict, asyncio.Future]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._tombstones = 0
+        self._started = time.monotonic()
+        self._servers = []
+        self._index()
+
+    @classmethod
+    def from_file(cls, file_path: str, batch_window: float = 0.005, **options) -> 'AllocationService':
+        """
+        Parses and allocates an input file once
+
+        Args:
+            file_path (str): The path of the input file
+            batch_window (float, optional): See `AllocationService`. Defaults to 0.005
+            **options: Keyword arguments for `PlaceHomeBuyersInNeighborhoods`
+
+        Returns:
+            AllocationService: A service over the file's allocation
+        """
+        allocator = PlaceHomeBuyersInNeighborhoods(file_path, **options)
+        allocator.read_input_file()
+        allocator.initialize_algorithm()
+        allocator.assign_homebuyers()
+        return cls(allocator, batch_window)
+
+    def _index(self) -> None:
+        """
+        Maps each assigned homebuyer to its (neighborhood, rank, score)
+        """
+        self._placement = {
+            entity_id: (neighb, rank, score)
+            for neighb, homebuyers in self.allocator.allocation()
+            for rank, (entity_id, score) in enumerate(homebuyers, 1)
+        }
+
+    def _copy_allocator(self) -> PlaceHomeBuyersInNeighborhoods:
+        """
+        Returns:
+            PlaceHomeBuyersInNeighborhoods: A shallow copy of the allocator with its own `homebuyers` 
+            and `neighborhoods` dicts, which can be changed without touching the current allocation
+        """
+        allocator = copy.copy(self.allocator)
+        allocator.homebuyers = dict(self.allocator.homebuyers)
+        allocator.neighborhoods = dict(self.allocator.neighborhoods)
+        return allocator
+
+    def _reallocate(self, allocator: PlaceHomeBuyersInNeighborhoods) -> None:
+        """
+        Runs the whole allocation on a copy of the allocator (see `_copy_allocator`), which then 
+        replaces the allocator, and rebuilds the index. If it fails, the error is raised and the 
+        service keeps its allocator and allocation
+
+        Args:
+            allocator (PlaceHomeBuyersInNeighborhoods): The copy, with the changes applied
+        """
+        start = time.perf_counter()
+        allocator.initialize_algorithm()
+        allocator.assign_homebuyers()
+        self.allocator = allocator
+        self._index()
+        self._tombstones = 0
+        self.version += 1
+        self.reallocation_time = time.perf_counter() - start
+
+    async def handle(self, request: dict) -> dict:
+        """
+        Answers one request
+
+        Args:
+            request (dict): The decoded request, with its "op"
+
+        Returns:
+            dict: The response, with "ok" set to False and an "error" when the request failed
+        """
+        start = time.perf_counter()
+        op = request.get('op') if isinstance(request, dict) else None
+        try:
+            if op in self.MUTATIONS:
+                response = await self._mutate(request)
+            elif op in self.QUERIES:
+                response = getattr(self, f'_{op}')(request)
+            else:
+                raise ValueError(f'Unknown op {op!r}')
+        except (KeyError, ValueError, IndexError, TypeError) as error:
+            response = {'ok': False, 'error': f'{type(error).__name__}: {error}'}
+        if op in self.metrics:
+            self.metrics[op].record(time.perf_counter() - start, response['ok'])
+        return response
+
+    def _lookup(self, request: dict) -> dict:
+        entity_id = int(request['homebuyer'])
+        if entity_id not in self.allocator.homebuyers:
+            raise KeyError(f'Unknown homebuyer H{entity_id}')
+        neighb, rank, score = self._placement.get(entity_id, (None, None, None))
+        return {'ok': True, 'homebuyer': entity_id, 'neighborhood': neighb, 'rank': rank, 'score': score}
+
+    def _neighborhood(self, request: dict) -> dict:
+        neighb = int(request['neighborhood'])
+        homebuyers = [
+            [hb.entity_id, int(hb.neighborhood_scores[neighb])] for hb in self.allocator.priority_buyers[neighb]
+        ]
+        return {'ok': True, 'neighborhood': neighb, 'homebuyers': homebuyers}
+
+    def _health(self, request: dict) -> dict:
+        return {
+            'ok': True,
+            'status': 'ok',
+            'version': self.version,
+            'homebuyers': len(self.allocator.homebuyers),
+            'neighborhoods': len(self.allocator.neighborhoods),
+            'unassigned': len(self.allocator.unassigned_homebuyers()),
+            'pending_changes': len(self._pending),
+            'uptime': time.monotonic() - self._started,
+        }
+
+    def _metrics(self, request: dict) -> dict:
+        return {
+            'ok': True,
+            'ops': {op: stats.as_dict() for op, stats in self.metrics.items()},
+            'batches': self.batches,
+            'batched_changes': self.batched_changes,
+            'reallocation_ms': self.reallocation_time * 1e3,
+        }
+
+    def _check_mutable(self) -> None:
+        """
+        Raises:
+            ValueError: If the entities are kept in the 'columnar' storage, which is append-only
+        """
+        if self.allocator.store is not None:
+            raise ValueError("Changes need the 'objects' storage")
+
+    async def _mutate(self, request: dict) -> dict:
+        """
+        Queues a change for the next batch and waits for the re-allocation that includes it
+        """
+        self._check_mutable()
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((request, future))
+        if self._flush_task is None:
+            self._flush_task = asyncio.ensure_future(self._flush())
+        return await future
+
+    async def _flush(self) -> None:
+        """
+        Applies the changes queued during the batch window, then re-allocates once. If the 
+        re-allocation fails, every change of the batch gets the error and lookups keep answering 
+        from the previous allocation, so no client is left waiting
+        """
+        await asyncio.sleep(self.batch_window)
+        batch, self._pending, self._flush_task = self._pending, [], None
+        allocator = self._copy_allocator()
+        responses = []
+        for request, _ in batch:
+            try:
+                self._apply(allocator, request)
+                responses.append({'ok': True})
+            except (KeyError, ValueError, IndexError, TypeError) as error:
+                responses.append({'ok': False, 'error': f'{type(error).__name__}: {error}'})
+
+        applied = sum(response['ok'] for response in responses)
+        if applied:
+            try:
+                self._reallocate(allocator)
+            except Exception as error:
+                failure = f'Re-allocation failed, {type(error).__name__}: {error}'
+                responses = [{'ok': False, 'error': failure} if response['ok'] else response for response in responses]
+                applied = 0
+            else:
+                self.batches += 1
+                self.batched_changes += applied
+        for (_, future), response in zip(batch, responses):
+            if response['ok']:
+                response.update(version=self.version, batch_size=applied)
+            if not future.done():
+                future.set_result(response)
+
+    def _apply(self, allocator: PlaceHomeBuyersInNeighborhoods, request: dict) -> None:
+        """
+        Applies a change to the entities of a copy of the allocator without re-allocating. A 
+        neighborhood update rescores copies of the homebuyers, whose scores the allocator shares
+
+        Args:
+            allocator (PlaceHomeBuyersInNeighborhoods): The copy, see `_copy_allocator`
+            request (dict): The change
+
+        Raises:
+            KeyError: If the homebuyer or neighborhood does not exist
+            ValueError: If a homebuyer with the same ID exists, a new homebuyer ranks an unknown 
+                        neighborhood or a line is malformed
+        """
+        homebuyers, neighborhoods = allocator.homebuyers, allocator.neighborhoods
+        if request['op'] == 'add':
+            homebuyer = HomeBuyer.create_from_string(request['line'], allocator.schema)
+            if homebuyer.entity_id in homebuyers:
+                raise ValueError(f'Homebuyer H{homebuyer.entity_id} already exists')
+            HomeBuyer.check_priority_ids(homebuyer.get_priority_ids(), neighborhoods)
+            homebuyer.set_neighborhoods_score(neighborhoods)
+            homebuyers[homebuyer.entity_id] = homebuyer
+        elif request['op'] == 'remove':
+            entity_id = int(request['homebuyer'])
+            if entity_id not in homebuyers:
+                raise KeyError(f'Unknown homebuyer H{entity_id}')
+            del homebuyers[entity_id]
+        else:
+            neighborhood = Neighborhood.create_from_string(request['line'], allocator.schema)
+            if neighborhood.entity_id not in neighborhoods:
+                raise KeyError(f'Unknown neighborhood N{neighborhood.entity_id}')
+            neighborhoods[neighborhood.entity_id] = neighborhood
+            for entity_id, hb in homebuyers.items():
+                hb = homebuyers[entity_id] = copy.copy(hb)
+                hb.neighborhood_scores = hb.neighborhood_scores.copy()
+                hb.set_neighborhoods_score({neighborhood.entity_id: neighborhood})
+
+    def _what_if(self, request: dict) -> dict:
+        """
+        Applies the changes with the allocator's incremental repairs, records the homebuyers they
+        move, from and to -1 when added, removed or unassigned, and reverts them
+        """
+        self._check_mutable()
+        allocator = self.allocator
+        undo = []
+        try:
+            for change in request['changes']:
+                if change.get('op') == 'add':
+                    homebuyer = HomeBuyer.create_from_string(change['line'], allocator.schema)
+                    allocator.add_homebuyer(homebuyer)
+                    undo.append(lambda entity_id=homebuyer.entity_id: allocator.remove_homebuyer(entity_id))
+                elif change.get('op') == 'remove':
+                    homebuyer = allocator.remove_homebuyer(int(change['homebuyer']))
+                    undo.append(lambda homebuyer=homebuyer: allocator.add_homebuyer(homebuyer))
+                elif change.get('op') == 'update':
+                    neighborhood = Neighborhood.create_from_string(change['line'], allocator.schema)
+                    previous = allocator.neighborhoods.get(neighborhood.entity_id)
+                    allocator.update_neighborhood(neighborhood)
+                    undo.append(lambda previous=previous: allocator.update_neighborhood(previous))
+                else:
+                    raise ValueError(f'Unknown change {change.get("op")!r}')
+            after = {
+                entity_id: neighb for neighb, homebuyers in allocator.allocation() for entity_id, _ in homebuyers
+            }
+        finally:
+            for revert in reversed(undo):
+                revert()
+            self._tombstones += sum(change.get('op') in ('add', 'remove') for change in request['changes'])
+
+        if self._tombstones >= self.COMPACT_AFTER:
+            # Every homebuyer added or removed leaves a slot in the engine, a full run clears them
+            self._reallocate(self._copy_allocator())
+
+        before = {entity_id: placement[0] for entity_id, placement in self._placement.items()}
+        moved = {
+            str(entity_id): [before.get(entity_id, -1), after.get(entity_id, -1)]
+            for entity_id in before.keys() | after.keys()
+            if before.get(entity_id, -1) != after.get(entity_id, -1)
+        }
+        return {'ok': True, 'moved': moved}
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Answers the requests of a client, one JSON object per line, until it disconnects
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError as error:
+                    response = {'ok': False, 'error': f'Invalid JSON: {error}'}
+                else:
+                    response = await self.handle(request)
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0, path: str = None) -> Tuple:
+        """
+        Starts listening on a localhost TCP port, or on a Unix socket when `path` is set. It can be
+        called again to listen on several addresses
+
+        Args:
+            host (str, optional): The address to bind. Defaults to '127.0.0.1'
+            port (int, optional): The TCP port, 0 for any free port. Defaults to 0
+            path (str, optional): The path of a Unix socket. Defaults to None (TCP)
+
+        Returns:
+            Tuple: The address the service listens on, (host, port) or the socket path
+        """
+        if path is not None:
+            self._servers.append(await asyncio.start_unix_server(self._handle_connection, path=path))
+            return (path,)
+        self._servers.append(await asyncio.start_server(self._handle_connection, host=host, port=port))
+        return self._servers[-1].sockets[0].getsockname()[:2]
+
+    async def close(self) -> None:
+        """
+        Stops listening and applies the changes still queued
+        """
+        while self._servers:
+            server = self._servers.pop()
+            server.close()
+            await server.wait_closed()
+        if self._flush_task is not None:
+            await self._flush_task
+
+
+def send(request: dict, host: str = '127.0.0.1', port: int = None, path: str = None, timeout: float = 30.0) -> dict:
+    """
+    Sends one request to a running service and returns its response, e.g. from a scheduler
+
+    Args:
+        request (dict): The request, with its "op"
+        host (str, optional): The host of the service. Defaults to '127.0.0.1'
+        port (int, optional): The TCP port of the service
+        path (str, optional): The Unix socket of the service, used instead of the port
+        timeout (float, optional): The timeout of the connection, in seconds. Defaults to 30
+
+    Returns:
+        dict: The response
+    """
+    if path is not None:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.settimeout(timeout)
+        connection.connect(path)
+    else:
+        connection = socket.create_connection((host, port), timeout=timeout)
+    with connection, connection.makefile('rwb') as stream:
+        stream.write(json.dumps(request).encode() + b'\n')
+        stream.flush()
+        return json.loads(stream.readline())
+
+
+async def serve(service: AllocationService, host: str, port: int, path: str = None) -> None:
+    address = await service.start(host, port, path)
+    print(f'Serving {len(service.allocator.homebuyers)} homebuyers on {address}', flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await service.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', nargs='?', default='data/input.txt', help='The input file to serve')
+    parser.add_argument('--engine', choices=PlaceHomeBuyersInNeighborhoods.ENGINES, default='deferred_acceptance')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--socket', help='Listen on (or query) a Unix socket instead of a TCP port')
+    parser.add_argument('--batch-window', type=float, default=0.005, help='Seconds a change waits for others')
+    parser.add_argument('--query', help='Send one JSON request to a running service and print its response')
+    parser.add_argument(
+        '--attributes', type=AttributeSchema.parse, default=DEFAULT_SCHEMA,
+        help="The attributes of the entities as 'KEY=name' pairs, e.g. 'E=energy,W=water,R=resilience'",
+    )
+    args = parser.parse_args()
+
+    if args.query is not None:
+        print(json.dumps(send(json.loads(args.query), args.host, args.port, args.socket)))
+        return
+
+    service = AllocationService.from_file(args.input, args.batch_window, engine=args.engine, schema=args.attributes)
+    try:
+        asyncio.run(serve(service, args.host, args.port, args.socket))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+import hashlib
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import List, Tuple
+
+from algorithm.ranked_index import RankedIndex
+from algorithm.score_matrix import ScoreMatrix
+from entities import EntityStore
+from entities.attributes import DEFAULT_SCHEMA, AttributeSchema
+
+
+class SnapshotError(Exception):
+    """
+    Raised when a snapshot is missing, corrupt, written by another version or stale
+    """
+
+
+class Snapshot:
+    """
+    Compact binary snapshot of a parsed `EntityStore`, and optionally of its `ScoreMatrix` and
+    `RankedIndex`
+
+    The file starts with a header holding a magic number, the format version, the byte order, the
+    size and SHA-256 checksum of the input file it was built from and a table of sections. Each
+    section is the raw content of one of the store's arrays, aligned on 8 bytes, so loading only
+    memory-maps the file and casts the sections back, without parsing or copying anything. The
+    store's `AttributeSchema` is saved as text in the 'schema' section
+
+    Attributes:
+        file_path (str): The path of the snapshot file
+    """
+    MAGIC = b'NBHSNAP\x00'
+    VERSION = 2
+    HEADER = struct.Struct('<8sHcxQ32sI')
+    SECTION = struct.Struct('<24scxxxxxxxQQ')
+    ALIGNMENT = 8
+
+    def __init__(self, file_path: str) -> None:
+        """
+        Initialize the class setting default attributes
+        """
+        self.file_path = file_path
+
+    @staticmethod
+    def checksum(source_path: str) -> Tuple[int, bytes]:
+        """
+        Computes the size and SHA-256 digest of an input file
+
+        Args:
+            source_path (str): The path of the input file
+
+        Returns:
+            Tuple[int, bytes]: The size of the file and its digest
+        """
+        digest = hashlib.sha256()
+        with open(source_path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                digest.update(chunk)
+        return os.path.getsize(source_path), digest.digest()
+
+    @staticmethod
+    def _sections(store: EntityStore) -> List[Tuple[str, object]]:
+        """
+        Lists the arrays saved in a snapshot
+
+        Args:
+            store (EntityStore): The store to save
+
+        Returns:
+            List[Tuple[str, object]]: The name and buffer of each section
+        """
+        sections = [('schema', array('B', str(store.schema).encode()))]
+        sections += [(f'neighborhood.{name}', column) for name, column in store.neighborhood_columns.items()]
+        sections += [(f'homebuyer.{name}', column) for name, column in store.homebuyer_columns.items()]
+        sections += [('priorities', store.priorities), ('priority_offsets', store.priority_offsets)]
+        if store.score_matrix is not None:
+            sections.append(('score_matrix', memoryview(store.score_matrix.matrix).cast('B').cast('q')))
+        if store.ranked_index is not None:
+            sections += [(f'ranked.{name}', buffer) for name, buffer in store.ranked_index.sections().items()]
+        return sections
+
+    def write(self, store: EntityStore, source_path: str) -> None:
+        """
+        Writes the snapshot of a store, replacing any previous snapshot atomically
+
+        Args:
+            store (EntityStore): The store to save
+            source_path (str): The path of the input file the store was parsed from
+        """
+        size, digest = self.checksum(source_path)
+        sections = [(name, memoryview(buffer)) for name, buffer in self._sections(store)]
+        offset = self.HEADER.size + self.SECTION.size * len(sections)
+
+        table = []
+        for name, buffer in sections:
+            offset += -offset % self.ALIGNMENT
+            table.append(self.SECTION.pack(name.encode(), buffer.format.encode(), offset, len(buffer)))
+            offset += buffer.nbytes
+
+        temp_path = f'{self.file_path}.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(self.HEADER.pack(self.MAGIC, self.VERSION, sys.byteorder[0].encode(), size, digest, len(sections)))
+            file.write(b''.join(table))
+            for name, buffer in sections:
+                file.write(b'\x00' * (-file.tell() % self.ALIGNMENT))
+                file.write(buffer.cast('B'))
+        os.replace(temp_path, self.file_path)
+
+    def load(self, source_path: str, schema: AttributeSchema = DEFAULT_SCHEMA) -> EntityStore:
+        """
+        Memory-maps a snapshot back into a store
+
+        The store's columns and ranked index are read-only views over the file until the store is
+        modified. The score matrix is only restored when NumPy is installed
+
+        Args:
+            source_path (str): The path of the input file the snapshot must have been built from
+            schema (AttributeSchema, optional): The attributes the snapshot must have been built
+                                                with. Defaults to energy, water and resilience
+
+        Returns:
+            EntityStore: The store saved in the snapshot
+
+        Raises:
+            SnapshotError: If the snapshot is missing, corrupt, written by another version of the
+                           format or built from a different input file or with another schema
+        """
+        try:
+            with open(self.file_path, 'rb') as file:
+                buffer = memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+        except (OSError, ValueError) as error:
+            raise SnapshotError(f'Cannot open snapshot {self.file_path}: {error}') from error
+
+        try:
+            magic, version, byteorder, size, digest, count = self.HEADER.unpack_from(buffer)
+        except struct.error as error:
+            raise SnapshotError(f'Corrupt snapshot {self.file_path}') from error
+        if magic != self.MAGIC or version != self.VERSION or byteorder != sys.byteorder[0].encode():
+            raise SnapshotError(f'Snapshot {self.file_path} was written by another version of the format')
+        if os.path.getsize(source_path) != size or self.checksum(source_path) != (size, digest):
+            raise SnapshotError(f'Snapshot {self.file_path} is stale, {source_path} has changed')
+
+        sections = {}
+        try:
+            for idx in range(count):
+                name, typecode, offset, length = self.SECTION.unpack_from(buffer, self.HEADER.size + idx * self.SECTION.size)
+                typecode = typecode.decode()
+                itemsize = array(typecode).itemsize
+                sections[name.rstrip(b'\x00').decode()] = buffer[offset:offset + length * itemsize].cast(typecode)
+        except (struct.error, TypeError, ValueError) as error:
+            raise SnapshotError(f'Corrupt snapshot {self.file_path}') from error
+
+        if 'schema' not in sections or bytes(sections['schema']) != str(schema).encode():
+            raise SnapshotError(f'Snapshot {self.file_path} was built with other attributes than {schema}')
+
+        store = EntityStore(schema)
+        try:
+            for name in store.columns:
+                store.neighborhood_columns[name] = sections[f'neighborhood.{name}']
+                store.homebuyer_columns[name] = sections[f'homebuyer.{name}']
+            store.priorities = sections['priorities']
+            store.priority_offsets = sections['priority_offsets']
+        except KeyError as error:
+            raise SnapshotError(f'Corrupt snapshot {self.file_path}, missing section {error}') from error
+
+        if 'score_matrix' in sections:
+            try:
+                store.score_matrix = ScoreMatrix.from_buffer(
+                    sections['score_matrix'], store.homebuyer_count, store.neighborhood_count
+                )
+            except ImportError:
+                pass
+        if any(name.startswith('ranked.') for name in sections):
+            try:
+                store.ranked_index = RankedIndex.from_sections(
+                    {name: sections[f'ranked.{name}'] for name in RankedIndex.SECTIONS}
+                )
+            except (KeyError, ValueError) as error:
+                raise SnapshotError(f'Corrupt snapshot {self.file_path}, bad ranked index') from error
+            if not store.ranked_index.fits(store.homebuyer_count, store.neighborhood_count):
+                raise SnapshotError(f'Corrupt snapshot {self.file_path}, the ranked index does not fit the store')
+        return store
@@ -0,0 +1,156 @@
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, NamedTuple, Optional
+
+
+class StageStats(NamedTuple):
+    """
+    The cost of one stage of `PlaceHomeBuyersInNeighborhoods.execute`
+
+    Attributes:
+        wall_time (float): The elapsed time in seconds
+        cpu_time (float): The CPU time of the process in seconds
+        peak_memory (int): The peak memory allocated during the stage in bytes, None unless
+                           `ExecutionStats.trace_memory` is set
+    """
+    wall_time: float
+    cpu_time: float
+    peak_memory: Optional[int]
+
+
+class ExecutionStats:
+    """
+    Opt-in instrumentation of `PlaceHomeBuyersInNeighborhoods`
+
+    An allocator created with an `ExecutionStats` records the cost of each stage run by `execute`
+    and counts the work done by `assign_homebuyers`. Without it, none of this is measured
+
+    The counters mean, for the 'recursive' engine:
+        iterations: the passes of `assign_homebuyers` over the neighborhoods
+        candidates: the homebuyers examined for a neighborhood with free places
+        displacements: the homebuyers cut from a neighborhood over its limit in `_update_allocation`
+    and for the 'deferred_acceptance' engine:
+        iterations: the turns of the proposing buyers, one per free or displaced buyer
+        candidates: the proposals made to the neighborhoods
+        displacements: the held buyers displaced by a better proposal
+    The `OutOfCoreAllocator` counts its rounds of proposals as iterations, like the 'deferred_acceptance'
+    engine otherwise, and also reports its temporary files in `temp_files`, `temp_bytes_written` and
+    `temp_bytes_read`
+
+    Attributes:
+        stages (dict): Maps each stage ('read', 'initialize', 'assign', 'write') to its `StageStats`
+        iterations (int): See above
+        candidates (int): See above
+        displacements (int): See above
+        temp_files (int): The number of temporary files written by the `OutOfCoreAllocator`
+        temp_bytes_written (int): The number of bytes written to these files
+        temp_bytes_read (int): The number of bytes read back from these files
+        trace_memory (bool): Whether the peak memory of each stage is measured with `tracemalloc`,
+                             which slows the stages down
+        hook (Callable[[str, ExecutionStats], None]): Called after each stage with its name and the
+                                                      stats, e.g. to log or export them
+    """
+    STAGES = ('read', 'initialize', 'assign', 'write')
+
+    def __init__(
+        self,
+        trace_memory: bool = False,
+        hook: Optional[Callable[[str, 'ExecutionStats'], None]] = None,
+    ) -> None:
+        """
+        Initializes empty stats
+
+        Args:
+            trace_memory (bool, optional): Measure the peak memory of each stage. Defaults to False
+            hook (Callable[[str, ExecutionStats], None], optional): Called after each stage.
+                                                                    Defaults to None
+        """
+        self.trace_memory = trace_memory
+        self.hook = hook
+        self.stages = dict()
+        self.iterations = 0
+        self.candidates = 0
+        self.displacements = 0
+        self.temp_files = 0
+        self.temp_bytes_written = 0
+        self.temp_bytes_read = 0
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Measures the stage run in the `with` block, then calls the hook
+
+        Args:
+            name (str): The name of the stage
+        """
+        started_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        if self.trace_memory:
+            baseline = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            peak_memory = None
+            if self.trace_memory:
+                peak_memory = tracemalloc.get_traced_memory()[1] - baseline
+                if started_tracing:
+                    tracemalloc.stop()
+            self.stages[name] = StageStats(wall, cpu, peak_memory)
+
+        if self.hook is not None:
+            self.hook(name, self)
+
+    def count(
+        self,
+        iterations: int = 0,
+        candidates: int = 0,
+        displacements: int = 0,
+        temp_files: int = 0,
+        temp_bytes_written: int = 0,
+        temp_bytes_read: int = 0,
+    ) -> None:
+        """
+        Adds to the hot-path and temporary file counters
+        """
+        self.iterations += iterations
+        self.candidates += candidates
+        self.displacements += displacements
+        self.temp_files += temp_files
+        self.temp_bytes_written += temp_bytes_written
+        self.temp_bytes_read += temp_bytes_read
+
+    def as_dict(self) -> Dict[str, object]:
+        """
+        Returns:
+            Dict[str, object]: The stats as plain values, e.g. to be dumped as JSON
+        """
+        return {
+            'stages': {name: stage._asdict() for name, stage in self.stages.items()},
+            'iterations': self.iterations,
+            'candidates': self.candidates,
+            'displacements': self.displacements,
+            'temp_files': self.temp_files,
+            'temp_bytes_written': self.temp_bytes_written,
+            'temp_bytes_read': self.temp_bytes_read,
+        }
+
+    def __str__(self) -> str:
+        lines = [f'{"stage":<10} {"wall (s)":>10} {"cpu (s)":>10} {"peak (MiB)":>11}']
+        for name, stage in self.stages.items():
+            peak = '-' if stage.peak_memory is None else f'{stage.peak_memory / 2 ** 20:.1f}'
+            lines.append(f'{name:<10} {stage.wall_time:>10.3f} {stage.cpu_time:>10.3f} {peak:>11}')
+        lines.append(
+            f'iterations: {self.iterations}, candidates: {self.candidates}, displacements: {self.displacements}'
+        )
+        if self.temp_files:
+            lines.append(
+                f'temp files: {self.temp_files}, written: {self.temp_bytes_written / 2 ** 20:.1f} MiB, '
+                f'read: {self.temp_bytes_read / 2 ** 20:.1f} MiB'
+            )
+        return '\n'.join(lines)
@@ -0,0 +1,290 @@
+"""
+Checks that an allocation respects the capacities and is stable
+
+Usage:
+    python -m algorithm.verifier data/input.txt data/output.txt
+"""
+import argparse
+import sys
+from collections.abc import Mapping
+from operator import itemgetter, mul
+from typing import IO, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from algorithm.writer import OutputReader
+from entities import EntityStore, HomeBuyer, Neighborhood
+from entities.attributes import DEFAULT_SCHEMA, AttributeSchema
+from entities.reader import BulkReader
+
+
+class Violation(NamedTuple):
+    """
+    One violation found in an allocation
+
+    Attributes:
+        kind (str): One of `AllocationVerifier.KINDS`
+        homebuyer (int): The ID of the homebuyer involved, if any
+        neighborhood (int): The ID of the neighborhood involved, if any
+        detail (str): A short explanation
+    """
+    kind: str
+    homebuyer: Optional[int]
+    neighborhood: Optional[int]
+    detail: str
+
+    def __str__(self) -> str:
+        entities = ' '.join(
+            f'{prefix}{entity_id}' for prefix, entity_id in (
+                (HomeBuyer.prefix, self.homebuyer), (Neighborhood.prefix, self.neighborhood)
+            ) if entity_id is not None
+        )
+        return f'{self.kind} {entities}: {self.detail}'
+
+
+class VerificationReport(NamedTuple):
+    """
+    The outcome of a verification
+
+    Attributes:
+        homebuyers (int): The number of homebuyers of the input
+        neighborhoods (int): The number of neighborhoods of the input
+        assigned (int): The number of homebuyers found in the allocation
+        counts (dict): Maps each kind of violation found to its number
+        examples (list): The first violations of each kind, at most `max_examples` per kind
+    """
+    homebuyers: int
+    neighborhoods: int
+    assigned: int
+    counts: Dict[str, int]
+    examples: List[Violation]
+
+    @property
+    def ok(self) -> bool:
+        return not self.counts
+
+    def __str__(self) -> str:
+        summary = f'{self.assigned} of {self.homebuyers} homebuyers assigned to {self.neighborhoods} neighborhoods'
+        if self.ok:
+            return f'OK: {summary}'
+        lines = [f'FAILED: {sum(self.counts.values())} violations, {summary}']
+        for kind, count in self.counts.items():
+            lines.append(f'  {kind}: {count}')
+            lines.extend(f'    {violation}' for violation in self.examples if violation.kind == kind)
+        return '\n'.join(lines)
+
+
+Allocation = Union[Mapping, Iterable[Tuple[int, Sequence]]]
+
+
+class AllocationVerifier:
+    """
+    Verifies an allocation against the parsed entities in near-linear time
+
+    Every homebuyer must appear at most once, in a neighborhood it ranks and with its score, and no
+    neighborhood may hold more homebuyers than its capacity. The allocation must also be stable: no
+    homebuyer may prefer a neighborhood that has a free place or holds a homebuyer it ranks below
+    it. Rather than comparing every homebuyer with every neighborhood, each full neighborhood is
+    reduced to the (score, -ID) of its weakest homebuyer, the ties being broken by lowest ID as in
+    the engines. Each homebuyer is then compared with the thresholds of the neighborhoods it ranks
+    before its own, so the check runs in O(H + N + the number of preferences examined). A homebuyer
+    is reported once, with the first neighborhood it forms a blocking pair with
+
+    The 'deferred_acceptance' engine always passes the stability check. The 'recursive' engine does
+    not look for a stable allocation and is not expected to pass it: on random inputs its allocation
+    often has blocking pairs, so only the other checks are meaningful for it
+
+    Attributes:
+        store (EntityStore): The parsed entities
+        capacities (list): For each neighborhood, the maximum number of homebuyers it can hold
+        max_examples (int): The number of violations of each kind kept in the report
+    """
+    KINDS = (
+        'unknown_neighborhood', 'unknown_homebuyer', 'duplicate', 'over_capacity', 'unranked',
+        'score_mismatch', 'blocking_pair',
+    )
+
+    def __init__(self, store: EntityStore, capacities: Sequence[int] = None, max_examples: int = 10) -> None:
+        """
+        Initializes the verifier
+
+        Args:
+            store (EntityStore): The parsed entities
+            capacities (Sequence[int], optional): The capacity of each neighborhood. Defaults to
+                                                  None (`homebuyer_count // neighborhood_count`, as
+                                                  in the allocator)
+            max_examples (int, optional): The number of violations of each kind kept in the
+                                          report. Defaults to 10
+        """
+        if capacities is None:
+            capacities = [store.homebuyer_count // max(store.neighborhood_count, 1)] * store.neighborhood_count
+        self.store = store
+        self.capacities = list(capacities)
+        self.max_examples = max_examples
+
+    @classmethod
+    def from_file(cls, input_path: str, schema: AttributeSchema = DEFAULT_SCHEMA, **kwargs) -> 'AllocationVerifier':
+        """
+        Parses the input file with the `BulkReader`
+
+        Args:
+            input_path (str): The path of the input file
+            schema (AttributeSchema, optional): The attributes of the entities. Defaults to energy,
+                                                water and resilience
+            **kwargs: Keyword arguments for `AllocationVerifier`
+
+        Returns:
+            AllocationVerifier: A verifier for the file's entities
+        """
+        return cls(BulkReader(input_path, schema=schema).read(), **kwargs)
+
+    @classmethod
+    def from_allocator(cls, allocator, **kwargs) -> 'AllocationVerifier':
+        """
+        Uses the entities of an allocator, and its capacity unless other capacities are given
+
+        Args:
+            allocator (PlaceHomeBuyersInNeighborhoods): An allocator with its input read
+            **kwargs: Keyword arguments for `AllocationVerifier`
+
+        Returns:
+            AllocationVerifier: A verifier for the allocator's entities
+        """
+        store = allocator.store
+        if store is None:
+            store = EntityStore.from_entities(allocator.neighborhoods, allocator.homebuyers, allocator.schema)
+        kwargs.setdefault('capacities', [allocator.neighb_limit] * store.neighborhood_count)
+        return cls(store, **kwargs)
+
+    @staticmethod
+    def read_output(source: Union[str, IO[str]], format: str = None) -> List[Tuple[int, List[Tuple[int, int]]]]:
+        """
+        Reads an allocation written by `OutputWriter`
+
+        Args:
+            source (Union[str, IO[str]]): The path of the output file, gzip-compressed when it ends
+                                          with '.gz', or a file object open for reading
+            format (str, optional): 'text', 'csv' or 'jsonl'. Defaults to None (guessed from the
+                                    extension, 'text' otherwise)
+
+        Returns:
+            List[Tuple[int, List[Tuple[int, int]]]]: For each neighborhood, its ID and the (ID, score)
+            of its homebuyers, in the order of the file
+        """
+        return list(OutputReader(source, format).read())
+
+    def verify(self, allocation: Allocation) -> VerificationReport:
+        """
+        Verifies an allocation
+
+        Args:
+            allocation (Allocation): For each neighborhood, its ID and its homebuyers, as (ID, score)
+                                     pairs or as IDs (the scores are then not checked), e.g. from
+                                     `read_output`, `allocation()` of an allocator, or a mapping
+                                     like `priority_buyers` with the IDs
+
+        Returns:
+            VerificationReport: The violations found
+        """
+        store = self.store
+        counts: Dict[str, int] = {}
+        examples: List[Violation] = []
+
+        def report(kind: str, homebuyer: Optional[int], neighborhood: Optional[int], detail: str) -> None:
+            counts[kind] = counts.get(kind, 0) + 1
+            if counts[kind] <= self.max_examples:
+                examples.append(Violation(kind, homebuyer, neighborhood, detail))
+
+        rows = {entity_id: row for row, entity_id in enumerate(store.homebuyer_columns['entity_id'])}
+        # The store's neighborhood rows are their IDs
+        vectors = [store.neighborhood_vector(neighb) for neighb in range(store.neighborhood_count)]
+        buyer_columns = store.attribute_columns(store.homebuyer_columns)
+        priorities, offsets = store.priorities, store.priority_offsets
+
+        def score(row: int, neighb: int) -> int:
+            return sum(map(mul, map(itemgetter(row), buyer_columns), vectors[neighb]))
+
+        # Capacities, duplicates and the neighborhood and rank of every assigned homebuyer
+        assigned = [-1] * store.homebuyer_count
+        rank = [len(priorities)] * store.homebuyer_count
+        weakest = [None] * store.neighborhood_count
+        sizes = [0] * store.neighborhood_count
+        for neighb, homebuyers in (allocation.items() if isinstance(allocation, Mapping) else allocation):
+            if not 0 <= neighb < store.neighborhood_count:
+                report('unknown_neighborhood', None, neighb, 'not in the input')
+                continue
+            for homebuyer in homebuyers:
+                entity_id, given_score = homebuyer if isinstance(homebuyer, tuple) else (homebuyer, None)
+                row = rows.get(entity_id)
+                if row is None:
+                    report('unknown_homebuyer', entity_id, neighb, 'not in the input')
+                    continue
+                if assigned[row] != -1:
+                    report('duplicate', entity_id, neighb, f'already in {Neighborhood.prefix}{assigned[row]}')
+                    continue
+                preferences = priorities[offsets[row]:offsets[row + 1]]
+                try:
+                    position = list(preferences).index(neighb)
+                except ValueError:
+                    report('unranked', entity_id, neighb, 'not in its preferences')
+                    position = len(preferences)
+                actual = score(row, neighb)
+                if given_score is not None and given_score != actual:
+                    report('score_mismatch', entity_id, neighb, f'score {given_score}, expected {actual}')
+                assigned[row], rank[row] = neighb, position
+                sizes[neighb] += 1
+                key = (actual, -entity_id)
+                if weakest[neighb] is None or key < weakest[neighb]:
+                    weakest[neighb] = key
+
+        thresholds = []
+        for neighb, (size, capacity) in enumerate(zip(sizes, self.capacities)):
+            if size > capacity:
+                report('over_capacity', None, neighb, f'{size} homebuyers for {capacity} places')
+            # None: a free place, any homebuyer ranking the neighborhood blocks
+            thresholds.append(None if size < capacity else weakest[neighb] if capacity else False)
+
+        # Blocking pairs, against the neighborhoods each homebuyer prefers to its own
+        entity_ids = store.homebuyer_columns['entity_id']
+        for row in range(store.homebuyer_count):
+            start = offsets[row]
+            end = min(offsets[row + 1], start + rank[row])
+            for position in range(start, end):
+                neighb = priorities[position]
+                threshold = thresholds[neighb]
+                if threshold is False:
+                    continue
+                if threshold is None or (score(row, neighb), -entity_ids[row]) > threshold:
+                    current = assigned[row]
+                    reason = 'has a free place' if threshold is None else 'would take it over its weakest homebuyer'
+                    where = f'ranked before {Neighborhood.prefix}{current}' if current != -1 else 'ranked by an unassigned homebuyer'
+                    report('blocking_pair', entity_ids[row], neighb, f'{reason}, {where}')
+                    break
+
+        return VerificationReport(
+            homebuyers=store.homebuyer_count,
+            neighborhoods=store.neighborhood_count,
+            assigned=sum(sizes),
+            counts={kind: counts[kind] for kind in self.KINDS if kind in counts},
+            examples=examples,
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', help='The input file')
+    parser.add_argument('output', help='The output file to verify')
+    parser.add_argument('--format', choices=('text', 'csv', 'jsonl'), help='Defaults to the extension of the output')
+    parser.add_argument('--max-examples', type=int, default=10, help='The violations listed for each kind')
+    parser.add_argument(
+        '--attributes', type=AttributeSchema.parse, default=DEFAULT_SCHEMA,
+        help="The attributes of the entities as 'KEY=name' pairs, e.g. 'E=energy,W=water,R=resilience'",
+    )
+    args = parser.parse_args()
+
+    verifier = AllocationVerifier.from_file(args.input, args.attributes, max_examples=args.max_examples)
+    report = verifier.verify(AllocationVerifier.read_output(args.output, args.format))
+    print(report)
+    sys.exit(0 if report.ok else 1)
+
+
+if __name__ == '__main__':
+    main()
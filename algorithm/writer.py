@@ -0,0 +1,220 @@
+import csv
+import gzip
+import io
+import json
+import re
+from contextlib import contextmanager
+from typing import IO, Iterable, Iterator, List, Tuple, Union
+
+from entities import HomeBuyer, Neighborhood
+
+Allocation = Iterable[Tuple[int, List[Tuple[int, int]]]]
+
+
+class OutputWriter:
+    """
+    Streams an allocation to a file, one neighborhood at a time
+
+    The allocation is consumed lazily, so the whole result is never held in memory as a single
+    string and downstream jobs can read the file while it is written. The formats are:
+        'text': the original format, one 'N{id}: H{id}({score}) ...' line per neighborhood
+        'csv': a 'neighborhood,homebuyer,score,rank' header then one row per assigned homebuyer, or
+               a row with only the neighborhood for a neighborhood without homebuyers
+        'jsonl': one JSON object per neighborhood, e.g.
+                 {"neighborhood": "N0", "homebuyers": [{"homebuyer": "H5", "score": 161}]}
+
+    Attributes:
+        destination (Union[str, IO]): The path of the output file, or a file object open for
+                                      writing (in text mode, or binary mode when compressed)
+        format (str): The output format, one of `FORMATS`
+        compress (bool): Whether the output is compressed with gzip
+    """
+    FORMATS = ('text', 'csv', 'jsonl')
+
+    def __init__(self, destination: Union[str, IO], format: str = 'text', compress: bool = None) -> None:
+        """
+        Initializes the writer
+
+        Args:
+            destination (Union[str, IO]): The path of the output file or a file object
+            format (str, optional): The output format, one of `FORMATS`. Defaults to 'text'
+            compress (bool, optional): Compress the output with gzip. Defaults to None (compressed
+                                       when the path ends with '.gz')
+
+        Raises:
+            ValueError: If the format is not one of `FORMATS`
+        """
+        if format not in self.FORMATS:
+            raise ValueError(f'Unknown output format {format!r}, expected one of {self.FORMATS}')
+        if compress is None:
+            compress = isinstance(destination, str) and destination.endswith('.gz')
+
+        self.destination = destination
+        self.format = format
+        self.compress = compress
+
+    @contextmanager
+    def _open(self) -> Iterator[IO[str]]:
+        """
+        Opens the destination as a text file, the file objects given by the caller are left open
+        """
+        newline = '' if self.format == 'csv' else None
+        if isinstance(self.destination, str):
+            if self.compress:
+                with gzip.open(self.destination, 'wt', newline=newline) as file:
+                    yield file
+            else:
+                with open(self.destination, 'w', newline=newline) as file:
+                    yield file
+        elif self.compress:
+            with gzip.GzipFile(fileobj=self.destination, mode='wb') as binary:
+                file = io.TextIOWrapper(binary, encoding='utf-8', newline=newline)
+                try:
+                    yield file
+                finally:
+                    file.flush()
+                    file.detach()
+        else:
+            yield self.destination
+
+    def write(self, allocation: Allocation) -> int:
+        """
+        Writes an allocation
+
+        Args:
+            allocation (Allocation): For each neighborhood, in order, its ID and the (ID, score) of
+                                     its homebuyers, best first
+
+        Returns:
+            int: The number of neighborhoods written
+        """
+        write_neighborhood = getattr(self, f'_write_{self.format}')
+        count = 0
+        with self._open() as file:
+            if self.format == 'csv':
+                file = csv.writer(file)
+                file.writerow(('neighborhood', 'homebuyer', 'score', 'rank'))
+            for neighborhood, homebuyers in allocation:
+                write_neighborhood(file, neighborhood, homebuyers)
+                count += 1
+        return count
+
+    @staticmethod
+    def _write_text(file: IO[str], neighborhood: int, homebuyers: List[Tuple[int, int]]) -> None:
+        homebuyers_string = ' '.join(f'{HomeBuyer.prefix}{hb}({score})' for hb, score in homebuyers)
+        file.write(f'{Neighborhood.prefix}{neighborhood}: {homebuyers_string}\n')
+
+    @staticmethod
+    def _write_csv(writer, neighborhood: int, homebuyers: List[Tuple[int, int]]) -> None:
+        if not homebuyers:
+            writer.writerow((f'{Neighborhood.prefix}{neighborhood}', '', '', ''))
+        writer.writerows(
+            (f'{Neighborhood.prefix}{neighborhood}', f'{HomeBuyer.prefix}{hb}', score, rank)
+            for rank, (hb, score) in enumerate(homebuyers, start=1)
+        )
+
+    @staticmethod
+    def _write_jsonl(file: IO[str], neighborhood: int, homebuyers: List[Tuple[int, int]]) -> None:
+        record = {
+            'neighborhood': f'{Neighborhood.prefix}{neighborhood}',
+            'homebuyers': [{'homebuyer': f'{HomeBuyer.prefix}{hb}', 'score': score} for hb, score in homebuyers],
+        }
+        file.write(json.dumps(record) + '\n')
+
+
+class OutputReader:
+    """
+    Streams an allocation written by `OutputWriter`, one neighborhood at a time
+
+    Attributes:
+        source (Union[str, IO[str]]): The path of the output file, gzip-compressed when it ends with
+                                      '.gz', or a file object open for reading
+        format (str): The output format, one of `OutputWriter.FORMATS`
+    """
+    HOMEBUYER = re.compile(rf'{HomeBuyer.prefix}(\d+)\((-?\d+)\)')
+
+    def __init__(self, source: Union[str, IO[str]], format: str = None) -> None:
+        """
+        Initializes the reader
+
+        Args:
+            source (Union[str, IO[str]]): The path of the output file or a file object
+            format (str, optional): 'text', 'csv' or 'jsonl'. Defaults to None (guessed from the
+                                    extension of the path, 'text' otherwise)
+
+        Raises:
+            ValueError: If the format is not one of `OutputWriter.FORMATS`
+        """
+        if format is None:
+            format = self.guess_format(source) if isinstance(source, str) else 'text'
+        if format not in OutputWriter.FORMATS:
+            raise ValueError(f'Unknown output format {format!r}, expected one of {OutputWriter.FORMATS}')
+
+        self.source = source
+        self.format = format
+
+    @staticmethod
+    def guess_format(path: str) -> str:
+        """
+        Returns:
+            str: The format of a file given its extension, 'text' unless it is '.csv' or '.jsonl'
+        """
+        name = path[:-3] if path.endswith('.gz') else path
+        return 'csv' if name.endswith('.csv') else 'jsonl' if name.endswith('.jsonl') else 'text'
+
+    @contextmanager
+    def _open(self) -> Iterator[IO[str]]:
+        """
+        Opens the source as a text file, the file objects given by the caller are left open
+        """
+        if isinstance(self.source, str):
+            opener = gzip.open if self.source.endswith('.gz') else open
+            with opener(self.source, 'rt', newline='' if self.format == 'csv' else None) as file:
+                yield file
+        else:
+            yield self.source
+
+    def read(self) -> Iterator[Tuple[int, List[Tuple[int, int]]]]:
+        """
+        Reads the allocation lazily
+
+        Yields:
+            Tuple[int, List[Tuple[int, int]]]: The ID of a neighborhood and the (ID, score) of its
+            homebuyers, in the order of the file
+        """
+        with self._open() as file:
+            yield from getattr(self, f'_read_{self.format}')(file)
+
+    @staticmethod
+    def _read_csv(file: IO[str]) -> Iterator[Tuple[int, List[Tuple[int, int]]]]:
+        current, homebuyers = None, []
+        for row in csv.DictReader(file):
+            neighb = int(row['neighborhood'].lstrip(Neighborhood.prefix))
+            if neighb != current:
+                if current is not None:
+                    yield current, homebuyers
+                current, homebuyers = neighb, []
+            if row['homebuyer']:
+                homebuyers.append((int(row['homebuyer'].lstrip(HomeBuyer.prefix)), int(row['score'])))
+        if current is not None:
+            yield current, homebuyers
+
+    @staticmethod
+    def _read_jsonl(file: IO[str]) -> Iterator[Tuple[int, List[Tuple[int, int]]]]:
+        for line in file:
+            if line.strip():
+                record = json.loads(line)
+                yield (
+                    int(record['neighborhood'].lstrip(Neighborhood.prefix)),
+                    [(int(hb['homebuyer'].lstrip(HomeBuyer.prefix)), hb['score']) for hb in record['homebuyers']],
+                )
+
+    @classmethod
+    def _read_text(cls, file: IO[str]) -> Iterator[Tuple[int, List[Tuple[int, int]]]]:
+        for line in file:
+            if line.strip():
+                neighb, _, homebuyers = line.partition(':')
+                yield (
+                    int(neighb.strip().lstrip(Neighborhood.prefix)),
+                    [(int(hb), int(score)) for hb, score in cls.HOMEBUYER.findall(homebuyers)],
+                )
@@ -0,0 +1,93 @@
+"""
+Times `assign_homebuyers` at a fixed number of neighborhoods and a growing number of homebuyers
+
+For each engine, the growth exponent between two consecutive sizes is printed: about 1 means the
+assignment scales linearly with the number of homebuyers, about 2 that it is quadratic
+
+Usage:
+    python -m benchmarks.allocation_benchmark --neighborhoods 10 --homebuyers 10000 20000 40000 80000
+"""
+import argparse
+import math
+import os
+import tempfile
+import time
+from typing import Dict, List
+
+from algorithm.place_homebuyers_in_neighborhood import PlaceHomeBuyersInNeighborhoods
+from benchmarks.generator import InputGenerator
+
+
+def time_assignment(input_path: str, options: dict, repeat: int = 1) -> float:
+    """
+    Parses the input file once and returns the best time of `assign_homebuyers` in seconds
+    """
+    allocator = PlaceHomeBuyersInNeighborhoods(input_path, **options)
+    allocator.read_input_file()
+    timings = []
+    for _ in range(max(repeat, 1)):
+        allocator.initialize_algorithm()
+        start = time.perf_counter()
+        allocator.assign_homebuyers()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def growth_exponents(homebuyers: List[int], timings: List[float]) -> List[float]:
+    """
+    Returns the exponent k of `time ~ homebuyers ** k` between each pair of consecutive sizes
+    """
+    return [
+        math.log(timings[idx + 1] / timings[idx]) / math.log(homebuyers[idx + 1] / homebuyers[idx])
+        for idx in range(len(timings) - 1)
+        if timings[idx] > 0 and homebuyers[idx + 1] != homebuyers[idx]
+    ]
+
+
+def run(neighborhoods: int, homebuyers: List[int], engines: List[str], seed: int = 0, repeat: int = 1) -> Dict[str, List[float]]:
+    """
+    Times the assignment of each engine on each size
+
+    Args:
+        neighborhoods (int): The number of neighborhoods
+        homebuyers (List[int]): The numbers of homebuyers, in increasing order
+        engines (List[str]): The engines to time, from `PlaceHomeBuyersInNeighborhoods.ENGINES`
+        seed (int, optional): The seed of the generated inputs. Defaults to 0
+        repeat (int, optional): The number of runs, the best time is kept. Defaults to 1
+
+    Returns:
+        Dict[str, List[float]]: For each engine, the time of each size in seconds
+    """
+    timings = {engine: [] for engine in engines}
+    with tempfile.TemporaryDirectory() as directory:
+        input_path = os.path.join(directory, 'input.txt')
+        for count in homebuyers:
+            InputGenerator(neighborhoods, count, neighborhoods, seed=seed).write(input_path)
+            for engine in engines:
+                timings[engine].append(time_assignment(input_path, {'engine': engine}, repeat))
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--neighborhoods', type=int, default=10)
+    parser.add_argument('--homebuyers', type=int, nargs='+', default=[10000, 20000, 40000, 80000])
+    parser.add_argument('--engines', nargs='+', choices=PlaceHomeBuyersInNeighborhoods.ENGINES,
+                        default=list(PlaceHomeBuyersInNeighborhoods.ENGINES))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    homebuyers = sorted(args.homebuyers)
+    timings = run(args.neighborhoods, homebuyers, args.engines, args.seed, args.repeat)
+    for engine, engine_timings in timings.items():
+        print(f'{engine} ({args.neighborhoods} neighborhoods)')
+        for count, timing in zip(homebuyers, engine_timings):
+            print(f'{count:>12} homebuyers: {timing:8.3f}s  {timing / count * 1e6:8.2f}us/homebuyer')
+        exponents = growth_exponents(homebuyers, engine_timings)
+        if exponents:
+            print(f'{"growth exponent":>23}: ' + ' '.join(f'{exponent:.2f}' for exponent in exponents))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+Generates synthetic input files for the allocator
+
+Usage:
+    python -m benchmarks.generator data/large_input.txt --neighborhoods 2000 --homebuyers 200000
+"""
+import argparse
+import bisect
+import itertools
+import random
+from typing import Iterator, List
+
+
+class InputGenerator:
+    """
+    Seeded generator of input files in the format read by `PlaceHomeBuyersInNeighborhoods`
+
+    The same arguments always produce the same file
+
+    Attributes:
+        neighborhoods (int): The number of neighborhoods
+        homebuyers (int): The number of homebuyers
+        preferences (int): The length of each homebuyer's preference list
+        attributes (str): The distribution of the E/W/R attributes, one of `ATTRIBUTE_DISTRIBUTIONS`
+        popularity (str): How the preferred neighborhoods are drawn, one of `POPULARITIES`
+        seed (int): The seed of the random generator
+    """
+    ATTRIBUTE_DISTRIBUTIONS = ('uniform', 'normal', 'skewed')
+    POPULARITIES = ('uniform', 'zipf')
+    MAX_ATTRIBUTE = 10
+
+    def __init__(
+        self,
+        neighborhoods: int,
+        homebuyers: int,
+        preferences: int = None,
+        attributes: str = 'uniform',
+        popularity: str = 'uniform',
+        seed: int = 0,
+    ) -> None:
+        """
+        Initializes the generator
+
+        Args:
+            neighborhoods (int): The number of neighborhoods
+            homebuyers (int): The number of homebuyers
+            preferences (int, optional): The length of each preference list, capped at the number of
+                                         neighborhoods. Defaults to None (every neighborhood is
+                                         ranked)
+            attributes (str, optional): 'uniform' (0 to 10), 'normal' (around 5) or 'skewed' (mostly
+                                        low values). Defaults to 'uniform'
+            popularity (str, optional): 'uniform' (every neighborhood is equally likely to be ranked)
+                                        or 'zipf' (a few neighborhoods are ranked by most homebuyers).
+                                        Defaults to 'uniform'
+            seed (int, optional): The seed of the random generator. Defaults to 0
+
+        Raises:
+            ValueError: If a distribution is unknown, there is no neighborhood, the number of
+                        homebuyers is negative or the preference lists would be empty
+        """
+        if attributes not in self.ATTRIBUTE_DISTRIBUTIONS:
+            raise ValueError(f'Unknown attributes {attributes!r}, expected one of {self.ATTRIBUTE_DISTRIBUTIONS}')
+        if popularity not in self.POPULARITIES:
+            raise ValueError(f'Unknown popularity {popularity!r}, expected one of {self.POPULARITIES}')
+        if neighborhoods < 1:
+            raise ValueError('There must be at least one neighborhood')
+        if homebuyers < 0:
+            raise ValueError('The number of homebuyers cannot be negative')
+        if preferences is not None and preferences < 1:
+            raise ValueError('Each homebuyer must rank at least one neighborhood')
+
+        self.neighborhoods = neighborhoods
+        self.homebuyers = homebuyers
+        self.preferences = neighborhoods if preferences is None else min(preferences, neighborhoods)
+        self.attributes = attributes
+        self.popularity = popularity
+        self.seed = seed
+
+    def _attribute(self, rng: random.Random) -> int:
+        """
+        Draws one attribute value
+        """
+        if self.attributes == 'normal':
+            return min(max(round(rng.gauss(self.MAX_ATTRIBUTE / 2, self.MAX_ATTRIBUTE / 5)), 0), self.MAX_ATTRIBUTE)
+        if self.attributes == 'skewed':
+            return int(self.MAX_ATTRIBUTE * rng.random() ** 3 + 0.5)
+        return rng.randint(0, self.MAX_ATTRIBUTE)
+
+    def _preference_sampler(self, rng: random.Random):
+        """
+        Returns a function drawing a preference list of distinct neighborhoods
+        """
+        population = range(self.neighborhoods)
+        if self.popularity == 'uniform' or self.preferences == self.neighborhoods:
+            return lambda: rng.sample(population, self.preferences)
+
+        cumulative = list(itertools.accumulate(1 / (rank + 1) for rank in population))
+
+        def sample() -> List[int]:
+            chosen = dict()
+            while len(chosen) < self.preferences:
+                chosen.setdefault(bisect.bisect(cumulative, rng.random() * cumulative[-1]), None)
+            return list(chosen)
+
+        return sample
+
+    def lines(self) -> Iterator[str]:
+        """
+        Yields the lines of the input file, neighborhoods first
+
+        Yields:
+            str: One line of the input file, without the line break
+        """
+        rng = random.Random(self.seed)
+        attribute = self._attribute
+        for idx in range(self.neighborhoods):
+            yield f'N N{idx} E:{attribute(rng)} W:{attribute(rng)} R:{attribute(rng)}'
+        yield ''
+
+        sample = self._preference_sampler(rng)
+        for idx in range(self.homebuyers):
+            priority = '>'.join(f'N{neighb}' for neighb in sample())
+            yield f'H H{idx} E:{attribute(rng)} W:{attribute(rng)} R:{attribute(rng)} {priority}'
+
+    def write(self, file_path: str) -> None:
+        """
+        Writes the input file
+
+        Args:
+            file_path (str): The path of the file
+        """
+        with open(file_path, 'w') as file:
+            for line in self.lines():
+                file.write(f'{line}\n')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('file_path')
+    parser.add_argument('--neighborhoods', type=int, default=3)
+    parser.add_argument('--homebuyers', type=int, default=12)
+    parser.add_argument('--preferences', type=int, help='The length of the preference lists (defaults to all)')
+    parser.add_argument('--attributes', choices=InputGenerator.ATTRIBUTE_DISTRIBUTIONS, default='uniform')
+    parser.add_argument('--popularity', choices=InputGenerator.POPULARITIES, default='uniform')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    InputGenerator(
+        args.neighborhoods, args.homebuyers, args.preferences, args.attributes, args.popularity, args.seed
+    ).write(args.file_path)
+
+
+if __name__ == '__main__':
+    main()
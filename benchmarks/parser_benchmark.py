@@ -0,0 +1,93 @@
+"""
+Compares the line-by-line `create_from_string` parsing, with and without appending the entities to an
+`EntityStore`, with the memory-mapped `BulkReader`
+
+Usage:
+    python -m benchmarks.parser_benchmark --homebuyers 200000 --neighborhoods 2000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.generator import InputGenerator
+from entities import EntityStore, HomeBuyer, Neighborhood
+from entities.reader import BulkReader
+
+
+def parse_line_by_line(file_path: str) -> int:
+    """
+    Parses the file with `create_from_string`, like `PlaceHomeBuyersInNeighborhoods` does by default
+    """
+    entities = 0
+    with open(file_path, 'r') as file:
+        for line in file:
+            if line.startswith('N'):
+                Neighborhood.create_from_string(line)
+                entities += 1
+            elif line.startswith('H'):
+                HomeBuyer.create_from_string(line)
+                entities += 1
+    return entities
+
+
+def parse_lines_into_store(file_path: str) -> int:
+    """
+    Parses the file line by line into an `EntityStore`, like the 'lines' reader of the 'columnar' storage
+    """
+    store = EntityStore()
+    with open(file_path, 'r') as file:
+        for line in file:
+            if line.startswith('N'):
+                attrs = Neighborhood._parse_base_attributes(line)
+                store.add_neighborhood(attrs['entity_id'], attrs['attributes'])
+            elif line.startswith('H'):
+                attrs = HomeBuyer._parse_base_attributes(line)
+                store.add_homebuyer(
+                    attrs['entity_id'], attrs['attributes'], HomeBuyer.to_priority_ids(attrs['neighborhood_priority'])
+                )
+    return store.neighborhood_count + store.homebuyer_count
+
+
+def parse_bulk(file_path: str) -> int:
+    """
+    Parses the file with `BulkReader`
+    """
+    store = BulkReader(file_path).read()
+    return store.neighborhood_count + store.homebuyer_count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--neighborhoods', type=int, default=2000)
+    parser.add_argument('--homebuyers', type=int, default=200000)
+    parser.add_argument('--preferences', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    handle, file_path = tempfile.mkstemp(suffix='.txt')
+    os.close(handle)
+    try:
+        InputGenerator(args.neighborhoods, args.homebuyers, args.preferences, seed=args.seed).write(file_path)
+        size = os.path.getsize(file_path) / 2 ** 20
+        print(f'{args.neighborhoods} neighborhoods, {args.homebuyers} homebuyers, {size:.1f} MiB')
+
+        parsers = (
+            ('create_from_string', parse_line_by_line), ('lines into a store', parse_lines_into_store),
+            ('BulkReader', parse_bulk),
+        )
+        for name, parse in parsers:
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                entities = parse(file_path)
+                timings.append(time.perf_counter() - start)
+            best = min(timings)
+            print(f'{name:>20}: {best:8.3f}s  {entities / best:12,.0f} entities/s')
+    finally:
+        os.remove(file_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+"""
+Times each stage of `PlaceHomeBuyersInNeighborhoods.execute` across a ladder of input sizes
+
+Every scale runs in a fresh process, so its peak memory is not inflated by the previous ones. The
+results are saved as JSON and can be compared with a previous run
+
+Usage:
+    python -m benchmarks.scaling --scales 10x1000 100x10000 1000x100000 --output scaling.json
+    python -m benchmarks.scaling --compare scaling.json --output scaling_new.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+
+from algorithm.place_homebuyers_in_neighborhood import PlaceHomeBuyersInNeighborhoods
+from algorithm.stats import ExecutionStats
+from benchmarks.generator import InputGenerator
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+STAGES = ExecutionStats.STAGES
+
+
+def parse_scale(scale: str) -> Tuple[int, int]:
+    """
+    Parses a '{neighborhoods}x{homebuyers}' scale, e.g. '100x10000'
+
+    Raises:
+        argparse.ArgumentTypeError: If the scale is malformed
+    """
+    try:
+        neighborhoods, homebuyers = map(int, scale.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid scale {scale!r}, expected NEIGHBORHOODSxHOMEBUYERS') from None
+    return neighborhoods, homebuyers
+
+
+def _peak_rss() -> float:
+    """
+    Returns:
+        float: The peak resident set size of the process in MiB, or None when it cannot be measured
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def _run_stages(input_path: str, output_path: str, options: dict, trace: bool = False) -> Dict[str, float]:
+    """
+    Runs `execute`, its stages measured by an `ExecutionStats`
+
+    Args:
+        input_path (str): The path of the input file
+        output_path (str): The path of the output file
+        options (dict): Keyword arguments for `PlaceHomeBuyersInNeighborhoods`
+        trace (bool, optional): Measure the peak memory allocated by each stage with `tracemalloc`
+                                instead of its wall time. Defaults to False
+
+    Returns:
+        Dict[str, float]: The wall time of each stage in seconds, or its peak traced memory in MiB
+    """
+    stats = ExecutionStats(trace_memory=trace)
+    PlaceHomeBuyersInNeighborhoods(input_path, output_path=output_path, stats=stats, **options).execute()
+    if trace:
+        return {name: stage.peak_memory / 2 ** 20 for name, stage in stats.stages.items()}
+    return {name: stage.wall_time for name, stage in stats.stages.items()}
+
+
+def run_scale(
+    neighborhoods: int,
+    homebuyers: int,
+    generator_options: dict,
+    options: dict,
+    repeat: int = 1,
+    trace: bool = False,
+) -> dict:
+    """
+    Generates an input file of the given size and times the allocation on it
+
+    Args:
+        neighborhoods (int): The number of neighborhoods
+        homebuyers (int): The number of homebuyers
+        generator_options (dict): Keyword arguments for `InputGenerator`
+        options (dict): Keyword arguments for `PlaceHomeBuyersInNeighborhoods`
+        repeat (int, optional): The number of runs, the best time of each stage is kept. Defaults to 1
+        trace (bool, optional): Also measure the peak memory allocated by each stage with
+                                `tracemalloc`, in a separate run. Defaults to False
+
+    Returns:
+        dict: The size of the instance, the time of each stage, the peak resident memory of the
+        process and, when `trace` is set, the peak traced memory of each stage
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        input_path = os.path.join(directory, 'input.txt')
+        output_path = os.path.join(directory, 'output.txt')
+        InputGenerator(neighborhoods, homebuyers, **generator_options).write(input_path)
+
+        runs = [_run_stages(input_path, output_path, options) for _ in range(max(repeat, 1))]
+        timings = {stage: min(run[stage] for run in runs) for stage in STAGES}
+        result = {
+            'neighborhoods': neighborhoods,
+            'homebuyers': homebuyers,
+            'input_mib': os.path.getsize(input_path) / 2 ** 20,
+            'timings': timings,
+            'total': sum(timings.values()),
+            'peak_rss_mib': _peak_rss(),
+        }
+
+        if trace:
+            result['peak_traced_mib'] = _run_stages(input_path, output_path, options, trace=True)
+    return result
+
+
+def run_ladder(scales: List[Tuple[int, int]], generator_options: dict, options: dict, **kwargs) -> List[dict]:
+    """
+    Runs `run_scale` on each scale, each in a fresh worker process
+
+    Args:
+        scales (List[Tuple[int, int]]): The (neighborhoods, homebuyers) of each scale
+        generator_options (dict): Keyword arguments for `InputGenerator`
+        options (dict): Keyword arguments for `PlaceHomeBuyersInNeighborhoods`
+        **kwargs: Keyword arguments for `run_scale`
+
+    Returns:
+        List[dict]: The result of each scale
+    """
+    results = []
+    with ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1) as executor:
+        for neighborhoods, homebuyers in scales:
+            result = executor.submit(run_scale, neighborhoods, homebuyers, generator_options, options, **kwargs).result()
+            print(format_result(result), flush=True)
+            results.append(result)
+    return results
+
+
+def format_result(result: dict, baseline: dict = None) -> str:
+    """
+    Formats the result of one scale on a line, with the speedup over a baseline result if any
+    """
+    line = f'{result["neighborhoods"]:>7} x {result["homebuyers"]:<9} ' + ' '.join(
+        f'{stage} {result["timings"][stage]:8.3f}s' for stage in STAGES
+    ) + f'  total {result["total"]:8.3f}s'
+    if result.get('peak_rss_mib') is not None:
+        line += f'  peak {result["peak_rss_mib"]:8.1f} MiB'
+    if baseline:
+        line += f'  (speedup {baseline["total"] / result["total"]:.2f}x over the baseline)'
+    return line
+
+
+def compare(results: List[dict], baseline: dict) -> str:
+    """
+    Compares the results with those of a previous run, scale by scale
+
+    Args:
+        results (List[dict]): The results of this run
+        baseline (dict): The JSON document saved by a previous run
+
+    Returns:
+        str: One line per scale also present in the baseline
+    """
+    previous = {(result['neighborhoods'], result['homebuyers']): result for result in baseline['results']}
+    return '\n'.join(
+        format_result(result, previous[(result['neighborhoods'], result['homebuyers'])])
+        for result in results
+        if (result['neighborhoods'], result['homebuyers']) in previous
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', nargs='+', type=parse_scale, default=[(10, 1000), (100, 10000), (1000, 100000)],
+                        help='NEIGHBORHOODSxHOMEBUYERS sizes, e.g. 100x10000')
+    parser.add_argument('--preferences', type=int, default=10, help='The length of the preference lists')
+    parser.add_argument('--attributes', choices=InputGenerator.ATTRIBUTE_DISTRIBUTIONS, default='uniform')
+    parser.add_argument('--popularity', choices=InputGenerator.POPULARITIES, default='uniform')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--engine', choices=PlaceHomeBuyersInNeighborhoods.ENGINES, default='deferred_acceptance')
+    parser.add_argument('--scoring', choices=PlaceHomeBuyersInNeighborhoods.SCORINGS, default='python')
+    parser.add_argument('--storage', choices=PlaceHomeBuyersInNeighborhoods.STORAGES, default='objects')
+    parser.add_argument('--reader', choices=PlaceHomeBuyersInNeighborhoods.READERS, default='lines')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per scale, the best time is kept')
+    parser.add_argument('--tracemalloc', action='store_true', help='Also measure the peak memory of each stage')
+    parser.add_argument('--output', help='The JSON file receiving the results')
+    parser.add_argument('--compare', help='A JSON file saved by a previous run')
+    args = parser.parse_args()
+
+    generator_options = {
+        'preferences': args.preferences,
+        'attributes': args.attributes,
+        'popularity': args.popularity,
+        'seed': args.seed,
+    }
+    options = {'engine': args.engine, 'scoring': args.scoring, 'storage': args.storage, 'reader': args.reader}
+    results = run_ladder(args.scales, generator_options, options, repeat=args.repeat, trace=args.tracemalloc)
+
+    if args.compare:
+        with open(args.compare) as file:
+            print(compare(results, json.load(file)))
+
+    if args.output:
+        document = {
+            'created': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'generator': generator_options,
+            'options': options,
+            'results': results,
+        }
+        with open(args.output, 'w') as file:
+            json.dump(document, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
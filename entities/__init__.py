@@ -1 +1,2 @@
-from .entities import HomeBuyer, Neighborhood
\ No newline at end of file
+from .entities import HomeBuyer, Neighborhood
+from .store import EntityStore
\ No newline at end of file
@@ -0,0 +1,148 @@
+from array import array
+from itertools import repeat
+from typing import Dict, List, Mapping, Sequence
+
+
+class AttributeSchema:
+    """
+    The numeric attributes declared for the entities of an input
+
+    Every attribute is written 'KEY:value' in the input, e.g. 'E:7', and has a name, e.g. 'energy'.
+    Each entity stores its attributes as a fixed-width `array('q')` vector, in the order of the
+    schema, and missing attributes are 0. Scores are the dot product of two vectors,
+    `sum(map(mul, vector, other))`: the attributes add no Python-level step, but each (homebuyer,
+    neighborhood) pair is still one Python-level call. The only vectorized kernel is the NumPy
+    `ScoreMatrix` of the 'vectorized' scoring, which scores every pair in one matrix product
+
+    Attributes:
+        keys (tuple): The KEY of each attribute in the input, in vector order
+        names (tuple): The name of each attribute, in vector order
+    """
+    RESERVED = ('entity_id',)
+
+    def __init__(self, attributes: Mapping[str, str]) -> None:
+        """
+        Declares the attributes
+
+        Args:
+            attributes (Mapping[str, str]): Maps the KEY of each attribute to its name, in vector
+                                            order, e.g. {'E': 'energy', 'W': 'water'}
+
+        Raises:
+            ValueError: If there is no attribute, or a KEY or name is invalid or repeated
+        """
+        self.keys = tuple(attributes)
+        self.names = tuple(attributes.values())
+        if not self.keys:
+            raise ValueError('An attribute schema needs at least one attribute')
+        for key in self.keys:
+            if not key or any(char in key for char in ': >\t\n'):
+                raise ValueError(f'Invalid attribute key {key!r}')
+        for name in self.names:
+            if not name.isidentifier() or name in self.RESERVED:
+                raise ValueError(f'Invalid attribute name {name!r}')
+        if len(set(self.names)) != len(self.names):
+            raise ValueError(f'Repeated attribute name in {self.names}')
+
+        self.positions: Dict[str, int] = {key: idx for idx, key in enumerate(self.keys)}
+        self.name_positions: Dict[str, int] = {name: idx for idx, name in enumerate(self.names)}
+
+    @classmethod
+    def parse(cls, spec: str) -> 'AttributeSchema':
+        """
+        Creates a schema from its text form, the inverse of `str`
+
+        Args:
+            spec (str): Comma separated 'KEY=name' pairs, e.g. 'E=energy,W=water,R=resilience', or
+                        bare KEYs, whose name is then the KEY in lowercase
+
+        Returns:
+            AttributeSchema: The declared schema
+
+        Raises:
+            ValueError: If the spec declares no attribute, or an invalid or repeated one
+        """
+        attributes = {}
+        for item in filter(None, (item.strip() for item in spec.split(','))):
+            key, _, name = item.partition('=')
+            if key in attributes:
+                raise ValueError(f'Repeated attribute key {key!r}')
+            attributes[key] = name or key.lower()
+        return cls(attributes)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, AttributeSchema) and (self.keys, self.names) == (other.keys, other.names)
+
+    def __hash__(self) -> int:
+        return hash((self.keys, self.names))
+
+    def __str__(self) -> str:
+        return ','.join(f'{key}={name}' for key, name in zip(self.keys, self.names))
+
+    def __repr__(self) -> str:
+        return f'AttributeSchema({dict(zip(self.keys, self.names))!r})'
+
+    def vector(self, values: Sequence[int] = (), named: Mapping[str, int] = None) -> array:
+        """
+        Builds an attribute vector
+
+        Args:
+            values (Sequence[int], optional): The first values, in vector order. Defaults to none
+            named (Mapping[str, int], optional): Values given by attribute name. Defaults to none
+
+        Returns:
+            array: The vector, the attributes not given are 0
+
+        Raises:
+            ValueError: If there are more values than attributes, or a name is unknown
+        """
+        vector = array('q', values)
+        if len(vector) > len(self.keys):
+            raise ValueError(f'Expected at most {len(self.keys)} attributes, got {len(vector)}')
+        vector.extend(repeat(0, len(self.keys) - len(vector)))
+        for name, value in (named or {}).items():
+            if name not in self.name_positions:
+                raise ValueError(f'Unknown attribute {name!r}, expected one of {self.names}')
+            vector[self.name_positions[name]] = value
+        return vector
+
+    def parse_tokens(self, tokens: List[str]) -> array:
+        """
+        Parses the 'KEY:value' tokens of a line, in any order, all at once
+
+        Args:
+            tokens (List[str]): The attribute tokens
+
+        Returns:
+            array: The attribute vector, missing attributes are 0
+
+        Raises:
+            ValueError: If a token is not a 'KEY:value' pair of a declared attribute, or an attribute
+                        is repeated
+        """
+        fields = ' '.join(tokens).replace(':', ' ').split()
+        keys = tuple(fields[0::2])
+        if keys == self.keys and len(fields) == 2 * len(tokens):
+            return array('q', map(int, fields[1::2]))
+
+        values = dict(zip(keys, fields[1::2]))
+        if len(fields) != 2 * len(tokens) or len(values) != len(tokens) or not values.keys() <= self.positions.keys():
+            invalid = [
+                token for token in tokens
+                if len(token.replace(':', ' ').split()) != 2 or token.partition(':')[0] not in self.positions
+            ]
+            raise ValueError(f'invalid attribute {invalid[0]!r}' if invalid else f'repeated attribute in {tokens}')
+        return array('q', map(int, map(values.get, self.keys, repeat('0'))))
+
+    def format(self, vector: Sequence[int]) -> str:
+        """
+        Returns:
+            str: The attribute vector as 'KEY:value' tokens, e.g. 'E:7 W:7 R:10'
+        """
+        return ' '.join(f'{key}:{value}' for key, value in zip(self.keys, vector))
+
+
+DEFAULT_SCHEMA = AttributeSchema({'E': 'energy', 'W': 'water', 'R': 'resilience'})
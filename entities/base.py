@@ -1,4 +1,8 @@
 from abc import ABC, abstractmethod
+from array import array
+from typing import List
+
+from entities.attributes import DEFAULT_SCHEMA, AttributeSchema
 
 
 class BaseEntity(ABC):
@@ -6,14 +10,14 @@ class BaseEntity(ABC):
     Abstract base class that defines the common structure shared between different entities 
 
     This class serves as a blueprint for entities like Neighborhood and Homebuyers, focusing on 
-    common attributes such as energy, water, and resilience. Subclasses are expected to implement 
-    additional behaviors specific to each type of entity 
+    the numeric attributes declared by an `AttributeSchema`, energy, water, and resilience by 
+    default. Each attribute is also readable by its name, e.g. `entity.energy`. Subclasses are 
+    expected to implement additional behaviors specific to each type of entity 
 
     Attributes:
         entity_id (int): A identifier for the entity 
-        energy (int): The entity's energy score 
-        water (int): The entity's water score 
-        resilience (int): The entity's resilience score 
+        schema (AttributeSchema): The declared attributes 
+        attributes (array): The entity's attribute vector, in the order of the schema 
         prefix (str): A prefix used to identify the type of entity
 
     Note:
@@ -22,14 +26,41 @@ class BaseEntity(ABC):
     """
     prefix = ''
 
-    def __init__(self, entity_id: int, energy: int, water: int, resilience: int) -> None:
+    def __init__(
+        self,
+        entity_id: int,
+        *values: int,
+        attributes: array = None,
+        schema: AttributeSchema = DEFAULT_SCHEMA,
+        **named: int,
+    ) -> None:
         """
         Initialize the class setting default attributes
+
+        Args:
+            entity_id (int): A identifier for the entity 
+            *values (int): The attribute values, in the order of the schema 
+            attributes (array, optional): The attribute vector, used as is instead of the values. 
+                                          Defaults to None 
+            schema (AttributeSchema, optional): The declared attributes. Defaults to energy, water 
+                                                and resilience 
+            **named (int): The attribute values by name, e.g. energy=5 
+
+        Raises:
+            ValueError: If there are more values than attributes, or a name is not declared
         """
         self.entity_id = entity_id
-        self.energy = energy
-        self.water = water
-        self.resilience = resilience
+        self.schema = schema
+        self.attributes = schema.vector(values, named) if attributes is None else attributes
+
+    def __getattr__(self, name: str) -> int:
+        """
+        Returns the value of an attribute declared by the schema, e.g. `entity.energy`
+        """
+        schema = self.__dict__.get('schema')
+        if schema is None or name not in schema.name_positions:
+            raise AttributeError(f'{type(self).__name__!r} object has no attribute {name!r}')
+        return self.attributes[schema.name_positions[name]]
 
     @abstractmethod
     def __str__(self) -> str:
@@ -45,42 +76,50 @@ class BaseEntity(ABC):
         pass
     
     @classmethod
-    def _parse_base_attributes(cls, string: str) -> dict:
+    def _attribute_tokens(cls, splitted_string: List[str]) -> List[str]:
         """
-        Parses a string to extract entity attributes such as energy, water, and resilience 
+        Returns:
+            List[str]: The 'KEY:value' tokens of a split line, every token after the ID
+        """
+        return splitted_string[2:]
+
+    @classmethod
+    def _parse_base_attributes(cls, string: str, schema: AttributeSchema = DEFAULT_SCHEMA) -> dict:
+        """
+        Parses a string to extract the entity's ID and attribute vector 
 
         This method expects a string formatted with specific entity information and processes it to 
-        retrieve the entity's ID and its associated attributes 
+        retrieve the entity's ID and its associated attributes, given as 'KEY:value' tokens in any 
+        order. The attributes missing from the string are 0 
         
         Args:
             string (str): A string containing entity data in the format 
-                          '{prefix} {prefix}{id} E:{energy} W:{water} R:{resilience}' 
+                          '{prefix} {prefix}{id} E:{energy} W:{water} R:{resilience}', with the KEYs 
+                          declared by the schema 
+            schema (AttributeSchema, optional): The declared attributes. Defaults to energy, water 
+                                                and resilience 
 
         Returns:
             dict: A dictionary containing the parsed entity attributes:
                 - entity_id (int): The entity's ID 
-                - energy (int): The extracted energy score 
-                - water (int): The extracted water score 
-                - resilience (int): The extracted resilience score 
+                - attributes (array): The attribute vector, in the order of the schema 
+                - schema (AttributeSchema): The declared attributes 
                 - splitted_string (list): The components of the string after splitting 
+
+        Raises:
+            ValueError: If an attribute token is not declared by the schema
         """
-        string = string.replace('\n', '')
-        splitted_string = string.split(' ')
+        splitted_string = string.split()
         entity_id = splitted_string[1].split(cls.prefix)[-1]
-        attributes = {attr.split(':')[0]: attr.split(':')[1] for attr in splitted_string[2:5]}
-        energy = attributes.get('E', 0)
-        water = attributes.get('W', 0)
-        resilience = attributes.get('R', 0)
         return {
             'entity_id': int(entity_id), 
-            'energy': int(energy), 
-            'water': int(water), 
-            'resilience': int(resilience), 
+            'attributes': schema.parse_tokens(cls._attribute_tokens(splitted_string)), 
+            'schema': schema, 
             'splitted_string': splitted_string
         }
         
     @classmethod
-    def create_from_string(cls, string: str) -> 'BaseEntity':
+    def create_from_string(cls, string: str, schema: AttributeSchema = DEFAULT_SCHEMA) -> 'BaseEntity':
         """
         Creates an entity instance from a formatted string 
 
@@ -89,10 +128,12 @@ class BaseEntity(ABC):
 
         Args:
             string (str): A string containing entity data 
+            schema (AttributeSchema, optional): The declared attributes. Defaults to energy, water 
+                                                and resilience 
 
         Returns:
             BaseEntity: An instance of the class with the parsed attributes 
         """
-        base_attrs = cls._parse_base_attributes(string)
+        base_attrs = cls._parse_base_attributes(string, schema)
         base_attrs.pop('splitted_string', None)
         return cls(**base_attrs)
\ No newline at end of file
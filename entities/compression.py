@@ -0,0 +1,65 @@
+import bz2
+import gzip
+import io
+import lzma
+from typing import IO, Optional
+
+# The first bytes of each supported format
+MAGIC = {
+    'gzip': b'\x1f\x8b',
+    'xz': b'\xfd7zXZ\x00',
+    'bz2': b'BZh',
+    'zstd': b'\x28\xb5\x2f\xfd',
+}
+
+
+def detect_compression(file_path: str) -> Optional[str]:
+    """
+    Detects the compression of a file from its first bytes rather than from its extension
+
+    Args:
+        file_path (str): The path of the file
+
+    Returns:
+        Optional[str]: 'gzip', 'xz', 'bz2' or 'zstd', or None for a plain file
+    """
+    with open(file_path, 'rb') as file:
+        head = file.read(max(map(len, MAGIC.values())))
+    for compression, magic in MAGIC.items():
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def open_input(file_path: str, text: bool = False, compression: str = None) -> IO:
+    """
+    Opens an input file for reading, decompressing it on the fly when it is compressed. Zstandard
+    requires the optional `zstandard` package
+
+    Args:
+        file_path (str): The path of the file
+        text (bool, optional): Open the file in text mode rather than in binary mode. Defaults to
+                               False
+        compression (str, optional): The compression of the file, one of `MAGIC`. Defaults to None
+                                     (detected with `detect_compression`)
+
+    Returns:
+        IO: The file object, streaming the decompressed content
+
+    Raises:
+        ImportError: If the file is compressed with Zstandard and `zstandard` is not installed
+    """
+    if compression is None:
+        compression = detect_compression(file_path)
+    if compression is None:
+        return open(file_path, 'r' if text else 'rb')
+
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError as error:
+            raise ImportError(f'{file_path} is compressed with Zstandard, install `zstandard` to read it') from error
+        binary = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(file_path, 'rb'), closefd=True))
+    else:
+        binary = {'gzip': gzip, 'xz': lzma, 'bz2': bz2}[compression].open(file_path, 'rb')
+    return io.TextIOWrapper(binary) if text else binary
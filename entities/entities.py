@@ -1,5 +1,9 @@
-from typing import List
+import warnings
+from array import array
+from operator import mul
+from typing import Container, Dict, Iterable, List
 
+from entities.attributes import DEFAULT_SCHEMA, AttributeSchema
 from entities.base import BaseEntity
 
 
@@ -10,19 +14,25 @@ class Neighborhood(BaseEntity):
 
     Attributes:
         entity_id (int): A identifier for the entity 
-        energy (int): The entity's energy score 
-        water (int): The entity's water score 
-        resilience (int): The entity's resilience score 
+        schema (AttributeSchema): The declared attributes 
+        attributes (array): The neighborhood's attribute vector, in the order of the schema 
         prefix (str): A prefix used to identify the type of entity ('N' for Neighborhood) 
         homebuyers (list): A list of homebuyers associated with the neighborhood 
     """
     prefix = 'N'
 
-    def __init__(self, entity_id: int, energy: int, water: int, resilience: int) -> None:
+    def __init__(
+        self,
+        entity_id: int,
+        *values: int,
+        attributes: array = None,
+        schema: AttributeSchema = DEFAULT_SCHEMA,
+        **named: int,
+    ) -> None:
         """
-        Initialize the class setting default attributes
+        Initialize the class setting default attributes, see `BaseEntity`
         """
-        super().__init__(entity_id, energy, water, resilience)
+        super().__init__(entity_id, *values, attributes=attributes, schema=schema, **named)
         self.homebuyers = []
     
     def __str__(self) -> str:
@@ -30,12 +40,12 @@ class Neighborhood(BaseEntity):
         Returns a string representation of the neighborhood 
 
         The string includes the prefix, ID, and key attributes of the neighborhood. The format is 
-        as follows: 'N N{entity_id} E:{energy} W:{water} R:{resilience}'
+        as follows: 'N N{entity_id} E:{energy} W:{water} R:{resilience}', with the KEYs of the schema 
 
         Returns:
             str: A formatted string representing the neighborhood 
         """
-        return f'N N{self.entity_id} E:{self.energy} W:{self.water} R:{self.resilience}'
+        return f'N N{self.entity_id} {self.schema.format(self.attributes)}'
     
 
 class HomeBuyer(BaseEntity):
@@ -44,43 +54,70 @@ class HomeBuyer(BaseEntity):
 
     Attributes:
         entity_id (int): A identifier for the homebuyer 
-        energy (int): The homebuyer's energy score 
-        water (int): The homebuyer's water score 
-        resilience (int): The homebuyer's resilience score 
+        schema (AttributeSchema): The declared attributes 
+        attributes (array): The homebuyer's attribute vector, in the order of the schema 
         prefix (str): A prefix used to identify the type of entity ('H' for HomeBuyer) 
-        neighborhood_priority (list): A list of neighborhood identifiers in order of preference 
-        neighborhood_scores (dict): Maps neighborhood IDs to scores based on the dot product of attributes 
+        neighborhood_priority (list): A list of neighborhood identifiers in order of preference, which 
+                                      may rank only some of the neighborhoods 
+        neighborhood_scores (dict): Maps the IDs of the ranked neighborhoods to scores based on the dot 
+                                    product of attributes 
     """
     prefix = 'H'
 
-    def __init__(self, entity_id: int, energy: int, water: int, resilience: int, neighborhood_priority: List[str]) -> None:
+    def __init__(
+        self,
+        entity_id: int,
+        *values: int,
+        neighborhood_priority: List[str] = None,
+        attributes: array = None,
+        schema: AttributeSchema = DEFAULT_SCHEMA,
+        **named: int,
+    ) -> None:
         """
-        Initialize the class setting default attributes
+        Initialize the class setting default attributes, see `BaseEntity`
+
+        The preferences used to be the last positional argument, after the attribute values. That 
+        call still works but is deprecated, `neighborhood_priority` should be passed by name
         """
-        super().__init__(entity_id, energy, water, resilience)
-        self.neighborhood_priority = neighborhood_priority
-        self.neighborhood_scores = {key: 0 for key in self.neighborhood_priority}
+        if values and isinstance(values[-1], (list, tuple)) and neighborhood_priority is None:
+            warnings.warn(
+                'Passing the neighborhood priority positionally is deprecated, use neighborhood_priority=',
+                DeprecationWarning,
+                stacklevel=2,
+            )
+            *values, neighborhood_priority = values
+            neighborhood_priority = list(neighborhood_priority)
+        super().__init__(entity_id, *values, attributes=attributes, schema=schema, **named)
+        self.neighborhood_priority = [] if neighborhood_priority is None else neighborhood_priority
+        self.neighborhood_scores = {}
 
     def __str__(self) -> str:
         """
         Returns a string representation of the homebuyer 
 
         The string includes the prefix, ID, and key attributes of the homebuyer. The format is 
-        as follows: 'H H{entity_id} E:{energy} W:{water} R:{resilience} {neighborhood_priority}'
+        as follows: 'H H{entity_id} E:{energy} W:{water} R:{resilience} {neighborhood_priority}', with 
+        the KEYs of the schema 
 
         Where {neighborhood_priority} is a sequence of neighborhood IDs separated by '>', e.g., 'N1>N2>N3' 
 
         Returns:
             str: A formatted string representing the homebuyer 
         """
-        return f'H H{self.entity_id} E:{self.energy} W:{self.water} R:{self.resilience} {">".join(self.neighborhood_priority)}'
+        return f'H H{self.entity_id} {self.schema.format(self.attributes)} {">".join(self.neighborhood_priority)}'
 
+    @classmethod
+    def _attribute_tokens(cls, splitted_string: List[str]) -> List[str]:
+        """
+        Returns:
+            List[str]: The 'KEY:value' tokens of a split line, between the ID and the preferences
+        """
+        return splitted_string[2:-1]
 
     @classmethod
-    def _parse_base_attributes(cls, string: str) -> dict:
+    def _parse_base_attributes(cls, string: str, schema: AttributeSchema = DEFAULT_SCHEMA) -> dict:
         """
-        Parses a string to extract entity attributes such as energy, water, and resilience and
-        neighborhood_priority 
+        Parses a string to extract the entity's ID, attribute vector and neighborhood_priority 
 
         This method expects a string formatted with specific entity information and processes it to 
         retrieve the entity's ID and its associated attributes 
@@ -91,36 +128,43 @@ class HomeBuyer(BaseEntity):
                           
                           Where {neighborhood_priority} is a sequence of neighborhood IDs separated by '>',
                           e.g., 'N1>N2>N3' 
+            schema (AttributeSchema, optional): The declared attributes. Defaults to energy, water 
+                                                and resilience 
 
         Returns:
             dict: A dictionary containing the parsed entity attributes:
                 - entity_id (int): The entity's ID 
-                - energy (int): The extracted energy score
-                - water (int): The extracted water score
-                - resilience (int): The extracted resilience score 
+                - attributes (array): The attribute vector, in the order of the schema 
+                - schema (AttributeSchema): The declared attributes 
+                - neighborhood_priority (list): The neighborhood identifiers in order of preference 
                 - splitted_string (list): The components of the string after splitting 
+
+        Raises:
+            ValueError: If an attribute token is not declared by the schema
         """
-        base_attributes = super()._parse_base_attributes(string)
+        base_attributes = super()._parse_base_attributes(string, schema)
         base_attributes['neighborhood_priority'] = base_attributes['splitted_string'][-1].split('>')
         return base_attributes
 
-    def set_neighborhoods_score(self, neighborhoods: List[Neighborhood]) -> None:
+    def set_neighborhoods_score(self, neighborhoods: Dict[int, Neighborhood]) -> None:
         """
-        Calculates and updates the scores for each neighborhood based on the dot product of the 
-        homebuyer's attributes and the neighborhood's attributes 
+        Calculates and updates the scores for each neighborhood ranked by the homebuyer, the dot 
+        product of their attribute vectors (see `AttributeSchema`). The neighborhoods the homebuyer 
+        did not rank are never scored 
 
         Args:
-            neighborhoods (List[Neighborhood]): A list of Neighborhood objects
+            neighborhoods (Dict[int, Neighborhood]): Maps neighborhood IDs to Neighborhood objects, 
+                                                     the ones not ranked are skipped 
 
         Returns:
             None: This method updates the neighborhood_scores attribute in place
         """
-        for idx, neighborhood in neighborhoods.items():
-            self.neighborhood_scores[idx] = (
-                self.energy * neighborhood.energy
-                + self.water * neighborhood.water 
-                + self.resilience * neighborhood.resilience
-            )
+        attributes = self.attributes
+        for idx in self.get_priority_ids():
+            neighborhood = neighborhoods.get(idx)
+            if neighborhood is None:
+                continue
+            self.neighborhood_scores[idx] = sum(map(mul, attributes, neighborhood.attributes))
 
     def is_preferred_neighborhood(self, neighborhood_id: int, priority = 0) -> bool:
         """
@@ -132,6 +176,46 @@ class HomeBuyer(BaseEntity):
 
         Returns:
             bool: True if the given neighborhood ID matches the preferred neighborhood at the 
-            specified priority
+            specified priority, False when the homebuyer ranked fewer neighborhoods
+        """
+        return priority < len(self.neighborhood_priority) and self.neighborhood_priority[priority] == f'N{neighborhood_id}'
+
+    def get_priority_ids(self) -> List[int]:
+        """
+        Returns the neighborhood IDs of the homebuyer's preferences, in order of preference
+
+        Returns:
+            List[int]: The IDs of the preferred neighborhoods, e.g., [1, 0, 2] for 'N1>N0>N2'
+        """
+        return self.to_priority_ids(self.neighborhood_priority)
+
+    @staticmethod
+    def check_priority_ids(priority_ids: Iterable[int], neighborhoods: Container[int]) -> None:
+        """
+        Checks that a homebuyer only ranks known neighborhoods
+
+        Args:
+            priority_ids (Iterable[int]): The IDs of the preferred neighborhoods
+            neighborhoods (Container[int]): The IDs of the known neighborhoods, e.g. a dict mapping 
+                                            them to Neighborhood objects or a range
+
+        Raises:
+            ValueError: If a ranked neighborhood is not in `neighborhoods`
+        """
+        for neighborhood_id in priority_ids:
+            if neighborhood_id not in neighborhoods:
+                raise ValueError(f'unknown neighborhood {Neighborhood.prefix}{neighborhood_id} in the preferences')
+
+    @staticmethod
+    def to_priority_ids(neighborhood_priority: List[str]) -> List[int]:
+        """
+        Converts neighborhood identifiers such as 'N1' to their IDs
+
+        Args:
+            neighborhood_priority (List[str]): Neighborhood identifiers, e.g., ['N1', 'N0', 'N2'] 
+
+        Returns:
+            List[int]: The IDs of the neighborhoods, in the same order, e.g., [1, 0, 2]
         """
-        return self.neighborhood_priority[priority] == f'N{neighborhood_id}'
\ No newline at end of file
+        prefix_length = len(Neighborhood.prefix)
+        return [int(neighborhood_id[prefix_length:]) for neighborhood_id in neighborhood_priority]
\ No newline at end of file
@@ -0,0 +1,421 @@
+import mmap
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from entities.attributes import DEFAULT_SCHEMA, AttributeSchema
+from entities.compression import detect_compression, open_input
+from entities.entities import HomeBuyer, Neighborhood
+from entities.store import EntityStore
+
+
+class InputFormatError(ValueError):
+    """
+    Raised when a line of the input file does not follow the expected format
+
+    Attributes:
+        line_number (int): The 1-based number of the malformed line
+        line (str): The malformed line
+    """
+    def __init__(self, file_path: str, line_number: int, line: str, reason: str) -> None:
+        super().__init__(f'{file_path}:{line_number}: {reason}: {line!r}')
+        self.file_path = file_path
+        self.line_number = line_number
+        self.line = line
+        self.reason = reason
+
+    def __reduce__(self) -> tuple:
+        # Raised in the parser workers, so it must be rebuilt from its arguments
+        return type(self), (self.file_path, self.line_number, self.line, self.reason)
+
+
+class BulkReader:
+    """
+    Reads an input file straight into the columns of an `EntityStore`
+
+    The file is memory-mapped and split into blocks of about `block_size` bytes that end on a line
+    boundary. The N and H lines of each block are tokenized together and converted column by column,
+    then appended to the store's arrays, without creating a `Neighborhood`/`HomeBuyer` object or an
+    attributes dict per line
+
+    The accepted format is the one of `create_from_string`:
+        'N N{id} E:{energy} W:{water} R:{resilience}'
+        'H H{id} E:{energy} W:{water} R:{resilience} N{id}>N{id}>...'
+    with the 'KEY:value' tokens of the attributes declared by the schema, missing ones being 0.
+    Blank lines are ignored, like in `PlaceHomeBuyersInNeighborhoods.read_input_file`. The
+    neighborhoods must be numbered 0..N-1 in the order of the file, since their IDs are the rows of
+    the store, and come before the homebuyers ranking them
+
+    A file compressed with gzip, xz, bzip2 or Zstandard, detected by its first bytes, is decompressed
+    as a stream, `block_size` bytes at a time, instead of being memory-mapped. With several
+    `workers`, the blocks are parsed by a pool of processes while the next ones are read and
+    decompressed, and the results are appended to the store in the order of the file, at most
+    `2 * workers` blocks being in flight
+
+    Attributes:
+        file_path (str): The path of the input file
+        block_size (int): The approximate number of bytes parsed at a time
+        schema (AttributeSchema): The declared attributes
+        workers (int): The number of processes parsing the blocks, 1 to parse them in this process
+    """
+    def __init__(
+        self, file_path: str, block_size: int = 1 << 24, schema: AttributeSchema = DEFAULT_SCHEMA, workers: int = 1,
+    ) -> None:
+        """
+        Initialize the class setting default attributes
+
+        Raises:
+            ValueError: If there is not at least one worker
+        """
+        if workers < 1:
+            raise ValueError('The BulkReader needs at least one worker')
+        self.file_path = file_path
+        self.block_size = block_size
+        self.schema = schema
+        self.workers = workers
+        self._attribute_positions = {key.encode(): idx for idx, key in enumerate(schema.keys)}
+
+    def _blocks(self, buffer) -> Iterator[Tuple[int, bytes]]:
+        """
+        Splits a buffer into blocks that end on a line boundary
+
+        Args:
+            buffer: The memory-mapped file
+
+        Yields:
+            Tuple[int, bytes]: The number of the block's first line and the block's content
+        """
+        start, line_number, size = 0, 1, len(buffer)
+        while start < size:
+            stop = start + self.block_size
+            if stop < size:
+                newline = buffer.find(b'\n', stop - 1)
+                stop = size if newline == -1 else newline + 1
+            block = buffer[start:min(stop, size)]
+            yield line_number, block
+            line_number += block.count(b'\n')
+            start = stop
+
+    def _stream_blocks(self, file) -> Iterator[Tuple[int, bytes]]:
+        """
+        Splits a stream into blocks that end on a line boundary, reading `block_size` bytes at a time
+
+        Args:
+            file: The file object, e.g. a decompressing one
+
+        Yields:
+            Tuple[int, bytes]: The number of the block's first line and the block's content
+        """
+        line_number, rest = 1, b''
+        while True:
+            data = file.read(self.block_size)
+            if not data:
+                break
+            data = rest + data
+            newline = data.rfind(b'\n')
+            if newline == -1:
+                rest = data
+                continue
+            block, rest = data[:newline + 1], data[newline + 1:]
+            yield line_number, block
+            line_number += block.count(b'\n')
+        if rest:
+            yield line_number, rest
+
+    def _read_blocks(self) -> Iterator[Tuple[int, bytes]]:
+        """
+        Reads the file block by block, memory-mapped when it is plain and streamed when it is
+        compressed
+
+        Yields:
+            Tuple[int, bytes]: The number of the block's first line and the block's content
+        """
+        compression = detect_compression(self.file_path)
+        if compression is not None:
+            with open_input(self.file_path, compression=compression) as file:
+                yield from self._stream_blocks(file)
+            return
+
+        with open(self.file_path, 'rb') as file:
+            if not file.seek(0, 2):
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                yield from self._blocks(buffer)
+
+    def _parse_block(self, store: EntityStore, first_id: int, first_line: int, block: bytes) -> None:
+        """
+        Parses a block of lines into the store, see `_parse_columns` and `_extend_store`
+        """
+        self._extend_store(store, first_id, first_line, block, self._parse_columns(first_line, block))
+
+    def _extend_store(self, store: EntityStore, first_id: int, first_line: int, block: bytes, parsed: tuple) -> None:
+        """
+        Appends the columns parsed from a block to the store, once the block's neighborhood IDs are
+        checked to follow the ones read before and its homebuyers to rank known neighborhoods
+
+        Args:
+            store (EntityStore): The store receiving the block's entities
+            first_id (int): The ID expected for the block's first neighborhood, the number of
+                            neighborhoods read before
+            first_line (int): The number of the block's first line, used in error messages
+            block (bytes): The lines parsed
+            parsed (tuple): The columns parsed from the block, see `_parse_columns`
+
+        Raises:
+            InputFormatError: If a neighborhood is out of order, duplicated or missing, or a 
+                              homebuyer ranks an unknown neighborhood
+        """
+        neighborhoods, homebuyers, priorities, row_lengths = parsed
+        ids = neighborhoods['entity_id']
+        known = first_id + len(ids)
+        if ids != list(range(first_id, known)) or (priorities and (min(priorities) < 0 or max(priorities) >= known)):
+            self._raise_invalid_line(first_id, first_line, block)
+        store.extend_neighborhoods(neighborhoods)
+        store.extend_homebuyers(homebuyers, priorities, row_lengths)
+
+    def _raise_invalid_line(self, first_id: int, first_line: int, block: bytes) -> None:
+        """
+        Finds the first line of a block declaring a neighborhood whose ID does not follow the previous
+        ones, the neighborhood IDs being the rows of the store (see `EntityStore`), or a homebuyer 
+        ranking a neighborhood not declared in the file up to the end of the block
+
+        Raises:
+            InputFormatError: For that line
+        """
+        neighborhood_prefix, homebuyer_prefix = Neighborhood.prefix.encode(), HomeBuyer.prefix.encode()
+        lines = block.split(b'\n')
+        known = range(first_id + sum(line.split()[:1] == [neighborhood_prefix] for line in lines))
+        expected = first_id
+        for offset, line in enumerate(lines):
+            tokens = line.split()
+            try:
+                if tokens[:1] == [neighborhood_prefix]:
+                    if int(tokens[1][len(neighborhood_prefix):]) != expected:
+                        raise ValueError(EntityStore.neighborhood_order_error(expected))
+                    expected += 1
+                elif tokens[:1] == [homebuyer_prefix]:
+                    HomeBuyer.check_priority_ids(self._parse_priorities(tokens[-1:])[0], known)
+            except ValueError as error:
+                raise InputFormatError(
+                    self.file_path, first_line + offset, line.decode(errors='replace'), str(error)
+                ) from None
+
+    def _parse_columns(self, first_line: int, block: bytes) -> Tuple[dict, dict, List[int], List[int]]:
+        """
+        Parses a block of lines into columns
+
+        The N and H lines of the block are tokenized together and each field is converted column by
+        column. When that fast path does not apply (attributes missing or out of order, malformed lines), the
+        block is parsed again line by line, which also pinpoints the malformed line
+
+        Args:
+            first_line (int): The number of the block's first line, used in error messages
+            block (bytes): The lines to parse
+
+        Returns:
+            Tuple[dict, dict, List[int], List[int]]: The neighborhoods' columns, the homebuyers' 
+            columns, their preferences row after row and the number of preferences of each homebuyer
+
+        Raises:
+            InputFormatError: If a line is malformed
+        """
+        neighborhood_prefix, homebuyer_prefix = Neighborhood.prefix.encode(), HomeBuyer.prefix.encode()
+        lines = block.split(b'\n')
+        neighborhood_lines = [line for line in lines if line[:1] == neighborhood_prefix]
+        homebuyer_lines = [line for line in lines if line[:1] == homebuyer_prefix]
+
+        try:
+            if len(lines) - lines.count(b'') != len(neighborhood_lines) + len(homebuyer_lines):
+                raise ValueError('unexpected record type')
+            neighborhoods, _ = self._tokenize_lines(neighborhood_lines, neighborhood_prefix, False)
+            homebuyers, priority_tokens = self._tokenize_lines(homebuyer_lines, homebuyer_prefix, True)
+            priorities, row_lengths = self._parse_priorities(priority_tokens)
+        except ValueError:
+            return self._parse_lines(first_line, lines)
+        return neighborhoods, homebuyers, priorities, row_lengths
+
+    def _tokenize_lines(self, lines: List[bytes], prefix: bytes, preferences: bool) -> Tuple[Dict[str, list], list]:
+        """
+        Tokenizes lines of the same record type together and converts their fields column by column
+
+        Args:
+            lines (List[bytes]): The lines, all starting with `prefix`
+            prefix (bytes): The record type, also the prefix of the IDs
+            preferences (bool): Whether the lines end with the preferences field
+
+        Returns:
+            Tuple[Dict[str, list], list]: The values of each column of the store and the tokens of 
+            the last field (the preferences), if any
+
+        Raises:
+            ValueError: If the lines cannot be parsed this way
+        """
+        attributes = len(self.schema)
+        fields = 2 + attributes + preferences
+        tokens = b' '.join(lines).split()
+        if len(tokens) != fields * len(lines) or tokens[0::fields].count(prefix) != len(lines):
+            raise ValueError('unexpected number of fields')
+
+        def column(position: int, token_prefix: bytes) -> list:
+            joined = b' '.join(tokens[position::fields])
+            if joined.count(token_prefix) != len(lines):
+                raise ValueError('unexpected field')
+            values = list(map(int, joined.replace(token_prefix, b'').split()))
+            if len(values) != len(lines):
+                raise ValueError('unexpected field')
+            return values
+
+        columns = {'entity_id': column(1, prefix)}
+        for position, (key, name) in enumerate(zip(self.schema.keys, self.schema.names), 2):
+            columns[name] = column(position, f'{key}:'.encode())
+        return columns, tokens[fields - 1::fields] if preferences else []
+
+    @staticmethod
+    def _parse_priorities(tokens: List[bytes]) -> Tuple[List[int], List[int]]:
+        """
+        Parses the 'N{id}>N{id}>...' preference tokens of a batch of homebuyers
+
+        Args:
+            tokens (List[bytes]): The preference token of each homebuyer
+
+        Returns:
+            Tuple[List[int], List[int]]: The preferred neighborhood IDs, row after row, and the 
+            number of preferences of each homebuyer
+
+        Raises:
+            ValueError: If a token is malformed
+        """
+        prefix = Neighborhood.prefix.encode()
+        joined = b'>'.join(tokens)
+        row_lengths = [token.count(b'>') + 1 for token in tokens]
+        if joined.count(prefix) != sum(row_lengths):
+            raise ValueError('invalid preferences')
+        priorities = list(map(int, joined.replace(prefix, b'').split(b'>'))) if tokens else []
+        return priorities, row_lengths
+
+    def _parse_lines(self, first_line: int, lines: List[bytes]) -> Tuple[dict, dict, List[int], List[int]]:
+        """
+        Parses lines one at a time, used when a block cannot be tokenized as a whole
+
+        Args:
+            first_line (int): The number of the first line, used in error messages
+            lines (List[bytes]): The lines to parse
+
+        Returns:
+            Tuple[dict, dict, List[int], List[int]]: The neighborhoods' columns, the homebuyers' 
+            columns, their preferences row after row and the number of preferences of each homebuyer
+
+        Raises:
+            InputFormatError: If a line is malformed
+        """
+        neighborhood_prefix, homebuyer_prefix = Neighborhood.prefix.encode(), HomeBuyer.prefix.encode()
+        columns = ('entity_id', *self.schema.names)
+        neighborhoods = {name: [] for name in columns}
+        homebuyers = {name: [] for name in columns}
+        priorities, row_lengths = [], []
+        max_fields = 2 + len(self.schema)
+
+        for offset, line in enumerate(lines):
+            tokens = line.split()
+            if not tokens:
+                continue
+            kind = tokens[0]
+            try:
+                if kind == neighborhood_prefix and 2 <= len(tokens) <= max_fields:
+                    target, attribute_tokens = neighborhoods, tokens[2:]
+                elif kind == homebuyer_prefix and 3 <= len(tokens) <= max_fields + 1:
+                    target, attribute_tokens = homebuyers, tokens[2:-1]
+                    line_priorities, line_lengths = self._parse_priorities(tokens[-1:])
+                else:
+                    raise ValueError('unexpected record type or number of fields')
+                row = (int(tokens[1][len(kind):]), *self._parse_attributes(attribute_tokens))
+            except ValueError as error:
+                raise InputFormatError(
+                    self.file_path, first_line + offset, line.decode(errors='replace'), str(error)
+                ) from None
+
+            for name, value in zip(columns, row):
+                target[name].append(value)
+            if target is homebuyers:
+                priorities.extend(line_priorities)
+                row_lengths.extend(line_lengths)
+
+        return neighborhoods, homebuyers, priorities, row_lengths
+
+    def _parse_attributes(self, tokens: list) -> array:
+        """
+        Parses the 'KEY:value' attribute tokens of a line, in any order
+
+        Args:
+            tokens (list): The attribute tokens
+
+        Returns:
+            array: The attribute vector, in the order of the schema, missing attributes default to 0
+
+        Raises:
+            ValueError: If a token is not a 'KEY:value' pair of a declared attribute
+        """
+        values = array('q', bytes(8 * len(self.schema)))
+        for token in tokens:
+            key, separator, value = token.partition(b':')
+            position = self._attribute_positions.get(key)
+            if not separator or position is None:
+                raise ValueError(f'invalid attribute {token.decode(errors="replace")!r}')
+            values[position] = int(value)
+        return values
+
+    def chunks(self) -> Iterator[EntityStore]:
+        """
+        Reads the file one block at a time, so only about `block_size` bytes of it are parsed and held 
+        in memory at once
+
+        Yields:
+            EntityStore: A new store holding the neighborhoods and homebuyers of each block. The
+            neighborhoods continue the IDs of the previous blocks, so a neighborhood's row is its 
+            ID minus the number of neighborhoods of the previous stores
+
+        Raises:
+            InputFormatError: If a line is malformed, a neighborhood is out of order or a homebuyer 
+                              ranks an unknown neighborhood
+        """
+        neighborhood_count = 0
+        for first_line, block in self._read_blocks():
+            store = EntityStore(self.schema)
+            self._parse_block(store, neighborhood_count, first_line, block)
+            neighborhood_count += store.neighborhood_count
+            yield store
+
+    def read(self, store: Optional[EntityStore] = None) -> EntityStore:
+        """
+        Reads the whole file
+
+        Args:
+            store (EntityStore, optional): The store receiving the entities, with the same schema. 
+                                           Defaults to a new store
+
+        Returns:
+            EntityStore: The store holding the file's neighborhoods and homebuyers
+
+        Raises:
+            InputFormatError: If a line is malformed, a neighborhood is out of order or a homebuyer 
+                              ranks an unknown neighborhood
+        """
+        store = EntityStore(self.schema) if store is None else store
+        if self.workers == 1:
+            for first_line, block in self._read_blocks():
+                self._parse_block(store, store.neighborhood_count, first_line, block)
+            return store
+
+        def extend(first_line: int, block: bytes, future) -> None:
+            self._extend_store(store, store.neighborhood_count, first_line, block, future.result())
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            pending = deque()
+            for first_line, block in self._read_blocks():
+                pending.append((first_line, block, executor.submit(self._parse_columns, first_line, block)))
+                if len(pending) >= 2 * self.workers:
+                    extend(*pending.popleft())
+            while pending:
+                extend(*pending.popleft())
+        return store
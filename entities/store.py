@@ -0,0 +1,544 @@
+from array import array
+from collections.abc import Mapping, Sequence
+from itertools import accumulate, islice
+from operator import attrgetter, itemgetter, mul
+from typing import Dict, Iterator, List
+
+from entities.attributes import DEFAULT_SCHEMA, AttributeSchema
+from entities.entities import HomeBuyer, Neighborhood
+
+
+class EntityStore:
+    """
+    Columnar storage for neighborhoods and homebuyers
+
+    Instead of one Python object per entity, the ID and every attribute declared by the store's
+    `AttributeSchema` are kept in typed `array` columns and
+    the homebuyers' preferences are kept as neighborhood IDs in a single int32 array, with the row
+    boundaries stored in `priority_offsets` (a compressed sparse row layout, so preference lists
+    may have different lengths). A homebuyer costs a few dozen bytes instead of a `__dict__`, a list
+    of strings and a score dict. The columns may also be read-only buffers (see `Snapshot`), which
+    are copied into arrays the first time the store is modified
+
+    The existing `Neighborhood`/`HomeBuyer` APIs are available through the thin `NeighborhoodView`
+    and `HomeBuyerView` objects returned by the `neighborhoods` and `homebuyers` mappings, which
+    read straight from the columns. As in the rest of the algorithm, the neighborhood IDs are
+    expected to be 0..N-1, and the neighborhoods must be added in that order so a neighborhood's
+    ID is also its row
+
+    Attributes:
+        schema (AttributeSchema): The declared attributes
+        columns (tuple): The column names, 'entity_id' then the name of each attribute
+        neighborhood_columns (dict): Maps each column name in `columns` to the neighborhoods' array
+        homebuyer_columns (dict): Maps each column name in `columns` to the homebuyers' array
+        priorities (array): The neighborhood IDs of every homebuyer's preferences, row after row
+        priority_offsets (array): Row `i`'s preferences are `priorities[offsets[i]:offsets[i + 1]]`
+        score_matrix (ScoreMatrix): Optional precomputed scores, read instead of the columns when set
+        ranked_index (RankedIndex): Optional index of the homebuyers ranking each neighborhood, sorted
+                                    by score for the 'recursive' engine
+    """
+    def __init__(self, schema: AttributeSchema = DEFAULT_SCHEMA) -> None:
+        """
+        Initialize the class with empty columns
+
+        Args:
+            schema (AttributeSchema, optional): The declared attributes. Defaults to energy, water
+                                                and resilience
+        """
+        self.schema = schema
+        self.columns = ('entity_id', *schema.names)
+        self.neighborhood_columns = {name: array('q') for name in self.columns}
+        self.homebuyer_columns = {name: array('q') for name in self.columns}
+        self.priorities = array('i')
+        self.priority_offsets = array('q', [0])
+        self.score_matrix = None
+        self.ranked_index = None
+        self._homebuyer_rows = None
+        self._neighborhood_vectors = None
+        self._homebuyer_attributes = None
+
+    @classmethod
+    def from_entities(
+        cls,
+        neighborhoods: Dict[int, Neighborhood],
+        homebuyers: Dict[int, HomeBuyer],
+        schema: AttributeSchema = DEFAULT_SCHEMA,
+    ) -> 'EntityStore':
+        """
+        Creates a store holding the given Neighborhood and HomeBuyer objects
+
+        Args:
+            neighborhoods (Dict[int, Neighborhood]): Maps neighborhood IDs to Neighborhood objects
+            homebuyers (Dict[int, HomeBuyer]): Maps homebuyer IDs to HomeBuyer objects
+            schema (AttributeSchema, optional): The attributes of the entities. Defaults to energy,
+                                                water and resilience
+
+        Returns:
+            EntityStore: A store with one row per entity, the neighborhoods in the order of their IDs 
+            and the homebuyers in the dictionary's order
+
+        Raises:
+            ValueError: If the neighborhood IDs are not 0..N-1
+        """
+        store = cls(schema)
+        for neighb in sorted(neighborhoods.values(), key=attrgetter('entity_id')):
+            store.add_neighborhood(neighb.entity_id, neighb.attributes)
+        for hb in homebuyers.values():
+            store.add_homebuyer(hb.entity_id, hb.attributes, hb.get_priority_ids())
+        return store
+
+    @property
+    def neighborhood_count(self) -> int:
+        """
+        Returns:
+            int: The number of neighborhoods in the store
+        """
+        return len(self.neighborhood_columns['entity_id'])
+
+    @property
+    def homebuyer_count(self) -> int:
+        """
+        Returns:
+            int: The number of homebuyers in the store
+        """
+        return len(self.homebuyer_columns['entity_id'])
+
+    def add_neighborhood(self, entity_id: int, attributes: Sequence[int]) -> None:
+        """
+        Appends a neighborhood row to the store
+
+        Args:
+            entity_id (int): The neighborhood's ID
+            attributes (Sequence[int]): The neighborhood's attribute vector, in the order of the schema
+
+        Raises:
+            ValueError: If the ID is not the next row, see `neighborhood_order_error`
+        """
+        if entity_id != self.neighborhood_count:
+            raise ValueError(self.neighborhood_order_error(self.neighborhood_count))
+        self._ensure_writable()
+        for name, value in zip(self.columns, (entity_id, *attributes)):
+            self.neighborhood_columns[name].append(value)
+        self._neighborhood_vectors = None
+
+    @staticmethod
+    def neighborhood_order_error(expected_id: int) -> str:
+        """
+        Args:
+            expected_id (int): The ID the next neighborhood should have
+
+        Returns:
+            str: The message of the error raised for a neighborhood out of order, duplicated or 
+            missing
+        """
+        return f'expected N{expected_id}, the neighborhoods must be numbered 0..N-1 in order'
+
+    def add_homebuyer(self, entity_id: int, attributes: Sequence[int], priority_ids: List[int]) -> None:
+        """
+        Appends a homebuyer row to the store
+
+        Args:
+            entity_id (int): The homebuyer's ID
+            attributes (Sequence[int]): The homebuyer's attribute vector, in the order of the schema
+            priority_ids (List[int]): The IDs of the preferred neighborhoods, in order of preference
+        """
+        self._ensure_writable()
+        for name, value in zip(self.columns, (entity_id, *attributes)):
+            self.homebuyer_columns[name].append(value)
+        self.priorities.extend(priority_ids)
+        self.priority_offsets.append(len(self.priorities))
+        self._homebuyer_rows = None
+
+    def _ensure_writable(self) -> None:
+        """
+        Copies the columns into arrays if they are read-only buffers, e.g. memory-mapped from a snapshot
+        """
+        if isinstance(self.priorities, array):
+            return
+
+        def copy(buffer: memoryview) -> array:
+            column = array(buffer.format)
+            column.frombytes(buffer.cast('B'))
+            return column
+
+        for columns in (self.neighborhood_columns, self.homebuyer_columns):
+            for name in self.columns:
+                columns[name] = copy(columns[name])
+        self.priorities = copy(self.priorities)
+        self.priority_offsets = copy(self.priority_offsets)
+        self._neighborhood_vectors = None
+
+    def extend_neighborhoods(self, columns: Dict[str, List[int]]) -> None:
+        """
+        Appends a batch of neighborhood rows to the store
+
+        Args:
+            columns (Dict[str, List[int]]): Maps each column name in `columns` to the batch's values,
+                                            the IDs already checked to follow the store's rows
+                                            (see `BulkReader`)
+        """
+        self._ensure_writable()
+        for name in self.columns:
+            self.neighborhood_columns[name].extend(columns[name])
+        self._neighborhood_vectors = None
+
+    def extend_homebuyers(self, columns: Dict[str, List[int]], priorities: List[int], row_lengths: List[int]) -> None:
+        """
+        Appends a batch of homebuyer rows to the store
+
+        Args:
+            columns (Dict[str, List[int]]): Maps each column name in `columns` to the batch's values
+            priorities (List[int]): The preferences of the batch's homebuyers, row after row
+            row_lengths (List[int]): The number of preferences of each homebuyer of the batch
+        """
+        self._ensure_writable()
+        for name in self.columns:
+            self.homebuyer_columns[name].extend(columns[name])
+        self.priorities.extend(priorities)
+        self.priority_offsets.extend(islice(accumulate(row_lengths, initial=self.priority_offsets[-1]), 1, None))
+        self._homebuyer_rows = None
+
+    def priority_row(self, row: int) -> memoryview:
+        """
+        Returns the preferences of a homebuyer without copying them
+
+        Args:
+            row (int): The homebuyer's row
+
+        Returns:
+            memoryview: The neighborhood IDs preferred by the homebuyer, in order of preference
+        """
+        return memoryview(self.priorities)[self.priority_offsets[row]:self.priority_offsets[row + 1]]
+
+    def attribute_columns(self, columns: Dict[str, array]) -> List[array]:
+        """
+        Args:
+            columns (Dict[str, array]): Either `neighborhood_columns` or `homebuyer_columns`
+
+        Returns:
+            List[array]: The attribute columns, in the order of the schema
+        """
+        return [columns[name] for name in self.schema.names]
+
+    def _gather_vectors(self) -> None:
+        """
+        Gathers the attribute vector of every neighborhood and the homebuyers' attribute columns, 
+        kept until the neighborhoods change or the columns are copied
+        """
+        self._neighborhood_vectors = list(zip(*self.attribute_columns(self.neighborhood_columns)))
+        self._homebuyer_attributes = self.attribute_columns(self.homebuyer_columns)
+
+    def neighborhood_vector(self, neighborhood_id: int) -> tuple:
+        """
+        Args:
+            neighborhood_id (int): The neighborhood's ID, which is also its row
+
+        Returns:
+            tuple: The attribute vector of the neighborhood, in the order of the schema
+        """
+        if self._neighborhood_vectors is None:
+            self._gather_vectors()
+        return self._neighborhood_vectors[neighborhood_id]
+
+    def homebuyer_vector(self, row: int) -> tuple:
+        """
+        Returns:
+            tuple: The attribute vector of a homebuyer, in the order of the schema
+        """
+        if self._neighborhood_vectors is None:
+            self._gather_vectors()
+        return tuple(map(itemgetter(row), self._homebuyer_attributes))
+
+    def score(self, row: int, neighborhood_id: int) -> int:
+        """
+        Returns the score of a homebuyer for a neighborhood, the dot product of their attribute
+        vectors (see `AttributeSchema`), or the entry of the `score_matrix` when it is set
+
+        Args:
+            row (int): The homebuyer's row
+            neighborhood_id (int): The neighborhood's ID
+
+        Returns:
+            int: The homebuyer's score for the neighborhood
+        """
+        if self.score_matrix is not None:
+            return int(self.score_matrix.row(row)[neighborhood_id])
+
+        if self._neighborhood_vectors is None:
+            self._gather_vectors()
+        return sum(map(mul, map(itemgetter(row), self._homebuyer_attributes), self._neighborhood_vectors[neighborhood_id]))
+
+    def homebuyer_row(self, entity_id: int) -> int:
+        """
+        Returns the row of a homebuyer given its ID
+
+        Args:
+            entity_id (int): The homebuyer's ID
+
+        Returns:
+            int: The homebuyer's row
+
+        Raises:
+            KeyError: If there is no homebuyer with the given ID
+        """
+        if self._homebuyer_rows is None:
+            self._homebuyer_rows = {
+                entity_id: row for row, entity_id in enumerate(self.homebuyer_columns['entity_id'])
+            }
+        return self._homebuyer_rows[entity_id]
+
+    def homebuyer(self, row: int) -> 'HomeBuyerView':
+        """
+        Returns a view over a homebuyer given its row
+
+        Args:
+            row (int): The homebuyer's row
+
+        Returns:
+            HomeBuyerView: The view over the row
+        """
+        return HomeBuyerView(self, row)
+
+    @property
+    def neighborhoods(self) -> 'NeighborhoodViews':
+        """
+        Returns:
+            NeighborhoodViews: A read-only mapping from neighborhood IDs to `NeighborhoodView` objects
+        """
+        return NeighborhoodViews(self)
+
+    @property
+    def homebuyers(self) -> 'HomeBuyerViews':
+        """
+        Returns:
+            HomeBuyerViews: A read-only mapping from homebuyer IDs to `HomeBuyerView` objects
+        """
+        return HomeBuyerViews(self)
+
+    @property
+    def priority_rows(self) -> 'PriorityRows':
+        """
+        Returns:
+            PriorityRows: The preferences of every homebuyer, indexable by row, for the allocation engines
+        """
+        return PriorityRows(self)
+
+    @property
+    def score_rows(self) -> 'ScoreRows':
+        """
+        Returns:
+            ScoreRows: The scores of every homebuyer, indexable by row, for the allocation engines
+        """
+        return ScoreRows(self)
+
+
+class NeighborhoodView:
+    """
+    A `Neighborhood` backed by a row of an `EntityStore`
+
+    Attributes:
+        prefix (str): A prefix used to identify the type of entity ('N' for Neighborhood)
+    """
+    __slots__ = ('_store', '_row')
+    prefix = Neighborhood.prefix
+
+    def __init__(self, store: EntityStore, row: int) -> None:
+        """
+        Initialize the view over the given row
+        """
+        self._store = store
+        self._row = row
+
+    entity_id = property(lambda self: self._store.neighborhood_columns['entity_id'][self._row])
+    schema = property(lambda self: self._store.schema)
+    attributes = property(lambda self: self._store.neighborhood_vector(self._row))
+
+    def __getattr__(self, name: str) -> int:
+        """
+        Returns the value of an attribute declared by the schema, e.g. `view.energy`
+        """
+        if name.startswith('_') or name not in self._store.schema.name_positions:
+            raise AttributeError(f'{type(self).__name__!r} object has no attribute {name!r}')
+        return self._store.neighborhood_columns[name][self._row]
+
+    __str__ = Neighborhood.__str__
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, NeighborhoodView) and (self._store, self._row) == (other._store, other._row)
+
+    def __hash__(self) -> int:
+        return hash((id(self._store), self._row))
+
+
+class HomeBuyerView:
+    """
+    A `HomeBuyer` backed by a row of an `EntityStore`
+
+    Scores are not stored per homebuyer: `neighborhood_scores` reads them from the store, so
+    `set_neighborhoods_score` has nothing left to do
+
+    Attributes:
+        prefix (str): A prefix used to identify the type of entity ('H' for HomeBuyer)
+    """
+    __slots__ = ('_store', '_row')
+    prefix = HomeBuyer.prefix
+
+    def __init__(self, store: EntityStore, row: int) -> None:
+        """
+        Initialize the view over the given row
+        """
+        self._store = store
+        self._row = row
+
+    entity_id = property(lambda self: self._store.homebuyer_columns['entity_id'][self._row])
+    schema = property(lambda self: self._store.schema)
+    attributes = property(lambda self: self._store.homebuyer_vector(self._row))
+
+    def __getattr__(self, name: str) -> int:
+        """
+        Returns the value of an attribute declared by the schema, e.g. `view.energy`
+        """
+        if name.startswith('_') or name not in self._store.schema.name_positions:
+            raise AttributeError(f'{type(self).__name__!r} object has no attribute {name!r}')
+        return self._store.homebuyer_columns[name][self._row]
+
+    @property
+    def neighborhood_priority(self) -> List[str]:
+        """
+        Returns:
+            List[str]: The neighborhood identifiers in order of preference, e.g., ['N1', 'N0']
+        """
+        return [f'{Neighborhood.prefix}{neighborhood_id}' for neighborhood_id in self.get_priority_ids()]
+
+    @property
+    def neighborhood_scores(self) -> 'ScoreRow':
+        """
+        Returns:
+            ScoreRow: Maps neighborhood IDs to the homebuyer's scores
+        """
+        return ScoreRow(self._store, self._row)
+
+    def get_priority_ids(self) -> List[int]:
+        """
+        Returns:
+            List[int]: The IDs of the preferred neighborhoods, in order of preference
+        """
+        return self._store.priority_row(self._row).tolist()
+
+    def set_neighborhoods_score(self, neighborhoods: Dict[int, Neighborhood]) -> None:
+        """
+        Kept for compatibility with `HomeBuyer`, the scores are derived from the store's columns
+        """
+
+    def is_preferred_neighborhood(self, neighborhood_id: int, priority = 0) -> bool:
+        """
+        Checks if a given neighborhood ID matches the preferred neighborhood at a specified priority
+
+        Args:
+            neighborhood_id (int): The ID of the neighborhood to check
+            priority (int, optional): The priority level to check. Defaults to 0 (highest priority)
+
+        Returns:
+            bool: True if the given neighborhood ID matches the preferred neighborhood at the
+            specified priority, False when the homebuyer ranked fewer neighborhoods
+        """
+        priorities = self._store.priority_row(self._row)
+        return priority < len(priorities) and priorities[priority] == neighborhood_id
+
+    __str__ = HomeBuyer.__str__
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, HomeBuyerView) and (self._store, self._row) == (other._store, other._row)
+
+    def __hash__(self) -> int:
+        return hash((id(self._store), self._row))
+
+
+class ScoreRow:
+    """
+    The scores of one homebuyer, indexable by neighborhood ID like `HomeBuyer.neighborhood_scores`
+    """
+    __slots__ = ('_store', '_row')
+
+    def __init__(self, store: EntityStore, row: int) -> None:
+        self._store = store
+        self._row = row
+
+    def __getitem__(self, neighborhood_id: int) -> int:
+        return self._store.score(self._row, neighborhood_id)
+
+
+class _StoreSequence(Sequence):
+    """
+    Base class of the read-only sequences over the homebuyer rows of a store
+    """
+    __slots__ = ('_store',)
+
+    def __init__(self, store: EntityStore) -> None:
+        self._store = store
+
+    def __len__(self) -> int:
+        return self._store.homebuyer_count
+
+
+class PriorityRows(_StoreSequence):
+    """
+    The preferences of every homebuyer, row `i` holds the neighborhood IDs preferred by the i-th homebuyer
+    """
+    __slots__ = ()
+
+    def __getitem__(self, row: int) -> memoryview:
+        return self._store.priority_row(row)
+
+
+class ScoreRows(_StoreSequence):
+    """
+    The scores of every homebuyer, row `i` maps neighborhood IDs to the i-th homebuyer's scores
+    """
+    __slots__ = ()
+
+    def __getitem__(self, row: int) -> ScoreRow:
+        return ScoreRow(self._store, row)
+
+
+class NeighborhoodViews(Mapping):
+    """
+    Read-only mapping from neighborhood IDs to `NeighborhoodView` objects
+    """
+    def __init__(self, store: EntityStore) -> None:
+        self._store = store
+
+    def __getitem__(self, entity_id: int) -> NeighborhoodView:
+        if not 0 <= entity_id < self._store.neighborhood_count:
+            raise KeyError(entity_id)
+        return NeighborhoodView(self._store, entity_id)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._store.neighborhood_columns['entity_id'])
+
+    def __len__(self) -> int:
+        return self._store.neighborhood_count
+
+
+class HomeBuyerViews(Mapping):
+    """
+    Read-only mapping from homebuyer IDs to `HomeBuyerView` objects
+    """
+    def __init__(self, store: EntityStore) -> None:
+        self._store = store
+
+    def __getitem__(self, entity_id: int) -> HomeBuyerView:
+        return HomeBuyerView(self._store, self._store.homebuyer_row(entity_id))
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._store.homebuyer_columns['entity_id'])
+
+    def __len__(self) -> int:
+        return self._store.homebuyer_count
+
+    def values(self) -> Iterator[HomeBuyerView]:
+        """
+        Returns:
+            Iterator[HomeBuyerView]: The views of every homebuyer, in row order, without ID lookups
+        """
+        return (HomeBuyerView(self._store, row) for row in range(len(self)))
@@ -1,5 +1,5 @@
-from algorithm import PlaceHomeBuyersInNeighborhoods
+import sys
 
-input_file_address = 'data/input.txt'
-allocator  = PlaceHomeBuyersInNeighborhoods(input_file_address)
-allocator .execute()
\ No newline at end of file
+from algorithm.cli import main
+
+sys.exit(main())
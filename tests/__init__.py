@@ -1,2 +1,3 @@
 from .algorithm_tests import *
-from .entities_tests import *
\ No newline at end of file
+from .entities_tests import *
+from .benchmarks_tests import *
\ No newline at end of file
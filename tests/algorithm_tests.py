@@ -1,8 +1,65 @@
-from unittest import TestCase
+import asyncio
+import gzip
+import importlib.util
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+from unittest import IsolatedAsyncioTestCase, TestCase, skipUnless
 from unittest.mock import patch, mock_open
 
 from algorithm import PlaceHomeBuyersInNeighborhoods
-from entities import HomeBuyer, Neighborhood
+from algorithm.allocation_state import AllocationState
+from algorithm.batch import BatchRunner
+from algorithm import cli
+from algorithm.checkpoint import Checkpoint, CheckpointError
+from algorithm.deferred_acceptance import DeferredAcceptance
+from algorithm.delta import DeltaReader, DeltaWriter, NeighborhoodDelta, apply_delta, compact_output, diff_allocations
+from algorithm.out_of_core import OutOfCoreAllocator
+from algorithm.ranked_index import RankedIndex
+from algorithm.scenarios import Scenario, ScenarioRunner
+from algorithm.service import AllocationService, send
+from algorithm.score_matrix import ScoreMatrix
+from algorithm.snapshot import Snapshot, SnapshotError
+from algorithm.stats import ExecutionStats
+from algorithm.verifier import AllocationVerifier
+from algorithm.writer import OutputReader, OutputWriter
+from benchmarks.generator import InputGenerator
+from entities import EntityStore, HomeBuyer, Neighborhood
+from entities.attributes import AttributeSchema
+from entities.reader import InputFormatError
+
+HAS_NUMPY = importlib.util.find_spec('numpy') is not None
+
+SAMPLE_LINES = [
+    'N N0 E:7 W:7 R:10', 'N N1 E:2 W:1 R:1', 'N N2 E:7 W:6 R:4',
+    'H H0 E:3 W:9 R:2 N2>N0>N1', 'H H1 E:4 W:3 R:7 N0>N2>N1', 'H H2 E:4 W:0 R:10 N0>N2>N1',
+    'H H3 E:10 W:3 R:8 N2>N0>N1', 'H H4 E:6 W:10 R:1 N0>N2>N1', 'H H5 E:6 W:7 R:7 N0>N2>N1',
+    'H H6 E:8 W:6 R:9 N2>N1>N0', 'H H7 E:7 W:1 R:5 N2>N1>N0', 'H H8 E:8 W:2 R:3 N1>N0>N2',
+    'H H9 E:10 W:2 R:1 N1>N2>N0', 'H H10 E:6 W:4 R:5 N0>N2>N1', 'H H11 E:8 W:4 R:7 N0>N1>N2',
+]
+SAMPLE_ALLOCATION = {0: [5, 11, 2, 4], 1: [9, 8, 7, 1], 2: [6, 3, 10, 0]}
+WIDE_SCHEMA = AttributeSchema.parse('X0,R=resilience,X1,X2,W=water,X3,X4,X5,E=energy,X6,X7,X8')
+
+
+def allocate_sample(**options) -> dict:
+    """
+    Runs the allocator on `SAMPLE_LINES` and returns the IDs of the homebuyers of each neighborhood
+    """
+    allocator = PlaceHomeBuyersInNeighborhoods('fake_path/input.txt', **options)
+    for line in SAMPLE_LINES:
+        allocator._parse_line(line)
+    allocator._score_homebuyers()
+    allocator.initialize_algorithm()
+    allocator.assign_homebuyers()
+    return {
+        neighb: [hb.entity_id for hb in homebuyers] 
+        for neighb, homebuyers in allocator.priority_buyers.items()
+    }
 
 
 class PlaceHomeBuyersInNeighborhoodsTest(TestCase):
@@ -40,7 +97,7 @@ class PlaceHomeBuyersInNeighborhoodsTest(TestCase):
         m.return_value.__iter__ = lambda self: self
         m.return_value.__next__ = lambda self: next(iter(self.readline, ''))
 
-        with patch('builtins.open', m):
+        with patch('builtins.open', m), patch('entities.compression.detect_compression', return_value=None):
             self.allocator_algorithm.read_input_file()
 
 
@@ -82,6 +139,234 @@ class PlaceHomeBuyersInNeighborhoodsTest(TestCase):
             }
         )
     
+    def test_assign_homebuyers_deferred_acceptance(self):
+        """
+        Test the `assign_homebuyers` method with the 'deferred_acceptance' engine
+        """
+        for hb in self.homebuyers.values():
+            hb.set_neighborhoods_score(self.neighborhoods)
+
+        allocator = PlaceHomeBuyersInNeighborhoods('fake_path/input.txt', engine='deferred_acceptance')
+        allocator.homebuyers = self.homebuyers
+        allocator.neighborhoods = self.neighborhoods
+        allocator.initialize_algorithm()
+
+        allocator.assign_homebuyers()
+
+        self.assertEqual(
+            allocator.priority_buyers, 
+            {
+                0: [self.homebuyers[2], self.homebuyers[1]], 
+                1: [self.homebuyers[3], self.homebuyers[0]]
+            }
+        )
+        self.assertEqual(allocator._unallocated_homebuyers, set())
+
+    def test_engines_produce_same_allocation(self):
+        """
+        Test that both engines produce the same `priority_buyers` on the sample input
+        """
+        for engine in PlaceHomeBuyersInNeighborhoods.ENGINES:
+            self.assertEqual(allocate_sample(engine=engine), SAMPLE_ALLOCATION)
+
+    def test_columnar_storage(self):
+        """
+        Test that both engines produce the same `priority_buyers` on top of the columnar store
+        """
+        for engine in PlaceHomeBuyersInNeighborhoods.ENGINES:
+            self.assertEqual(allocate_sample(engine=engine, storage='columnar'), SAMPLE_ALLOCATION)
+
+    def test_recursive_engine_state(self):
+        """
+        Test the per-homebuyer state left by the 'recursive' engine, and that ties are broken in 
+        favour of the lowest homebuyer ID
+        """
+        allocator = PlaceHomeBuyersInNeighborhoods('fake_path/input.txt')
+        for line in ['N N0 E:1 W:1 R:1', 'N N1 E:1 W:1 R:1', 'H H0 E:1 W:1 R:1 N0', 'H H1 E:1 W:1 R:1 N0',
+                     'H H2 E:1 W:1 R:1 N0>N1', 'H H3 E:2 W:2 R:2 N1']:
+            allocator._parse_line(line)
+        allocator.initialize_algorithm()
+        allocator.assign_homebuyers()
+
+        self.assertEqual(
+            {neighb: [hb.entity_id for hb in hbs] for neighb, hbs in allocator.priority_buyers.items()},
+            {0: [0, 1], 1: [3, 2]}
+        )
+        state = allocator._buyer_state
+        self.assertEqual(list(state.assigned), [0, 0, 1, 1])
+        self.assertEqual(set(state.status), {AllocationState.HELD})
+        self.assertEqual([state.index.order[position] for position in state.index.ranked_at(1, 1)], [state.rows[2]])
+        self.assertEqual(allocator._unallocated_homebuyers, set())
+
+    def test_attribute_schema(self):
+        """
+        Test that twelve attributes, the extra ones being zero or missing, give the same allocation 
+        with every engine, storage and reader
+        """
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        input_path = os.path.join(directory.name, 'input.txt')
+        with open(input_path, 'w') as file:
+            for idx, line in enumerate(SAMPLE_LINES):
+                tokens = line.split()
+                extra = [f'X{position}:0' for position in range(9)][:idx % 10]
+                file.write(' '.join(tokens[:2] + extra + tokens[2:]) + '\n')
+
+        for engine in PlaceHomeBuyersInNeighborhoods.ENGINES:
+            for storage, reader in (('objects', 'lines'), ('columnar', 'lines'), ('columnar', 'bulk')):
+                with self.subTest(engine=engine, storage=storage, reader=reader):
+                    allocator = PlaceHomeBuyersInNeighborhoods(
+                        input_path, engine=engine, storage=storage, reader=reader, schema=WIDE_SCHEMA, 
+                        output_path=io.StringIO(),
+                    )
+                    allocator.execute()
+                    self.assertEqual(
+                        {neighb: [hb.entity_id for hb in hbs] for neighb, hbs in allocator.priority_buyers.items()}, 
+                        SAMPLE_ALLOCATION
+                    )
+
+        with OutOfCoreAllocator(input_path, output_path=io.StringIO(), schema=WIDE_SCHEMA) as allocator:
+            allocator.execute()
+            allocation = {neighb: [hb for hb, _ in homebuyers] for neighb, homebuyers in allocator.allocation()}
+        self.assertEqual(allocation, SAMPLE_ALLOCATION)
+
+        with self.assertRaises(ValueError):
+            PlaceHomeBuyersInNeighborhoods(input_path, output_path=io.StringIO()).execute()
+
+    def test_truncated_preferences(self):
+        """
+        Test that homebuyers ranking a few of many neighborhoods are allocated by both engines, and 
+        that those who run out of choices are reported as unassigned
+        """
+        rng = random.Random(7)
+        lines = [f'N N{idx} E:{rng.randint(0, 10)} W:{rng.randint(0, 10)} R:{rng.randint(0, 10)}' for idx in range(1500)]
+        for idx in range(3000):
+            ranked = '>'.join(f'N{neighb}' for neighb in rng.sample(range(20), 2))
+            lines.append(f'H H{idx} E:{rng.randint(0, 10)} W:{rng.randint(0, 10)} R:{rng.randint(0, 10)} {ranked}')
+
+        for engine in PlaceHomeBuyersInNeighborhoods.ENGINES:
+            allocator = PlaceHomeBuyersInNeighborhoods('fake_path/input.txt', engine=engine)
+            for line in lines:
+                allocator._parse_line(line)
+            allocator.initialize_algorithm()
+            allocator.assign_homebuyers()
+
+            allocated = [hb for homebuyers in allocator.priority_buyers.values() for hb in homebuyers]
+            self.assertEqual(len(allocated), 20 * allocator.neighb_limit)
+            for neighb, homebuyers in allocator.priority_buyers.items():
+                for hb in homebuyers:
+                    self.assertIn(neighb, hb.get_priority_ids())
+            self.assertEqual(
+                sorted([hb.entity_id for hb in allocated] + allocator.unassigned_homebuyers()), list(range(3000))
+            )
+            self.assertLessEqual(len(allocator.homebuyers[0].neighborhood_scores), 2)
+
+    def test_compressed_input(self):
+        """
+        Test that a compressed input file gives the allocation of the plain file, with both readers
+        and several parser workers
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'input.txt')
+            with gzip.open(path, 'wt') as file:
+                file.write('\n'.join(SAMPLE_LINES) + '\n')
+
+            for options in ({}, dict(storage='columnar', reader='bulk', workers=2)):
+                with self.subTest(**options):
+                    allocator = PlaceHomeBuyersInNeighborhoods(path, engine='deferred_acceptance', **options)
+                    allocator.read_input_file()
+                    allocator.initialize_algorithm()
+                    allocator.assign_homebuyers()
+                    self.assertEqual(
+                        {neighb: [hb.entity_id for hb in hbs] for neighb, hbs in allocator.priority_buyers.items()},
+                        SAMPLE_ALLOCATION,
+                    )
+
+        with self.assertRaises(ValueError):
+            PlaceHomeBuyersInNeighborhoods('fake_path/input.txt', workers=2)
+        with self.assertRaises(ValueError):
+            PlaceHomeBuyersInNeighborhoods('fake_path/input.txt', workers=0)
+
+    def test_bulk_reader(self):
+        """
+        Test that the 'bulk' reader gives the same allocation as the 'lines' reader
+        """
+        handle, file_path = tempfile.mkstemp(suffix='.txt')
+        with os.fdopen(handle, 'w') as file:
+            file.write('\n'.join(SAMPLE_LINES) + '\n')
+        self.addCleanup(os.remove, file_path)
+
+        allocator = PlaceHomeBuyersInNeighborhoods(
+            file_path, engine='deferred_acceptance', storage='columnar', reader='bulk'
+        )
+        allocator.read_input_file()
+        allocator.initialize_algorithm()
+        allocator.assign_homebuyers()
+
+        self.assertEqual(
+            {neighb: [hb.entity_id for hb in hbs] for neighb, hbs in allocator.priority_buyers.items()}, 
+            SAMPLE_ALLOCATION
+        )
+        with self.assertRaises(ValueError):
+            PlaceHomeBuyersInNeighborhoods(file_path, reader='bulk')
+
+    def test_columnar_neighborhood_order(self):
+        """
+        Test that the 'columnar' storage, whose rows are the neighborhood IDs, rejects neighborhoods 
+        out of order with either reader, while the 'objects' storage accepts them
+        """
+        handle, file_path = tempfile.mkstemp(suffix='.txt')
+        with os.fdopen(handle, 'w') as file:
+            file.write('\n'.join([SAMPLE_LINES[1], SAMPLE_LINES[0], *SAMPLE_LINES[2:]]) + '\n')
+        self.addCleanup(os.remove, file_path)
+
+        for reader in ('lines', 'bulk'):
+            with self.subTest(reader=reader):
+                allocator = PlaceHomeBuyersInNeighborhoods(file_path, storage='columnar', reader=reader)
+                with self.assertRaises(InputFormatError) as context:
+                    allocator.read_input_file()
+                self.assertEqual(context.exception.line_number, 1)
+
+        allocator = PlaceHomeBuyersInNeighborhoods(file_path, engine='deferred_acceptance')
+        allocator.read_input_file()
+        allocator.initialize_algorithm()
+        allocator.assign_homebuyers()
+        self.assertEqual(
+            {neighb: [hb.entity_id for hb in hbs] for neighb, hbs in allocator.priority_buyers.items()}, 
+            SAMPLE_ALLOCATION
+        )
+
+    def test_unknown_neighborhood(self):
+        """
+        Test that a homebuyer ranking a neighborhood missing from the input is rejected while parsing, 
+        with every engine, storage and reader
+        """
+        handle, file_path = tempfile.mkstemp(suffix='.txt')
+        with os.fdopen(handle, 'w') as file:
+            file.write('\n'.join(SAMPLE_LINES + ['H H12 E:1 W:1 R:1 N0>N3']) + '\n')
+        self.addCleanup(os.remove, file_path)
+
+        options = [
+            {'storage': 'objects'}, {'storage': 'objects', 'scoring': 'vectorized'}, 
+            {'storage': 'columnar'}, {'storage': 'columnar', 'reader': 'bulk'},
+        ]
+        for engine in PlaceHomeBuyersInNeighborhoods.ENGINES:
+            for option in options:
+                if option.get('scoring') == 'vectorized' and not HAS_NUMPY:
+                    continue
+                with self.subTest(engine=engine, **option):
+                    allocator = PlaceHomeBuyersInNeighborhoods(file_path, engine=engine, **option)
+                    with self.assertRaises(InputFormatError) as context:
+                        allocator.read_input_file()
+                    self.assertEqual(context.exception.line_number, len(SAMPLE_LINES) + 1)
+
+    def test_unknown_engine(self):
+        """
+        Test that an unknown engine is rejected
+        """
+        with self.assertRaises(ValueError):
+            PlaceHomeBuyersInNeighborhoods('fake_path/input.txt', engine='unknown')
+
     @patch('builtins.open', new_callable=mock_open)
     def test_write_output_data(self, mock_file):
         """
@@ -102,4 +387,1393 @@ class PlaceHomeBuyersInNeighborhoodsTest(TestCase):
             'N1: H3(31) H0(17)\n'
         )
         
-        mock_file().write.assert_called_once_with(expected_data)
+        mock_file.assert_called_once_with('data/output.txt', 'w', newline=None)
+        self.assertEqual(mock_file().write.call_count, 2)
+        self.assertEqual(''.join(call.args[0] for call in mock_file().write.call_args_list), expected_data)
+
+
+@skipUnless(HAS_NUMPY, 'NumPy is not installed')
+class ScoreMatrixTest(TestCase):
+    def setUp(self):
+        self.neighborhoods = {
+            0: Neighborhood.create_from_string('N N0 E:7 W:7 R:10'),
+            1: Neighborhood.create_from_string('N N1 E:2 W:1 R:1')
+        }
+        self.homebuyers = [
+            HomeBuyer.create_from_string('H H0 E:3 W:9 R:2 N0>N1'),
+            HomeBuyer.create_from_string('H H1 E:4 W:3 R:7 N0>N1'),
+            HomeBuyer.create_from_string('H H2 E:4 W:0 R:10 N0>N1'),
+        ]
+
+    def test_matches_set_neighborhoods_score(self):
+        """
+        Test that the matrix holds the same scores as `set_neighborhoods_score`, across chunks, 
+        with a column per neighborhood ID whatever the order of the neighborhoods
+        """
+        neighborhoods = dict(reversed(self.neighborhoods.items()))
+        store = EntityStore.from_entities(neighborhoods, dict(enumerate(self.homebuyers)))
+        score_matrices = (
+            ScoreMatrix.from_entities(self.homebuyers, neighborhoods, chunk_size=2),
+            ScoreMatrix.from_store(store, chunk_size=2),
+        )
+
+        for row, hb in enumerate(self.homebuyers):
+            hb.set_neighborhoods_score(self.neighborhoods)
+            for score_matrix in score_matrices:
+                for neighb in self.neighborhoods:
+                    self.assertEqual(score_matrix.row(row)[neighb], hb.neighborhood_scores[neighb])
+
+    def test_vectorized_scoring(self):
+        """
+        Test that the 'vectorized' scoring writes the same output as the 'python' scoring
+        """
+        file_content = (
+            'N N0 E:7 W:7 R:10\n'
+            'N N1 E:2 W:1 R:1\n'
+            'H H0 E:3 W:9 R:2 N0>N1\n'
+            'H H1 E:4 W:3 R:7 N0>N1\n'
+            'H H2 E:4 W:0 R:10 N0>N1\n'
+            'H H3 E:10 W:3 R:8 N1>N0\n'
+        )
+        allocator = PlaceHomeBuyersInNeighborhoods('fake_path/input.txt', scoring='vectorized')
+
+        m = mock_open(read_data=file_content)
+        m.return_value.__iter__ = lambda self: self
+        m.return_value.__next__ = lambda self: next(iter(self.readline, ''))
+        with patch('builtins.open', m), patch('entities.compression.detect_compression', return_value=None):
+            allocator.execute()
+
+        self.assertEqual(''.join(call.args[0] for call in m().write.call_args_list), 'N0: H2(128) H1(119)\nN1: H3(31) H0(17)\n')
+
+    def test_vectorized_jsonl_output(self):
+        """
+        Test that the scores stored as NumPy integers by the 'vectorized' scoring are written as JSON
+        """
+        output = io.StringIO()
+        allocator = PlaceHomeBuyersInNeighborhoods(
+            'fake_path/input.txt', scoring='vectorized', output_path=output, output_format='jsonl'
+        )
+        for line in SAMPLE_LINES:
+            allocator._parse_line(line)
+        allocator._score_homebuyers()
+        allocator.initialize_algorithm()
+        allocator.assign_homebuyers()
+        allocator.write_output_file()
+
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(
+            {int(record['neighborhood'][1:]): [int(hb['homebuyer'][1:]) for hb in record['homebuyers']] for record in records},
+            SAMPLE_ALLOCATION
+        )
+        self.assertEqual(records[0]['homebuyers'][1], {'homebuyer': 'H11', 'score': 154})
+
+    def test_vectorized_columnar_scoring(self):
+        """
+        Test the 'vectorized' scoring on top of the columnar store
+        """
+        self.assertEqual(
+            allocate_sample(engine='deferred_acceptance', scoring='vectorized', storage='columnar'), 
+            SAMPLE_ALLOCATION
+        )
+
+
+class RankedIndexTest(TestCase):
+    def setUp(self):
+        # Rows 0 and 2 tie on N0, the lowest ID (row 2) comes first
+        self.index = RankedIndex.build(
+            preferences=[[0, 1], [1, 0], [0], [1, 5]],
+            scores=[{0: 10, 1: 4}, {0: 7, 1: 9}, {0: 10}, {1: 9, 5: 1}],
+            tie_breakers=[3, 1, 2, 0],
+            neighborhood_count=2,
+        )
+
+    def _rows(self, neighborhood_id: int, priority: int) -> list:
+        return [self.index.order[position] for position in self.index.ranked_at(neighborhood_id, priority)]
+
+    def test_build(self):
+        """
+        Test that each neighborhood's homebuyers are sorted by score then ID, and grouped by priority
+        """
+        self.assertEqual(list(self.index.order), [2, 0, 1, 3, 1, 0])
+        self.assertEqual(list(self.index.order_offsets), [0, 3, 6])
+        self.assertEqual(self._rows(0, 0), [2, 0])
+        self.assertEqual(self._rows(0, 1), [1])
+        self.assertEqual(self._rows(1, 0), [3, 1])
+        self.assertEqual(self._rows(1, 1), [0])
+        self.assertEqual(self._rows(1, 2), [])
+        self.assertEqual(self.index.positions_of(1, [0, 3]), [3, 5])
+        self.assertTrue(self.index.fits(4, 2))
+
+    def test_sections(self):
+        """
+        Test that an index is rebuilt from its arrays, and that arrays that do not fit are rejected
+        """
+        sections = self.index.sections()
+        index = RankedIndex.from_sections(sections)
+        self.assertEqual(list(index.order), list(self.index.order))
+        self.assertEqual(list(index.ranked_at(0, 0)), list(self.index.ranked_at(0, 0)))
+        self.assertTrue(index.fits(4, 2))
+
+        sections['order'] = sections['order'][:-1]
+        with self.assertRaises(ValueError):
+            RankedIndex.from_sections(sections)
+
+    def test_allocation_unchanged(self):
+        """
+        Test that the 'recursive' engine gives the same allocation with the index on every storage
+        """
+        for storage in PlaceHomeBuyersInNeighborhoods.STORAGES:
+            self.assertEqual(allocate_sample(storage=storage), SAMPLE_ALLOCATION)
+
+    def test_reused_across_runs(self):
+        """
+        Test that the index is built once and reused by a second run, and rebuilt after an update
+        """
+        allocator = PlaceHomeBuyersInNeighborhoods('fake_path/input.txt')
+        for line in SAMPLE_LINES:
+            allocator._parse_line(line)
+        allocator._score_homebuyers()
+        index = allocator.ranked_index
+        self.assertIsNotNone(index)
+
+        for _ in range(2):
+            allocator.initialize_algorithm()
+            allocator.assign_homebuyers()
+            self.assertIs(allocator._buyer_state.index, index)
+
+        allocator.add_homebuyer(HomeBuyer.create_from_string('H H12 E:9 W:9 R:9 N2>N0>N1'))
+        self.assertIsNot(allocator._buyer_state.index, index)
+        self.assertEqual(allocator.ranked_index.homebuyer_count, 13)
+        self.assertEqual([hb.entity_id for hb in allocator.priority_buyers[2]][0], 12)
+
+
+class SnapshotTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.input_path = os.path.join(directory.name, 'input.txt')
+        self.snapshot_path = os.path.join(directory.name, 'input.snapshot')
+        with open(self.input_path, 'w') as file:
+            file.write('\n'.join(SAMPLE_LINES) + '\n')
+
+    def _allocator(self, engine: str = 'deferred_acceptance', **options) -> PlaceHomeBuyersInNeighborhoods:
+        return PlaceHomeBuyersInNeighborhoods(
+            self.input_path, engine=engine, storage='columnar', snapshot_path=self.snapshot_path, **options
+        )
+
+    def test_round_trip(self):
+        """
+        Test that a snapshot is written on the first run and loaded, unchanged, on the next one
+        """
+        first = self._allocator()
+        first.read_input_file()
+        self.assertTrue(os.path.exists(self.snapshot_path))
+
+        second = self._allocator()
+        with patch.object(PlaceHomeBuyersInNeighborhoods, '_parse_input_file') as parse:
+            second.read_input_file()
+        parse.assert_not_called()
+
+        self.assertEqual(second.store.homebuyer_columns, first.store.homebuyer_columns)
+        self.assertEqual(second.store.neighborhood_columns, first.store.neighborhood_columns)
+        self.assertEqual(second.store.priorities, first.store.priorities)
+        self.assertEqual(second.store.priority_offsets, first.store.priority_offsets)
+
+        second.initialize_algorithm()
+        second.assign_homebuyers()
+        self.assertEqual(
+            {neighb: [hb.entity_id for hb in hbs] for neighb, hbs in second.priority_buyers.items()}, 
+            SAMPLE_ALLOCATION
+        )
+
+    def test_stale_snapshot(self):
+        """
+        Test that a snapshot of another input is detected and rebuilt
+        """
+        self._allocator().read_input_file()
+        with open(self.input_path, 'a') as file:
+            file.write('H H12 E:1 W:1 R:1 N0>N1>N2\n')
+
+        with self.assertRaises(SnapshotError):
+            Snapshot(self.snapshot_path).load(self.input_path)
+
+        allocator = self._allocator()
+        allocator.read_input_file()
+        self.assertEqual(len(allocator.homebuyers), 13)
+        self.assertEqual(Snapshot(self.snapshot_path).load(self.input_path).homebuyer_count, 13)
+
+    def test_corrupt_snapshot(self):
+        """
+        Test that a snapshot written by another version of the format is rejected
+        """
+        with open(self.snapshot_path, 'wb') as file:
+            file.write(b'not a snapshot')
+
+        with self.assertRaises(SnapshotError):
+            Snapshot(self.snapshot_path).load(self.input_path)
+
+    def test_loaded_store_is_writable(self):
+        """
+        Test that a store loaded from a snapshot can still be modified
+        """
+        self._allocator().read_input_file()
+        store = Snapshot(self.snapshot_path).load(self.input_path)
+
+        store.add_homebuyer(12, (1, 1, 1), [0, 1])
+
+        self.assertEqual(store.homebuyer_count, 13)
+        self.assertEqual(store.priority_row(12).tolist(), [0, 1])
+
+    def test_other_schema(self):
+        """
+        Test that a snapshot built with other attributes is rejected and rebuilt
+        """
+        self._allocator().read_input_file()
+
+        with self.assertRaises(SnapshotError):
+            Snapshot(self.snapshot_path).load(self.input_path, WIDE_SCHEMA)
+
+        allocator = self._allocator(schema=WIDE_SCHEMA)
+        allocator.read_input_file()
+        self.assertEqual(allocator.store.columns, ('entity_id', *WIDE_SCHEMA.names))
+        self.assertEqual(Snapshot(self.snapshot_path).load(self.input_path, WIDE_SCHEMA).homebuyer_count, 12)
+
+    def test_ranked_index(self):
+        """
+        Test that the 'recursive' engine's index is saved with the store and loaded instead of being
+        rebuilt, and that a snapshot saved without it gets it on the first run that builds it
+        """
+        self._allocator().read_input_file()
+        self.assertIsNone(Snapshot(self.snapshot_path).load(self.input_path).ranked_index)
+
+        first = self._allocator(engine='recursive')
+        first.read_input_file()
+        self.assertIsNotNone(Snapshot(self.snapshot_path).load(self.input_path).ranked_index)
+
+        second = self._allocator(engine='recursive')
+        with patch.object(RankedIndex, 'build') as build:
+            second.read_input_file()
+        build.assert_not_called()
+        self.assertEqual(list(second.ranked_index.order), list(first.ranked_index.order))
+        self.assertEqual(list(second.ranked_index.positions), list(first.ranked_index.positions))
+
+        second.initialize_algorithm()
+        second.assign_homebuyers()
+        self.assertEqual(
+            {neighb: [hb.entity_id for hb in hbs] for neighb, hbs in second.priority_buyers.items()}, 
+            SAMPLE_ALLOCATION
+        )
+
+    @skipUnless(HAS_NUMPY, 'NumPy is not installed')
+    def test_score_matrix(self):
+        """
+        Test that the score matrix is saved with the 'vectorized' scoring
+        """
+        first = self._allocator(scoring='vectorized')
+        first.read_input_file()
+
+        store = Snapshot(self.snapshot_path).load(self.input_path)
+        self.assertIsNotNone(store.score_matrix)
+        self.assertEqual(store.score_matrix.matrix.tolist(), first.score_matrix.matrix.tolist())
+
+
+class Interrupted(Exception):
+    pass
+
+
+class CheckpointTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.input_path = os.path.join(directory.name, 'input.txt')
+        self.checkpoint_path = os.path.join(directory.name, 'input.checkpoint')
+        InputGenerator(10, 600, 10, seed=5, popularity='zipf').write(self.input_path)
+
+    def _run(self, engine: str, resume: bool = False, stop_after: int = None, **options) -> tuple:
+        """
+        Runs the allocator and returns its output and unassigned homebuyers, or raises `Interrupted`
+        once `stop_after` checkpoints are written
+        """
+        output = io.StringIO()
+        allocator = PlaceHomeBuyersInNeighborhoods(self.input_path, engine=engine, output_path=output, **options)
+        allocator.CHECKPOINT_STRIDE = 50
+        if stop_after is not None:
+            save, saved = allocator._save_checkpoint, []
+
+            def save_then_stop(*args):
+                save(*args)
+                saved.append(args[0])
+                if len(saved) == stop_after:
+                    raise Interrupted
+
+            allocator._save_checkpoint = save_then_stop
+        allocator.resume() if resume else allocator.execute()
+        return output.getvalue(), allocator.unassigned_homebuyers()
+
+    def test_resume(self):
+        """
+        Test that runs interrupted after each checkpoint and resumed give the uninterrupted result
+        """
+        for engine in PlaceHomeBuyersInNeighborhoods.ENGINES:
+            expected = self._run(engine)
+            for stop_after in (1, 2, 3):
+                with self.subTest(engine=engine, stop_after=stop_after):
+                    with self.assertRaises(Interrupted):
+                        self._run(engine, stop_after=stop_after, checkpoint_path=self.checkpoint_path, checkpoint_interval=0)
+                    self.assertTrue(os.path.exists(self.checkpoint_path))
+
+                    self.assertEqual(self._run(engine, resume=True, checkpoint_path=self.checkpoint_path), expected)
+                    self.assertFalse(os.path.exists(self.checkpoint_path))
+
+    def test_unusable_checkpoint(self):
+        """
+        Test that a checkpoint of another engine or another input is ignored and the run starts over
+        """
+        expected = self._run('recursive')
+        with self.assertRaises(Interrupted):
+            self._run('deferred_acceptance', stop_after=1, checkpoint_path=self.checkpoint_path, checkpoint_interval=0)
+
+        with self.assertRaises(CheckpointError):
+            Checkpoint(self.checkpoint_path).load(self.input_path, 'recursive')
+        self.assertEqual(self._run('recursive', resume=True, checkpoint_path=self.checkpoint_path), expected)
+
+        with open(self.checkpoint_path, 'wb') as file:
+            file.write(b'not a checkpoint')
+        with self.assertRaises(CheckpointError):
+            Checkpoint(self.checkpoint_path).load(self.input_path, 'recursive')
+        self.assertEqual(self._run('recursive', resume=True, checkpoint_path=self.checkpoint_path), expected)
+
+    def test_invalid_options(self):
+        """
+        Test that resuming without a checkpoint path and a negative interval are rejected
+        """
+        with self.assertRaises(ValueError):
+            PlaceHomeBuyersInNeighborhoods(self.input_path).resume()
+        with self.assertRaises(ValueError):
+            PlaceHomeBuyersInNeighborhoods(self.input_path, checkpoint_path=self.checkpoint_path, checkpoint_interval=-1)
+
+
+class IncrementalAllocationTest(TestCase):
+    def setUp(self):
+        self.allocator = PlaceHomeBuyersInNeighborhoods('fake_path/input.txt', engine='deferred_acceptance')
+        for line in SAMPLE_LINES:
+            self.allocator._parse_line(line)
+        self.allocator.initialize_algorithm()
+        self.allocator.assign_homebuyers()
+
+    def _recompute(self) -> dict:
+        """
+        Runs the whole algorithm again on the allocator's current entities
+        """
+        allocator = PlaceHomeBuyersInNeighborhoods('fake_path/input.txt', engine='deferred_acceptance')
+        for neighb in self.allocator.neighborhoods.values():
+            allocator._parse_line(str(neighb))
+        for hb in self.allocator.homebuyers.values():
+            allocator._parse_line(str(hb))
+        allocator.initialize_algorithm()
+        allocator.assign_homebuyers()
+        return {neighb: [hb.entity_id for hb in hbs] for neighb, hbs in allocator.priority_buyers.items()}
+
+    def _current(self) -> dict:
+        return {neighb: [hb.entity_id for hb in hbs] for neighb, hbs in self.allocator.priority_buyers.items()}
+
+    def test_add_remove_update(self):
+        """
+        Test that each incremental update gives the same allocation as a full recompute
+        """
+        self.allocator.add_homebuyer(HomeBuyer.create_from_string('H H12 E:9 W:9 R:9 N1>N0>N2'))
+        self.assertEqual(self._current(), self._recompute())
+        self.assertEqual(self.allocator.neighb_limit, 4)
+
+        for entity_id in range(13, 16):
+            self.allocator.add_homebuyer(HomeBuyer.create_from_string(f'H H{entity_id} E:1 W:2 R:3 N2>N1'))
+        self.assertEqual(self.allocator.neighb_limit, 5)
+        self.assertEqual(self._current(), self._recompute())
+
+        self.allocator.remove_homebuyer(5)
+        self.assertEqual(self._current(), self._recompute())
+
+        self.allocator.update_neighborhood(Neighborhood.create_from_string('N N1 E:9 W:1 R:9'))
+        self.assertEqual(self._current(), self._recompute())
+
+        allocated = {hb.entity_id for hbs in self.allocator.priority_buyers.values() for hb in hbs}
+        self.assertEqual({hb.entity_id for hb in self.allocator._allocated_homebuyers}, allocated)
+        self.assertEqual(
+            {hb.entity_id for hb in self.allocator._unallocated_homebuyers}, 
+            set(self.allocator.homebuyers) - allocated
+        )
+
+    def test_unknown_neighborhood(self):
+        """
+        Test that a homebuyer ranking an unknown neighborhood is rejected by both engines, leaving the 
+        allocation unchanged
+        """
+        for engine in PlaceHomeBuyersInNeighborhoods.ENGINES:
+            with self.subTest(engine=engine):
+                allocator = PlaceHomeBuyersInNeighborhoods('fake_path/input.txt', engine=engine)
+                for line in SAMPLE_LINES:
+                    allocator._parse_line(line)
+                allocator.initialize_algorithm()
+                allocator.assign_homebuyers()
+                with self.assertRaisesRegex(ValueError, 'N3'):
+                    allocator.add_homebuyer(HomeBuyer.create_from_string('H H12 E:9 W:9 R:9 N3>N0'))
+                self.assertNotIn(12, allocator.homebuyers)
+                self.assertEqual(
+                    {neighb: [hb.entity_id for hb in hbs] for neighb, hbs in allocator.priority_buyers.items()},
+                    SAMPLE_ALLOCATION if engine == 'deferred_acceptance' else allocate_sample(engine=engine),
+                )
+
+    def test_recursive_engine_recomputes(self):
+        """
+        Test that the 'recursive' engine applies updates by running the algorithm again
+        """
+        allocator = PlaceHomeBuyersInNeighborhoods('fake_path/input.txt')
+        for line in SAMPLE_LINES:
+            allocator._parse_line(line)
+        allocator.initialize_algorithm()
+        allocator.assign_homebuyers()
+
+        allocator.remove_homebuyer(5)
+
+        self.assertNotIn(5, [hb.entity_id for hbs in allocator.priority_buyers.values() for hb in hbs])
+        self.assertEqual(allocator.neighb_limit, 3)
+
+    def test_random_repairs(self):
+        """
+        Test the `DeferredAcceptance` repairs against a full run on random instances
+        """
+        for seed in range(300):
+            rng = random.Random(seed)
+            neighborhoods, homebuyers = rng.randint(1, 6), rng.randint(1, 20)
+            new_preferences = lambda: rng.sample(range(neighborhoods), rng.randint(1, neighborhoods))
+            new_scores = lambda: {n: rng.randint(0, 5) for n in range(neighborhoods)}
+            preferences = [new_preferences() for _ in range(homebuyers)]
+            scores = [new_scores() for _ in range(homebuyers)]
+            capacities = [rng.randint(0, 4) for _ in range(neighborhoods)]
+            removed = set()
+
+            engine = DeferredAcceptance(
+                [list(p) for p in preferences], [dict(s) for s in scores], list(range(homebuyers)), capacities
+            )
+            engine.run()
+
+            for _ in range(6):
+                operation = rng.choice(['add', 'remove', 'capacities', 'update'])
+                if operation == 'add':
+                    preferences.append(new_preferences())
+                    scores.append(new_scores())
+                    engine.add_buyer(list(preferences[-1]), dict(scores[-1]), len(preferences) - 1)
+                elif operation == 'remove' and len(removed) < len(preferences):
+                    buyer = rng.choice([b for b in range(len(preferences)) if b not in removed])
+                    removed.add(buyer)
+                    engine.remove_buyer(buyer)
+                elif operation == 'capacities':
+                    capacities = [rng.randint(0, 4) for _ in range(neighborhoods)]
+                    engine.set_capacities(capacities)
+                elif operation == 'update':
+                    neighb = rng.randrange(neighborhoods)
+                    for buyer_scores in scores:
+                        buyer_scores[neighb] = rng.randint(0, 5)
+
+                    def rescore():
+                        for buyer, buyer_scores in enumerate(scores):
+                            engine.scores[buyer][neighb] = buyer_scores[neighb]
+
+                    engine.update_neighborhood(neighb, rescore)
+
+                kept = [b for b in range(len(preferences)) if b not in removed]
+                expected = DeferredAcceptance(
+                    [preferences[b] for b in kept], [scores[b] for b in kept], kept, capacities
+                ).run()
+                self.assertEqual(engine.allocation(), [[kept[b] for b in held] for held in expected], seed)
+
+
+class ExecutionStatsTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.input_path = os.path.join(directory.name, 'input.txt')
+        self.output_path = os.path.join(directory.name, 'output.txt')
+        with open(self.input_path, 'w') as file:
+            file.write('\n'.join(SAMPLE_LINES) + '\n')
+
+    def test_disabled(self):
+        """
+        Test that nothing is measured by default
+        """
+        allocator = PlaceHomeBuyersInNeighborhoods(self.input_path, output_path=self.output_path)
+
+        self.assertIsNone(allocator.execute())
+
+    def test_stages_and_hook(self):
+        """
+        Test that each stage is measured and reported to the hook, in order
+        """
+        calls = []
+        stats = ExecutionStats(trace_memory=True, hook=lambda stage, stats: calls.append((stage, dict(stats.stages))))
+        allocator = PlaceHomeBuyersInNeighborhoods(self.input_path, output_path=self.output_path, stats=stats)
+
+        self.assertIs(allocator.execute(), stats)
+
+        self.assertEqual([stage for stage, _ in calls], list(ExecutionStats.STAGES))
+        self.assertEqual(list(calls[-1][1]), list(ExecutionStats.STAGES))
+        for stage in stats.stages.values():
+            self.assertGreaterEqual(stage.wall_time, 0)
+            self.assertGreaterEqual(stage.cpu_time, 0)
+            self.assertGreaterEqual(stage.peak_memory, 0)
+        self.assertEqual(set(stats.as_dict()['stages']), set(ExecutionStats.STAGES))
+        self.assertIn('displacements', str(stats))
+
+    def test_counters(self):
+        """
+        Test the hot-path counters of both engines on the sample
+        """
+        for engine in PlaceHomeBuyersInNeighborhoods.ENGINES:
+            stats = ExecutionStats()
+            allocator = PlaceHomeBuyersInNeighborhoods(
+                self.input_path, engine=engine, output_path=self.output_path, stats=stats
+            )
+            allocator.execute()
+
+            self.assertGreaterEqual(stats.iterations, 1)
+            self.assertGreaterEqual(stats.candidates, len(SAMPLE_LINES) - 3)
+            self.assertGreater(stats.displacements, 0)
+            self.assertIsNone(stats.stages['assign'].peak_memory)
+
+        self.assertEqual(stats.iterations, 12 + stats.displacements)
+
+
+class OutputWriterTest(TestCase):
+    ALLOCATION = [(0, [(2, 128), (1, 119)]), (1, [(3, 31)]), (2, [])]
+
+    def test_text(self):
+        """
+        Test that the text format is the original output format
+        """
+        output = io.StringIO()
+
+        self.assertEqual(OutputWriter(output).write(iter(self.ALLOCATION)), 3)
+
+        self.assertEqual(output.getvalue(), 'N0: H2(128) H1(119)\nN1: H3(31)\nN2: \n')
+
+    def test_csv(self):
+        """
+        Test that the CSV format has one row per assigned homebuyer, and one for each empty neighborhood
+        """
+        output = io.StringIO()
+        OutputWriter(output, 'csv').write(self.ALLOCATION)
+
+        self.assertEqual(output.getvalue().splitlines(), [
+            'neighborhood,homebuyer,score,rank', 'N0,H2,128,1', 'N0,H1,119,2', 'N1,H3,31,1', 'N2,,,',
+        ])
+
+    def test_round_trip(self):
+        """
+        Test that every format reads back the allocation it was written from, empty neighborhoods
+        included
+        """
+        allocation = [(0, []), (1, [(3, 31)]), (2, []), (3, [(2, 128), (1, 119)])]
+        for output_format in OutputWriter.FORMATS:
+            with self.subTest(output_format=output_format):
+                output = io.StringIO()
+                OutputWriter(output, output_format).write(allocation)
+                output.seek(0)
+
+                self.assertEqual(list(OutputReader(output, output_format).read()), allocation)
+
+    def test_jsonl(self):
+        """
+        Test that the JSON Lines format has one object per neighborhood
+        """
+        output = io.StringIO()
+        OutputWriter(output, 'jsonl').write(self.ALLOCATION)
+
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(len(records), 3)
+        self.assertEqual(records[0], {
+            'neighborhood': 'N0',
+            'homebuyers': [{'homebuyer': 'H2', 'score': 128}, {'homebuyer': 'H1', 'score': 119}],
+        })
+
+    def test_gzip(self):
+        """
+        Test the gzip output to a '.gz' path and to a binary file object, which is left open
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'output.jsonl.gz')
+            OutputWriter(path, 'jsonl').write(self.ALLOCATION)
+            with gzip.open(path, 'rt') as file:
+                self.assertEqual(len(file.readlines()), 3)
+
+        output = io.BytesIO()
+        OutputWriter(output, compress=True).write(self.ALLOCATION)
+        self.assertFalse(output.closed)
+        self.assertEqual(gzip.decompress(output.getvalue()).decode(), 'N0: H2(128) H1(119)\nN1: H3(31)\nN2: \n')
+
+    def test_unknown_format(self):
+        """
+        Test that an unknown format is rejected, also by the allocator
+        """
+        with self.assertRaises(ValueError):
+            OutputWriter('output.xml', 'xml')
+        with self.assertRaises(ValueError):
+            PlaceHomeBuyersInNeighborhoods('fake_path/input.txt', output_format='xml')
+
+    def test_allocator_output(self):
+        """
+        Test that the allocator streams its output in the configured format to a file object
+        """
+        output = io.StringIO()
+        allocator = PlaceHomeBuyersInNeighborhoods('fake_path/input.txt', output_path=output, output_format='csv')
+        for line in SAMPLE_LINES:
+            allocator._parse_line(line)
+        allocator.initialize_algorithm()
+        allocator.assign_homebuyers()
+        allocator.write_output_file()
+
+        self.assertEqual(output.getvalue().splitlines()[1:5], ['N0,H5,161,1', 'N0,H11,154,2', 'N0,H2,128,3', 'N0,H4,122,4'])
+
+
+class BatchRunnerTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        for region in ('north', 'south'):
+            with open(os.path.join(self.directory, f'{region}.txt'), 'w') as file:
+                file.write('\n'.join(SAMPLE_LINES) + '\n')
+
+    def test_run(self):
+        """
+        Test that every input file gets its own output and timings
+        """
+        output_dir = os.path.join(self.directory, 'out')
+        runner = BatchRunner(self.directory, output_dir=output_dir, workers=2, engine='deferred_acceptance')
+
+        results = list(runner.run())
+
+        self.assertEqual([os.path.basename(r.output_path) for r in results], ['north_output.txt', 'south_output.txt'])
+        for result in results:
+            with open(result.output_path) as file:
+                self.assertEqual(file.readline(), 'N0: H5(161) H11(154) H2(128) H4(122)\n')
+            self.assertEqual(set(result.timings), {'read', 'initialize', 'assign', 'write'})
+        self.assertIn('north.txt', BatchRunner.summary(results))
+
+    def test_output_format(self):
+        """
+        Test that the output files are named after the output format
+        """
+        runner = BatchRunner(self.directory, output_format='jsonl')
+
+        self.assertEqual(os.path.basename(runner.output_path(runner.input_paths[0])), 'north_output.jsonl')
+
+    def test_previous_outputs(self):
+        """
+        Test that only the outputs of other input files are skipped, and that they are reported
+        """
+        for name in ('north_output.txt', 'region_output.txt'):
+            with open(os.path.join(self.directory, name), 'w') as file:
+                file.write('\n'.join(SAMPLE_LINES) + '\n')
+
+        runner = BatchRunner(self.directory, engine='deferred_acceptance')
+
+        self.assertEqual(list(map(os.path.basename, runner.input_paths)), ['north.txt', 'region_output.txt', 'south.txt'])
+        self.assertEqual(list(map(os.path.basename, runner.skipped)), ['north_output.txt'])
+        self.assertIn('skipped, outputs of other inputs: north_output.txt', BatchRunner.summary([], runner.skipped))
+
+    def test_no_inputs(self):
+        """
+        Test that a pattern matching nothing is rejected
+        """
+        with self.assertRaises(ValueError):
+            BatchRunner(os.path.join(self.directory, '*.csv'))
+
+
+class ScenarioRunnerTest(TestCase):
+    def setUp(self):
+        handle, file_path = tempfile.mkstemp(suffix='.txt')
+        with os.fdopen(handle, 'w') as file:
+            file.write('\n'.join(SAMPLE_LINES) + '\n')
+        self.addCleanup(os.remove, file_path)
+        self.runner = ScenarioRunner.from_file(file_path, workers=2)
+
+    def test_run(self):
+        """
+        Test the baseline, a reweighted scenario and a capacity override, and their diffs
+        """
+        baseline, scaled, small, resilient = self.runner.run([
+            Scenario('scaled', weights=(2, 2, 2)),
+            Scenario('small', capacities={0: 2}),
+            Scenario('resilient', weights=(1, 1, 2)),
+        ])
+
+        self.assertEqual(baseline.allocation, SAMPLE_ALLOCATION)
+        self.assertEqual((baseline.moved, baseline.unassigned), ({}, []))
+        self.assertEqual((scaled.allocation, scaled.moved), (SAMPLE_ALLOCATION, {}))
+        self.assertEqual(small.allocation[0], [5, 11])
+        for entity_id in (2, 4):
+            self.assertEqual(small.moved[entity_id][0], 0)
+        self.assertNotEqual(resilient.allocation, SAMPLE_ALLOCATION)
+        before, after = (
+            {hb: neighb for neighb, ids in result.allocation.items() for hb in ids} for result in (baseline, resilient)
+        )
+        self.assertEqual(resilient.moved, {hb: (before[hb], after[hb]) for hb in before if before[hb] != after[hb]})
+
+    def test_scores(self):
+        """
+        Test that the scores of each scenario are the weighted products of the ranked neighborhoods
+        """
+        store = self.runner.store
+        scores = self.runner.scores([Scenario('baseline'), Scenario('resilient', weights=(1, 1, 2))])
+
+        self.assertEqual(len(scores[0]), len(store.priorities))
+        for position, neighb in enumerate(store.priorities[:3]):
+            self.assertEqual(scores[0][position], store.score(0, neighb))
+            self.assertEqual(
+                scores[1][position], 
+                store.score(0, neighb) + store.homebuyer_columns['resilience'][0] * store.neighborhood_columns['resilience'][neighb]
+            )
+
+        with self.assertRaises(ValueError):
+            self.runner.scores([Scenario('short', weights=(1, 2))])
+
+    @skipUnless(HAS_NUMPY, 'NumPy is not installed')
+    def test_vectorized_scores(self):
+        """
+        Test that the 'vectorized' scoring gives the same scores
+        """
+        scenarios = [Scenario('baseline'), Scenario('resilient', weights=(1, 1, 2))]
+        vectorized = ScenarioRunner(self.runner.store, scoring='vectorized')
+
+        self.assertEqual(vectorized.scores(scenarios), self.runner.scores(scenarios))
+
+    def test_unknown_scoring(self):
+        """
+        Test that an unknown scoring is rejected
+        """
+        with self.assertRaises(ValueError):
+            ScenarioRunner(self.runner.store, scoring='unknown')
+
+    def test_unknown_neighborhood_capacity(self):
+        """
+        Test that the capacity of a neighborhood missing from the input is rejected with the scenario's name
+        """
+        for neighb in (3, -1):
+            with self.subTest(neighb=neighb):
+                with self.assertRaisesRegex(ValueError, "'typo'.*N" + str(neighb)):
+                    self.runner.capacities(Scenario('typo', capacities={neighb: 2}))
+
+
+class OutOfCoreAllocatorTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.input_path = os.path.join(self.directory, 'input.txt')
+        InputGenerator(8, 400, 5, seed=3, popularity='zipf').write(self.input_path)
+
+    def _read(self, name: str) -> str:
+        with open(os.path.join(self.directory, name)) as file:
+            return file.read()
+
+    def test_matches_deferred_acceptance(self):
+        """
+        Test that a run spilling many small runs to disk gives the allocation of the
+        'deferred_acceptance' engine, and that its temporary files are counted
+        """
+        expected = PlaceHomeBuyersInNeighborhoods(
+            self.input_path, engine='deferred_acceptance', output_path=os.path.join(self.directory, 'expected.txt'),
+        )
+        expected.execute()
+        stats = ExecutionStats()
+
+        with OutOfCoreAllocator(
+            self.input_path, memory_limit=4096, temp_dir=self.directory,
+            output_path=os.path.join(self.directory, 'output.txt'), stats=stats,
+        ) as allocator:
+            allocator.execute()
+            unassigned = sorted(allocator.unassigned_homebuyers())
+
+        self.assertEqual(self._read('output.txt'), self._read('expected.txt'))
+        self.assertEqual(unassigned, expected.unassigned_homebuyers())
+        self.assertEqual(allocator.unassigned_count, len(unassigned))
+        self.assertGreater(stats.temp_files, 2)
+        self.assertGreater(stats.temp_bytes_written, 0)
+        self.assertGreater(stats.temp_bytes_read, 0)
+        self.assertEqual(sorted(os.listdir(self.directory)), ['expected.txt', 'input.txt', 'output.txt'])
+
+    def test_truncated_preferences(self):
+        """
+        Test that homebuyers whose ranked neighborhoods are all full are left unassigned
+        """
+        with open(self.input_path, 'w') as file:
+            file.write('\n'.join(['N N0 E:1 W:1 R:1', 'N N1 E:2 W:2 R:2', 'H H0 E:1 W:1 R:1 N0', 'H H1 E:2 W:2 R:2 N0', 'H H2 E:3 W:3 R:3 N0']) + '\n')
+
+        with OutOfCoreAllocator(self.input_path, memory_limit=64, output_path=io.StringIO()) as allocator:
+            allocator.execute()
+            allocation = [(neighb, [hb for hb, _ in homebuyers]) for neighb, homebuyers in allocator.allocation()]
+            unassigned = sorted(allocator.unassigned_homebuyers())
+
+        self.assertEqual(allocation, [(0, [2]), (1, [])])
+        self.assertEqual(unassigned, [0, 1])
+
+    def test_no_homebuyers(self):
+        """
+        Test that an input without homebuyers gives empty neighborhoods and closes cleanly
+        """
+        with open(self.input_path, 'w') as file:
+            file.write('N N0 E:1 W:1 R:1\n')
+
+        output = io.StringIO()
+        allocator = OutOfCoreAllocator(self.input_path, output_path=output)
+        allocator.execute()
+        allocator.close()
+        allocator.close()
+
+        self.assertEqual(output.getvalue(), 'N0: \n')
+        self.assertEqual(os.listdir(self.directory), ['input.txt'])
+
+    def test_neighborhood_order(self):
+        """
+        Test that neighborhoods out of order are reported as malformed input, across blocks
+        """
+        with open(self.input_path, 'w') as file:
+            file.write('\n'.join(['N N0 E:1 W:1 R:1', 'N N2 E:2 W:2 R:2', 'H H0 E:1 W:1 R:1 N0']) + '\n')
+
+        with OutOfCoreAllocator(self.input_path, memory_limit=64, output_path=io.StringIO()) as allocator:
+            with self.assertRaises(InputFormatError) as context:
+                allocator.execute()
+        self.assertEqual(context.exception.line_number, 2)
+
+    def test_invalid_options(self):
+        """
+        Test that a memory limit that is not positive and an unknown output format are rejected
+        """
+        with self.assertRaises(ValueError):
+            OutOfCoreAllocator(self.input_path, memory_limit=0)
+        with self.assertRaises(ValueError):
+            OutOfCoreAllocator(self.input_path, output_format='xml')
+
+
+class AllocationServiceTest(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.input_path = os.path.join(self.directory, 'input.txt')
+        with open(self.input_path, 'w') as file:
+            file.write('\n'.join(SAMPLE_LINES) + '\n')
+        self.service = AllocationService.from_file(self.input_path, batch_window=0.01, engine='deferred_acceptance')
+        self.host, self.port = await self.service.start()
+        self.addAsyncCleanup(self.service.close)
+
+    async def _request(self, request) -> dict:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        writer.write((request if isinstance(request, bytes) else json.dumps(request).encode()) + b'\n')
+        await writer.drain()
+        response = json.loads(await reader.readline())
+        writer.close()
+        await writer.wait_closed()
+        return response
+
+    def _allocation(self) -> dict:
+        return {neighb: [hb for hb, _ in homebuyers] for neighb, homebuyers in self.service.allocator.allocation()}
+
+    async def test_lookup(self):
+        """
+        Test that lookups are answered from the allocation in memory
+        """
+        response = await self._request({'op': 'lookup', 'homebuyer': 11})
+        self.assertEqual(response, {'ok': True, 'homebuyer': 11, 'neighborhood': 0, 'rank': 2, 'score': 154})
+
+        response = await self._request({'op': 'neighborhood', 'neighborhood': 1})
+        self.assertEqual([hb for hb, _ in response['homebuyers']], SAMPLE_ALLOCATION[1])
+
+    async def test_vectorized_scores(self):
+        """
+        Test that the scores of a neighborhood are sent as plain integers with the 'vectorized' scoring
+        """
+        service = AllocationService.from_file(self.input_path, engine='deferred_acceptance', scoring='vectorized')
+        self.host, self.port = await service.start()
+        self.addAsyncCleanup(service.close)
+
+        response = await self._request({'op': 'neighborhood', 'neighborhood': 0})
+        self.assertTrue(response['ok'])
+        self.assertEqual([hb for hb, _ in response['homebuyers']], SAMPLE_ALLOCATION[0])
+        self.assertEqual(response['homebuyers'][1], [11, 154])
+
+    async def test_what_if(self):
+        """
+        Test that a what-if query reports the moves of a fresh run and leaves the allocation unchanged
+        """
+        response = await self._request({'op': 'what_if', 'changes': [
+            {'op': 'add', 'line': 'H H12 E:10 W:10 R:10 N0>N1>N2'}, {'op': 'remove', 'homebuyer': 9},
+        ]})
+
+        expected = PlaceHomeBuyersInNeighborhoods('fake_path/input.txt', engine='deferred_acceptance')
+        for line in SAMPLE_LINES + ['H H12 E:10 W:10 R:10 N0>N1>N2']:
+            if not line.startswith('H H9 '):
+                expected._parse_line(line)
+        expected.initialize_algorithm()
+        expected.assign_homebuyers()
+        after = {hb.entity_id: neighb for neighb, hbs in expected.priority_buyers.items() for hb in hbs}
+        before = {hb: neighb for neighb, hbs in SAMPLE_ALLOCATION.items() for hb in hbs}
+        self.assertEqual(response['moved'], {
+            str(hb): [before.get(hb, -1), after.get(hb, -1)]
+            for hb in before.keys() | after.keys() if before.get(hb, -1) != after.get(hb, -1)
+        })
+        self.assertEqual(self._allocation(), SAMPLE_ALLOCATION)
+        self.assertEqual((await self._request({'op': 'lookup', 'homebuyer': 9}))['neighborhood'], 1)
+
+    async def test_batched_changes(self):
+        """
+        Test that concurrent changes are applied with a single re-allocation, equal to a fresh run
+        """
+        responses = await asyncio.gather(
+            self._request({'op': 'remove', 'homebuyer': 5}),
+            self._request({'op': 'add', 'line': 'H H12 E:9 W:9 R:9 N0>N2>N1'}),
+            self._request({'op': 'update', 'line': 'N N1 E:9 W:1 R:1'}),
+            self._request({'op': 'remove', 'homebuyer': 42}),
+        )
+
+        self.assertEqual([response['ok'] for response in responses], [True, True, True, False])
+        self.assertEqual({response.get('batch_size') for response in responses[:3]}, {3})
+        metrics = await self._request({'op': 'metrics'})
+        self.assertEqual((metrics['batches'], metrics['batched_changes']), (1, 3))
+        self.assertEqual((metrics['ops']['remove']['count'], metrics['ops']['remove']['errors']), (2, 1))
+
+        expected = PlaceHomeBuyersInNeighborhoods('fake_path/input.txt', engine='deferred_acceptance')
+        for line in SAMPLE_LINES + ['H H12 E:9 W:9 R:9 N0>N2>N1']:
+            if not line.startswith('H H5 '):
+                expected._parse_line(line.replace('N N1 E:2 W:1 R:1', 'N N1 E:9 W:1 R:1'))
+        expected.initialize_algorithm()
+        expected.assign_homebuyers()
+        self.assertEqual(
+            self._allocation(),
+            {neighb: [hb.entity_id for hb in hbs] for neighb, hbs in expected.priority_buyers.items()},
+        )
+        health = await self._request({'op': 'health'})
+        self.assertEqual((health['status'], health['version'], health['homebuyers']), ('ok', 2, 12))
+
+    async def test_recursive_engine_changes(self):
+        """
+        Test that the 'recursive' engine re-allocates like a fresh run after an update and after a
+        removal and an addition that keep the number of homebuyers, rather than reusing its index
+        """
+        await self.service.close()
+        self.service = AllocationService.from_file(self.input_path, batch_window=0.01, engine='recursive')
+        self.host, self.port = await self.service.start()
+        lines = list(SAMPLE_LINES)
+
+        for changes, edit in (
+            ([{'op': 'update', 'line': 'N N1 E:9 W:1 R:1'}], lambda: lines.__setitem__(1, 'N N1 E:9 W:1 R:1')),
+            (
+                [{'op': 'remove', 'homebuyer': 1}, {'op': 'add', 'line': 'H H999 E:9 W:9 R:9 N1>N2>N0'}],
+                lambda: lines.__setitem__(lines.index(SAMPLE_LINES[4]), 'H H999 E:9 W:9 R:9 N1>N2>N0'),
+            ),
+        ):
+            responses = await asyncio.gather(*map(self._request, changes))
+            self.assertTrue(all(response['ok'] for response in responses))
+            edit()
+            expected = PlaceHomeBuyersInNeighborhoods('fake_path/input.txt')
+            for line in lines:
+                expected._parse_line(line)
+            expected.initialize_algorithm()
+            expected.assign_homebuyers()
+            self.assertEqual(
+                self._allocation(),
+                {neighb: [hb.entity_id for hb in hbs] for neighb, hbs in expected.priority_buyers.items()},
+            )
+
+    async def test_failed_reallocation(self):
+        """
+        Test that a failed re-allocation answers every change of the batch with an error, keeps the
+        previous entities and allocation for lookups and what-if queries and does not block the next 
+        batches
+        """
+        allocator = self.service.allocator
+        scores = {hb.entity_id: dict(hb.neighborhood_scores) for hb in allocator.homebuyers.values()}
+        with patch.object(allocator, 'assign_homebuyers', side_effect=RuntimeError('boom')):
+            responses = await asyncio.wait_for(asyncio.gather(
+                self._request({'op': 'remove', 'homebuyer': 5}),
+                self._request({'op': 'update', 'line': 'N N1 E:9 W:1 R:1'}),
+                self._request({'op': 'remove', 'homebuyer': 42}),
+            ), timeout=5)
+
+        self.assertEqual([response['ok'] for response in responses], [False, False, False])
+        self.assertIn('boom', responses[0]['error'])
+        self.assertIs(self.service.allocator, allocator)
+        self.assertIn(5, allocator.homebuyers)
+        self.assertEqual({hb.entity_id: dict(hb.neighborhood_scores) for hb in allocator.homebuyers.values()}, scores)
+        lookup = await self._request({'op': 'lookup', 'homebuyer': 11})
+        self.assertEqual((lookup['neighborhood'], lookup['rank']), (0, 2))
+        self.assertEqual((await self._request({'op': 'lookup', 'homebuyer': 5}))['neighborhood'], 0)
+        self.assertEqual(self._allocation(), SAMPLE_ALLOCATION)
+        self.assertEqual(self.service.version, 1)
+        response = await self._request({'op': 'what_if', 'changes': [{'op': 'remove', 'homebuyer': 5}]})
+        self.assertTrue(response['ok'])
+        self.assertEqual(response['moved']['5'], [0, -1])
+        self.assertEqual(self._allocation(), SAMPLE_ALLOCATION)
+
+        response = await asyncio.wait_for(self._request({'op': 'remove', 'homebuyer': 9}), timeout=5)
+        self.assertTrue(response['ok'])
+        self.assertEqual(self.service.version, 2)
+
+    async def test_invalid_requests(self):
+        """
+        Test that malformed requests get an error response and leave the connection usable
+        """
+        self.assertFalse((await self._request(b'not json'))['ok'])
+        self.assertFalse((await self._request({'op': 'unknown'}))['ok'])
+        self.assertFalse((await self._request({'op': 'lookup', 'homebuyer': 42}))['ok'])
+        self.assertFalse((await self._request({'op': 'what_if', 'changes': [{'op': 'remove', 'homebuyer': 42}]}))['ok'])
+        for request in (
+            {'op': 'add', 'line': 'H H12 E:1 W:1 R:1 N0>N7'},
+            {'op': 'what_if', 'changes': [{'op': 'add', 'line': 'H H12 E:1 W:1 R:1 N0>N7'}]},
+        ):
+            response = await self._request(request)
+            self.assertFalse(response['ok'])
+            self.assertIn('unknown neighborhood N7', response['error'])
+        self.assertNotIn(12, self.service.allocator.homebuyers)
+        self.assertEqual(self._allocation(), SAMPLE_ALLOCATION)
+
+    @skipUnless(hasattr(socket, 'AF_UNIX'), 'Unix sockets are not available')
+    async def test_unix_socket(self):
+        """
+        Test the blocking client over a Unix socket
+        """
+        path = os.path.join(self.directory, 'service.sock')
+        await self.service.start(path=path)
+
+        response = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: send({'op': 'lookup', 'homebuyer': 5}, path=path)
+        )
+
+        self.assertEqual(response['neighborhood'], 0)
+
+
+class AllocationVerifierTest(TestCase):
+    def setUp(self):
+        self.allocator = PlaceHomeBuyersInNeighborhoods('fake_path/input.txt', engine='deferred_acceptance')
+        for line in SAMPLE_LINES:
+            self.allocator._parse_line(line)
+        self.allocator.initialize_algorithm()
+        self.allocator.assign_homebuyers()
+        self.verifier = AllocationVerifier.from_allocator(self.allocator, max_examples=2)
+
+    def test_stable_allocation(self):
+        """
+        Test that the allocation of the 'deferred_acceptance' engine passes, from memory and from
+        each output format
+        """
+        self.assertTrue(self.verifier.verify(SAMPLE_ALLOCATION).ok)
+        self.assertTrue(self.verifier.verify(self.allocator.allocation()).ok)
+        for output_format in OutputWriter.FORMATS:
+            with self.subTest(output_format=output_format):
+                output = io.StringIO()
+                OutputWriter(output, output_format).write(self.allocator.allocation())
+                output.seek(0)
+                report = self.verifier.verify(AllocationVerifier.read_output(output, output_format))
+                self.assertTrue(report.ok, str(report))
+                self.assertEqual(report.assigned, 12)
+
+    def test_neighborhood_order(self):
+        """
+        Test that the neighborhoods of an allocator are checked by ID whatever their order
+        """
+        self.allocator.neighborhoods = dict(reversed(self.allocator.neighborhoods.items()))
+
+        report = AllocationVerifier.from_allocator(self.allocator).verify(SAMPLE_ALLOCATION)
+
+        self.assertTrue(report.ok, str(report))
+
+    def test_output_file(self):
+        """
+        Test that output files are read with the format of their extension, compressed or not
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ('output.txt', 'output.csv.gz', 'output.jsonl'):
+                path = os.path.join(directory, name)
+                output_format = 'csv' if '.csv' in name else 'jsonl' if '.jsonl' in name else 'text'
+                OutputWriter(path, output_format).write(self.allocator.allocation())
+                self.assertEqual(AllocationVerifier.read_output(path), list(self.allocator.allocation()))
+
+    def test_blocking_pair(self):
+        """
+        Test that swapping two homebuyers is reported as the blocking pairs it creates
+        """
+        allocation = {neighb: list(ids) for neighb, ids in SAMPLE_ALLOCATION.items()}
+        allocation[0][0], allocation[1][0] = allocation[1][0], allocation[0][0]
+
+        report = self.verifier.verify(allocation)
+
+        self.assertFalse(report.ok)
+        self.assertEqual(set(report.counts), {'blocking_pair'})
+        self.assertIn(5, {violation.homebuyer for violation in report.examples})
+        self.assertIn('FAILED', str(report))
+
+    def test_free_place(self):
+        """
+        Test that a free place makes a blocking pair with every homebuyer ranking it higher
+        """
+        allocation = {neighb: list(ids) for neighb, ids in SAMPLE_ALLOCATION.items()}
+        allocation[2].remove(0)
+
+        report = self.verifier.verify(allocation)
+
+        self.assertEqual(report.counts, {'blocking_pair': 3})
+        self.assertEqual(report.examples[0][:2], ('blocking_pair', 0))
+        self.assertIn('free place', report.examples[0].detail)
+
+    def test_invalid_allocation(self):
+        """
+        Test that duplicates, unknown entities, capacities and scores are checked, with the number
+        of examples capped
+        """
+        report = self.verifier.verify([
+            (0, [(5, 161), (11, 154), (2, 128), (4, 122), (1, 71)]),
+            (1, [9, 8, 7, 5, 5, 42]),
+            (2, [(6, 1), (3, 1), (10, 1), (0, 1)]),
+            (7, [1]),
+        ])
+
+        self.assertEqual(report.counts, {
+            'unknown_neighborhood': 1, 'unknown_homebuyer': 1, 'duplicate': 2, 'over_capacity': 1,
+            'score_mismatch': 5, 'blocking_pair': 1,
+        })
+        self.assertEqual(sum(violation.kind == 'score_mismatch' for violation in report.examples), 2)
+
+
+class DeltaOutputTest(TestCase):
+    PREVIOUS = [(0, [(2, 128), (1, 119)]), (1, [(3, 31)]), (2, [(4, 20)]), (4, [(6, 9)])]
+    CURRENT = [(0, [(2, 128), (5, 120)]), (1, [(3, 35)]), (2, [(4, 20)]), (3, []), (5, [(7, 8)])]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.allocator = PlaceHomeBuyersInNeighborhoods(
+            'fake_path/input.txt', engine='deferred_acceptance', output_path=os.path.join(self.directory, 'output.txt'),
+        )
+        for line in SAMPLE_LINES:
+            self.allocator._parse_line(line)
+        self.allocator.initialize_algorithm()
+        self.allocator.assign_homebuyers()
+
+    def test_diff(self):
+        """
+        Test that only the changed neighborhoods are listed, with the added, removed and rescored
+        homebuyers, and that the change log rebuilds the current allocation
+        """
+        deltas = list(diff_allocations(iter(self.PREVIOUS), iter(self.CURRENT)))
+
+        self.assertEqual(deltas, [
+            NeighborhoodDelta(0, [(5, 120)], [1], []),
+            NeighborhoodDelta(1, [], [], [(3, 35)]),
+            NeighborhoodDelta(3, [], [], []),
+            NeighborhoodDelta(4, [], [], [], dropped=True),
+            NeighborhoodDelta(5, [(7, 8)], [], []),
+        ])
+        self.assertEqual(list(apply_delta(iter(self.PREVIOUS), iter(deltas))), self.CURRENT)
+
+    def test_previous_csv_output(self):
+        """
+        Test that an empty neighborhood read back from a CSV output is not reported as created again
+        """
+        previous = os.path.join(self.directory, 'previous.csv')
+        OutputWriter(previous, 'csv').write(self.CURRENT)
+
+        self.assertEqual(list(diff_allocations(OutputReader(previous).read(), iter(self.CURRENT))), [])
+
+    def test_formats(self):
+        """
+        Test that each format reads back the change log it writes
+        """
+        output = io.StringIO()
+        DeltaWriter(output).write(diff_allocations(self.PREVIOUS, self.CURRENT))
+        self.assertEqual(output.getvalue().splitlines(), [
+            'N0: +H5(120) -H1', 'N1: ~H3(35)', 'N3: ', 'N4: dropped', 'N5: +H7(8)',
+        ])
+
+        for output_format in OutputWriter.FORMATS:
+            with self.subTest(output_format=output_format):
+                output = io.StringIO()
+                DeltaWriter(output, output_format).write(diff_allocations(self.PREVIOUS, self.CURRENT))
+                output.seek(0)
+                deltas = DeltaReader(output, output_format).read()
+                self.assertEqual(list(apply_delta(self.PREVIOUS, deltas)), self.CURRENT)
+
+    def test_allocator_change_log(self):
+        """
+        Test that the allocator writes its changes against a previous output, and that compacting
+        the previous output with the change logs gives the full output
+        """
+        previous_path = os.path.join(self.directory, 'previous.jsonl.gz')
+        OutputWriter(previous_path, 'jsonl').write(self.allocator.allocation())
+        self.allocator.write_output_file(previous_output=previous_path)
+        with open(self.allocator.output_path) as file:
+            self.assertEqual(file.read(), '')
+
+        self.allocator.add_homebuyer(HomeBuyer.create_from_string('H H12 E:9 W:9 R:9 N1>N0>N2'))
+        self.allocator.write_output_file(previous_output=previous_path)
+        with open(self.allocator.output_path) as file:
+            self.assertEqual(file.read().splitlines(), ['N1: +H12(36) -H1'])
+
+        compact_output(previous_path, [self.allocator.output_path])
+        self.assertEqual(list(OutputReader(previous_path).read()), list(self.allocator.allocation()))
+
+    @skipUnless(HAS_NUMPY, 'NumPy is not installed')
+    def test_vectorized_change_log(self):
+        """
+        Test the JSON Lines change log of an allocator with the 'vectorized' scoring, whose scores are
+        NumPy integers
+        """
+        previous = [(neighb, homebuyers[:1]) for neighb, homebuyers in self.allocator.allocation()]
+        previous_path = os.path.join(self.directory, 'previous.txt')
+        OutputWriter(previous_path).write(previous)
+
+        allocator = PlaceHomeBuyersInNeighborhoods(
+            'fake_path/input.txt', scoring='vectorized', output_path=os.path.join(self.directory, 'output.jsonl'),
+            output_format='jsonl', previous_output=previous_path,
+        )
+        for line in SAMPLE_LINES:
+            allocator._parse_line(line)
+        allocator._score_homebuyers()
+        allocator.initialize_algorithm()
+        allocator.assign_homebuyers()
+        allocator.write_output_file()
+
+        deltas = DeltaReader(allocator.output_path).read()
+        self.assertEqual(list(apply_delta(previous, deltas)), list(allocator.allocation()))
+
+    def test_compact_to_destination(self):
+        """
+        Test that change logs are applied in order to a file object, the base output being kept
+        """
+        base = os.path.join(self.directory, 'base.csv')
+        OutputWriter(base, 'csv').write(self.PREVIOUS)
+        first, second = os.path.join(self.directory, 'first.txt'), os.path.join(self.directory, 'second.jsonl')
+        DeltaWriter(first).write(diff_allocations(self.PREVIOUS, self.CURRENT))
+        DeltaWriter(second, 'jsonl').write(diff_allocations(self.CURRENT, self.PREVIOUS))
+
+        output = io.StringIO()
+        self.assertEqual(compact_output(base, [first, second], output), 4)
+
+        with open(base, newline='') as file:
+            self.assertEqual(output.getvalue(), file.read())
+
+    def test_invalid_change_log(self):
+        """
+        Test that a change log applied to another allocation, unordered allocations and a
+        previous output overwritten by its own change log are rejected
+        """
+        with self.assertRaises(ValueError):
+            list(apply_delta(self.CURRENT, diff_allocations(self.PREVIOUS, self.CURRENT)))
+        with self.assertRaises(ValueError):
+            list(diff_allocations(reversed(self.PREVIOUS), self.CURRENT))
+        with self.assertRaises(ValueError):
+            self.allocator.write_output_file(previous_output=self.allocator.output_path)
+
+        allocator = PlaceHomeBuyersInNeighborhoods('fake_path/input.txt', previous_output='data/output.txt')
+        with self.assertRaises(ValueError):
+            allocator.write_output_file()
+
+
+class CommandLineTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.input_path = os.path.join(self.directory, 'input.txt')
+        with open(self.input_path, 'w') as file:
+            file.write('\n'.join(SAMPLE_LINES) + '\n')
+
+    def test_choices(self):
+        """
+        Test that the choices repeated by the command line match the allocator's
+        """
+        self.assertEqual(cli.ENGINES, PlaceHomeBuyersInNeighborhoods.ENGINES)
+        self.assertEqual(cli.SCORINGS, PlaceHomeBuyersInNeighborhoods.SCORINGS)
+        self.assertEqual(cli.STORAGES, PlaceHomeBuyersInNeighborhoods.STORAGES)
+        self.assertEqual(cli.READERS, PlaceHomeBuyersInNeighborhoods.READERS)
+        self.assertEqual(cli.FORMATS, OutputWriter.FORMATS)
+
+    def test_help_does_not_import_the_algorithm(self):
+        """
+        Test that parsing the arguments imports neither the allocator nor NumPy
+        """
+        code = (
+            'import sys\n'
+            'from algorithm import cli\n'
+            'cli.build_parser().parse_args(["input.txt", "--engine", "deferred_acceptance"])\n'
+            'print(sorted({"algorithm.place_homebuyers_in_neighborhood", "numpy"} & set(sys.modules)))'
+        )
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        result = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), '[]')
+
+    def test_run(self):
+        """
+        Test that a run writes the output in the chosen format with the chosen engine, and prints
+        the stats and the profile when asked
+        """
+        output_path = os.path.join(self.directory, 'output.csv')
+        profile_path = os.path.join(self.directory, 'profile.out')
+        with patch('sys.stderr', new_callable=io.StringIO) as stderr:
+            status = cli.main([
+                self.input_path, '--output', output_path, '--engine', 'deferred_acceptance', '--format', 'csv',
+                '--storage', 'columnar', '--reader', 'bulk', '--stats', '--trace-memory', '--profile', profile_path,
+            ])
+
+        self.assertEqual(status, 0)
+        allocation = AllocationVerifier.read_output(output_path)
+        self.assertEqual({neighb: [hb for hb, _ in hbs] for neighb, hbs in allocation}, SAMPLE_ALLOCATION)
+        assign = next(line for line in stderr.getvalue().splitlines() if line.startswith('assign '))
+        self.assertNotEqual(assign.split()[-1], '-')
+        self.assertIn('cumulative', stderr.getvalue())
+        self.assertTrue(os.path.getsize(profile_path))
+
+    def test_batch(self):
+        """
+        Test that a directory of inputs is allocated by the batch runner
+        """
+        with patch('sys.stdout', new_callable=io.StringIO):
+            cli.main([self.directory, '--workers', '1', '--format', 'jsonl'])
+
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'input_output.jsonl')))
+
+    def test_invalid_arguments(self):
+        """
+        Test that invalid arguments and options rejected by the allocator exit with a usage error
+        """
+        for argv in (
+            [self.input_path, '--engine', 'fastest'],
+            [self.input_path, '--reader', 'bulk'],
+            [self.input_path, '--attributes', 'E=energy,E=water'],
+            [self.directory, '--resume'],
+            [self.directory, '--reader', 'bulk'],
+            [self.input_path, '--trace-memory'],
+        ):
+            with self.subTest(argv=argv), patch('sys.stderr', new_callable=io.StringIO), self.assertRaises(SystemExit) as raised:
+                cli.main(argv)
+            self.assertEqual(raised.exception.code, 2)
+
+    def test_input_errors(self):
+        """
+        Test that a malformed or missing input file exits with status 1 and a message, and that
+        other errors are not turned into usage errors
+        """
+        with open(self.input_path, 'a') as file:
+            file.write('X not an entity\n')
+        for argv in (
+            [self.input_path, '--output', os.path.join(self.directory, 'output.txt'), '--storage', 'columnar', '--reader', 'bulk'],
+            [os.path.join(self.directory, 'missing.txt'), '--output', os.path.join(self.directory, 'output.txt')],
+        ):
+            with self.subTest(argv=argv), patch('sys.stderr', new_callable=io.StringIO) as stderr:
+                self.assertEqual(cli.main(argv), 1)
+            self.assertIn('main.py: error:', stderr.getvalue())
+
+        with patch('algorithm.place_homebuyers_in_neighborhood.PlaceHomeBuyersInNeighborhoods.execute', side_effect=ValueError('bug')):
+            with self.assertRaises(ValueError):
+                cli.main([self.input_path, '--output', os.path.join(self.directory, 'output.txt')])
+
@@ -0,0 +1,108 @@
+import argparse
+import os
+import tempfile
+from unittest import TestCase
+
+from algorithm import PlaceHomeBuyersInNeighborhoods
+from benchmarks.allocation_benchmark import growth_exponents, run
+from benchmarks.generator import InputGenerator
+from benchmarks.scaling import STAGES, compare, parse_scale, run_scale
+
+
+class InputGeneratorTest(TestCase):
+    def test_seeded(self):
+        """
+        Test that the same seed always produces the same file, and another seed a different one
+        """
+        lines = list(InputGenerator(5, 20, seed=1).lines())
+
+        self.assertEqual(lines, list(InputGenerator(5, 20, seed=1).lines()))
+        self.assertNotEqual(lines, list(InputGenerator(5, 20, seed=2).lines()))
+
+    def test_lines(self):
+        """
+        Test the sizes, the attribute range and the distinct preferences of the generated lines
+        """
+        for attributes in InputGenerator.ATTRIBUTE_DISTRIBUTIONS:
+            for popularity in InputGenerator.POPULARITIES:
+                lines = list(InputGenerator(6, 30, 4, attributes, popularity).lines())
+                neighborhoods = [line for line in lines if line.startswith('N')]
+                homebuyers = [line for line in lines if line.startswith('H')]
+                self.assertEqual((len(neighborhoods), len(homebuyers)), (6, 30))
+
+                for line in neighborhoods + homebuyers:
+                    for token in line.split()[2:5]:
+                        self.assertIn(int(token.split(':')[1]), range(InputGenerator.MAX_ATTRIBUTE + 1))
+                for line in homebuyers:
+                    preferences = line.split()[5].split('>')
+                    self.assertEqual(len(set(preferences)), 4)
+
+    def test_invalid(self):
+        """
+        Test that unknown distributions and invalid sizes are rejected, each with its own message
+        """
+        with self.assertRaises(ValueError):
+            InputGenerator(3, 12, attributes='bimodal')
+        with self.assertRaises(ValueError):
+            InputGenerator(3, 12, popularity='pareto')
+        for args, message in (
+            ((0, 12), 'neighborhood'), ((3, -1), 'homebuyers'), ((3, 12, 0), 'rank'), ((3, 12, -2), 'rank'),
+        ):
+            with self.subTest(args=args), self.assertRaisesRegex(ValueError, message):
+                InputGenerator(*args)
+        self.assertEqual(InputGenerator(3, 12, 5).preferences, 3)
+
+    def test_allocates(self):
+        """
+        Test that a generated file can be allocated end to end
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            input_path = os.path.join(directory, 'input.txt')
+            output_path = os.path.join(directory, 'output.txt')
+            InputGenerator(4, 40, seed=3).write(input_path)
+
+            PlaceHomeBuyersInNeighborhoods(input_path, engine='deferred_acceptance', output_path=output_path).execute()
+
+            with open(output_path) as file:
+                self.assertEqual(len(file.read().split()), 4 + 40)
+
+
+class ScalingTest(TestCase):
+    def test_parse_scale(self):
+        """
+        Test the parsing of the scale ladder
+        """
+        self.assertEqual(parse_scale('100x10000'), (100, 10000))
+        with self.assertRaises(argparse.ArgumentTypeError):
+            parse_scale('100')
+
+    def test_run_scale(self):
+        """
+        Test that each stage is timed and measured, and that results can be compared
+        """
+        result = run_scale(3, 30, {'seed': 0}, {'engine': 'deferred_acceptance'}, repeat=2, trace=True)
+
+        self.assertEqual((result['neighborhoods'], result['homebuyers']), (3, 30))
+        self.assertEqual(set(result['timings']), set(STAGES))
+        self.assertEqual(set(result['peak_traced_mib']), set(STAGES))
+        self.assertAlmostEqual(result['total'], sum(result['timings'].values()))
+        self.assertIn('speedup', compare([result], {'results': [result]}))
+
+
+class AllocationBenchmarkTest(TestCase):
+    def test_growth_exponents(self):
+        """
+        Test the exponents of linear and quadratic growths
+        """
+        self.assertEqual(growth_exponents([10, 20, 40], [1.0, 2.0, 4.0]), [1.0, 1.0])
+        self.assertEqual(growth_exponents([10, 20], [1.0, 4.0]), [2.0])
+
+    def test_run(self):
+        """
+        Test that every engine is timed on every size
+        """
+        timings = run(3, [30, 60], PlaceHomeBuyersInNeighborhoods.ENGINES)
+
+        self.assertEqual(set(timings), set(PlaceHomeBuyersInNeighborhoods.ENGINES))
+        for engine_timings in timings.values():
+            self.assertEqual(len(engine_timings), 2)
@@ -1,6 +1,15 @@
-from unittest import TestCase
+import bz2
+import gzip
+import importlib.util
+import lzma
+import os
+import tempfile
+from unittest import TestCase, skipIf
 
-from entities import HomeBuyer, Neighborhood
+from entities import EntityStore, HomeBuyer, Neighborhood
+from entities.attributes import DEFAULT_SCHEMA, AttributeSchema
+from entities.compression import MAGIC, detect_compression, open_input
+from entities.reader import BulkReader, InputFormatError
 
 
 class HomeBuyerTest(TestCase):
@@ -18,6 +27,16 @@ class HomeBuyerTest(TestCase):
         self.assertEqual(homebuyer.water, 9)
         self.assertEqual(homebuyer.resilience, 2)
         self.assertEqual(homebuyer.neighborhood_priority, ['N0', 'N1'])
+
+    def test_check_priority_ids(self):
+        """
+        Test that ranking a neighborhood that is not known is rejected
+        """
+        homebuyer = HomeBuyer.create_from_string(self.input_string)
+        HomeBuyer.check_priority_ids(homebuyer.get_priority_ids(), range(2))
+
+        with self.assertRaisesRegex(ValueError, 'N1'):
+            HomeBuyer.check_priority_ids(homebuyer.get_priority_ids(), {0: None})
     
     def test_set_neighborhoods_score(self):
         """
@@ -34,6 +53,34 @@ class HomeBuyerTest(TestCase):
 
         self.assertEqual(homebuyer.neighborhood_scores[0], 110)
 
+    def test_positional_priority(self):
+        """
+        Test that the preferences passed after the attribute values still work, with a deprecation
+        warning, and that extra values are rejected
+        """
+        with self.assertWarns(DeprecationWarning):
+            homebuyer = HomeBuyer(0, 4, 2, 9, ['N0', 'N1'])
+
+        self.assertEqual((homebuyer.energy, homebuyer.water, homebuyer.resilience), (4, 2, 9))
+        self.assertEqual(homebuyer.get_priority_ids(), [0, 1])
+        with self.assertRaisesRegex(ValueError, 'at most 3 attributes'):
+            HomeBuyer(0, 4, 2, 9, 1)
+
+    def test_truncated_preferences(self):
+        """
+        Test that only the ranked neighborhoods are scored and preferred
+        """
+        neighborhoods = {
+            0: Neighborhood(entity_id=0, energy=5, water=9, resilience=8),
+            1: Neighborhood(entity_id=1, energy=1, water=1, resilience=1),
+        }
+        homebuyer = HomeBuyer.create_from_string('H H0 E:4 W:2 R:9 N1')
+
+        homebuyer.set_neighborhoods_score(neighborhoods)
+
+        self.assertEqual(homebuyer.neighborhood_scores, {1: 15})
+        self.assertFalse(homebuyer.is_preferred_neighborhood(0, priority=1))
+
     def test_is_preferred_neighborhood(self):
         """
         Test `is_preferred_neighborhood` method
@@ -46,6 +93,16 @@ class HomeBuyerTest(TestCase):
         self.assertFalse(homebuyer.is_preferred_neighborhood(1))
         self.assertFalse(homebuyer.is_preferred_neighborhood(0, priority=1))
         self.assertTrue(homebuyer.is_preferred_neighborhood(1, priority=1))
+
+    def test_get_priority_ids(self):
+        """
+        Test `get_priority_ids` method
+        """
+        homebuyer = HomeBuyer(
+            entity_id=0, energy=4, water=2, resilience=9, neighborhood_priority=['N2', 'N0', 'N1']
+        )
+
+        self.assertEqual(homebuyer.get_priority_ids(), [2, 0, 1])
         
 
 class NeighborhoodTest(TestCase):
@@ -61,4 +118,344 @@ class NeighborhoodTest(TestCase):
         self.assertEqual(neighborhood.prefix, 'N')
         self.assertEqual(neighborhood.energy, 7)
         self.assertEqual(neighborhood.water, 7)
-        self.assertEqual(neighborhood.resilience, 10)
\ No newline at end of file
+        self.assertEqual(neighborhood.resilience, 10)
+
+
+class EntityStoreTest(TestCase):
+    def setUp(self):
+        self.neighborhoods = {
+            0: Neighborhood.create_from_string('N N0 E:7 W:7 R:10'),
+            1: Neighborhood.create_from_string('N N1 E:2 W:1 R:1')
+        }
+        self.homebuyers = {
+            0: HomeBuyer.create_from_string('H H0 E:3 W:9 R:2 N0>N1'),
+            5: HomeBuyer.create_from_string('H H5 E:10 W:3 R:8 N1>N0'),
+        }
+        self.store = EntityStore.from_entities(self.neighborhoods, self.homebuyers)
+
+    def test_views(self):
+        """
+        Test that the views keep the `Neighborhood` and `HomeBuyer` APIs
+        """
+        neighborhood = self.store.neighborhoods[1]
+        homebuyer = self.store.homebuyers[5]
+
+        self.assertEqual(str(neighborhood), str(self.neighborhoods[1]))
+        self.assertEqual(str(homebuyer), str(self.homebuyers[5]))
+        self.assertEqual(homebuyer.neighborhood_priority, ['N1', 'N0'])
+        self.assertTrue(homebuyer.is_preferred_neighborhood(1))
+        self.assertTrue(homebuyer.is_preferred_neighborhood(0, priority=1))
+        self.assertEqual(homebuyer, self.store.homebuyer(1))
+        self.assertEqual(list(self.store.homebuyers), [0, 5])
+        self.assertFalse(hasattr(homebuyer, '__dict__'))
+
+    def test_scores(self):
+        """
+        Test that the scores read from the columns match `set_neighborhoods_score`
+        """
+        for entity_id, hb in self.homebuyers.items():
+            hb.set_neighborhoods_score(self.neighborhoods)
+            for neighb in self.neighborhoods:
+                self.assertEqual(
+                    self.store.homebuyers[entity_id].neighborhood_scores[neighb], hb.neighborhood_scores[neighb]
+                )
+
+    def test_neighborhood_rows(self):
+        """
+        Test that the neighborhood IDs are the rows of the store
+        """
+        store = EntityStore.from_entities(dict(reversed(self.neighborhoods.items())), self.homebuyers)
+        self.assertEqual(list(store.neighborhoods), [0, 1])
+        self.assertEqual(store.neighborhoods[1].attributes, tuple(self.neighborhoods[1].attributes))
+
+        with self.assertRaises(ValueError):
+            store.add_neighborhood(3, (1, 1, 1))
+        with self.assertRaises(ValueError):
+            EntityStore.from_entities({1: self.neighborhoods[1]}, {})
+
+    def test_priority_rows(self):
+        """
+        Test that the priority rows hold neighborhood IDs
+        """
+        self.assertEqual(len(self.store.priority_rows), 2)
+        self.assertEqual(self.store.priority_rows[1].tolist(), [1, 0])
+
+
+
+class BulkReaderTest(TestCase):
+    def setUp(self):
+        self.lines = [
+            'N N0 E:7 W:7 R:10',
+            'N N1 E:2 W:1 R:1',
+            '',
+            'H H0 E:3 W:9 R:2 N0>N1',
+            'H H1 E:4 W:3 R:7 N1',
+            'H H2 R:10 E:4 W:0 N0>N1',
+        ]
+        handle, self.file_path = tempfile.mkstemp(suffix='.txt')
+        os.close(handle)
+        self.addCleanup(os.remove, self.file_path)
+
+    def _write(self, lines: list) -> None:
+        with open(self.file_path, 'w') as file:
+            file.write('\n'.join(lines) + '\n')
+
+    def test_read(self):
+        """
+        Test that `read` matches `create_from_string`, whatever the block size
+        """
+        self._write(self.lines)
+        expected = EntityStore.from_entities(
+            {idx: Neighborhood.create_from_string(line) for idx, line in enumerate(self.lines[:2])},
+            {idx: HomeBuyer.create_from_string(line) for idx, line in enumerate(self.lines[3:])},
+        )
+
+        for block_size in (1, 16, 1 << 20):
+            store = BulkReader(self.file_path, block_size=block_size).read()
+            self.assertEqual(store.neighborhood_columns, expected.neighborhood_columns)
+            self.assertEqual(store.homebuyer_columns, expected.homebuyer_columns)
+            self.assertEqual(store.priorities, expected.priorities)
+            self.assertEqual(store.priority_offsets, expected.priority_offsets)
+
+    def test_malformed_line(self):
+        """
+        Test that a malformed line is reported with its line number
+        """
+        self._write(self.lines + ['H H3 E:x W:9 R:2 N0>N1'])
+
+        with self.assertRaises(InputFormatError) as context:
+            BulkReader(self.file_path, block_size=8).read()
+
+        self.assertEqual(context.exception.line_number, 7)
+        self.assertEqual(context.exception.line, 'H H3 E:x W:9 R:2 N0>N1')
+
+    def test_neighborhood_order(self):
+        """
+        Test that neighborhoods out of order, duplicated or missing are reported with their line 
+        number, whatever the block size and the number of workers
+        """
+        cases = (
+            (['N N1 E:2 W:1 R:1', 'N N0 E:7 W:7 R:10'], 1),
+            (['N N0 E:7 W:7 R:10', 'N N0 E:2 W:1 R:1'], 2),
+            (['N N0 E:7 W:7 R:10', '', 'N N2 E:2 W:1 R:1'], 3),
+        )
+        for neighborhood_lines, line_number in cases:
+            self._write(neighborhood_lines + self.lines[3:])
+            for block_size, workers in ((8, 1), (1 << 20, 1), (8, 2)):
+                with self.subTest(lines=neighborhood_lines, block_size=block_size, workers=workers):
+                    with self.assertRaises(InputFormatError) as context:
+                        BulkReader(self.file_path, block_size=block_size, workers=workers).read()
+                    self.assertEqual(context.exception.line_number, line_number)
+            with self.assertRaises(InputFormatError):
+                list(BulkReader(self.file_path, block_size=8).chunks())
+
+    def test_unknown_neighborhood(self):
+        """
+        Test that a homebuyer ranking a neighborhood missing from the input is reported with its line 
+        number, whatever the block size and the number of workers
+        """
+        for ranked in ('N0>N2', 'N-1'):
+            self._write(self.lines + [f'H H3 E:1 W:1 R:1 {ranked}'])
+            for block_size, workers in ((8, 1), (1 << 20, 1), (8, 2)):
+                with self.subTest(ranked=ranked, block_size=block_size, workers=workers):
+                    with self.assertRaises(InputFormatError) as context:
+                        BulkReader(self.file_path, block_size=block_size, workers=workers).read()
+                    self.assertEqual(context.exception.line_number, 7)
+                    self.assertIn('unknown neighborhood', context.exception.reason)
+
+    def test_empty_file(self):
+        """
+        Test that an empty file gives an empty store
+        """
+        store = BulkReader(self.file_path).read()
+        self.assertEqual(store.homebuyer_count, 0)
+
+    def test_chunks(self):
+        """
+        Test that the blocks of `chunks` together hold the entities of `read`
+        """
+        self._write(self.lines)
+        expected = BulkReader(self.file_path).read()
+
+        chunks = list(BulkReader(self.file_path, block_size=16).chunks())
+
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(
+            [entity_id for chunk in chunks for entity_id in chunk.homebuyer_columns['entity_id']],
+            list(expected.homebuyer_columns['entity_id']),
+        )
+        self.assertEqual(
+            [entity_id for chunk in chunks for entity_id in chunk.neighborhood_columns['entity_id']],
+            list(expected.neighborhood_columns['entity_id']),
+        )
+
+    def test_schema(self):
+        """
+        Test that the reader parses the attributes of a schema, with the fast path and line by line
+        """
+        schema = AttributeSchema.parse(','.join(f'A{idx}' for idx in range(12)))
+        attributes = ' '.join(f'A{idx}:{idx + 1}' for idx in range(12))
+        lines = [f'N N0 {attributes}', 'N N1 A11:2 A0:1', f'H H0 {attributes} N0']
+
+        for block in (lines[:1] + lines[2:], lines):
+            self._write(block)
+            store = BulkReader(self.file_path, schema=schema).read()
+            expected = EntityStore.from_entities(
+                {idx: Neighborhood.create_from_string(line, schema) for idx, line in enumerate(block[:-1])},
+                {0: HomeBuyer.create_from_string(block[-1], schema)},
+                schema,
+            )
+            self.assertEqual(store.neighborhood_columns, expected.neighborhood_columns)
+            self.assertEqual(store.homebuyer_columns, expected.homebuyer_columns)
+            self.assertEqual(store.score(0, 0), sum(value * value for value in range(1, 13)))
+
+        self._write(self.lines)
+        with self.assertRaises(InputFormatError):
+            BulkReader(self.file_path, schema=schema).read()
+
+
+
+class CompressedInputTest(TestCase):
+    COMPRESSORS = {'gzip': gzip.compress, 'xz': lzma.compress, 'bz2': bz2.compress}
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.content = '\n'.join([
+            'N N0 E:7 W:7 R:10', 'N N1 E:2 W:1 R:1', '', 'H H0 E:3 W:9 R:2 N0>N1', 'H H1 E:4 W:3 R:7 N1',
+            'H H2 R:10 E:4 W:0 N0>N1',
+        ]) + '\n'
+        self.plain_path = self._write('plain', self.content.encode())
+
+    def _write(self, name: str, content: bytes) -> str:
+        # The extension is always '.txt', the compression is detected from the content
+        path = os.path.join(self.directory, f'{name}.txt')
+        with open(path, 'wb') as file:
+            file.write(content)
+        return path
+
+    def test_detect_compression(self):
+        """
+        Test that each compression is detected by its first bytes and decompressed when opened
+        """
+        self.assertIsNone(detect_compression(self.plain_path))
+        for compression, compress in self.COMPRESSORS.items():
+            with self.subTest(compression=compression):
+                path = self._write(compression, compress(self.content.encode()))
+                self.assertEqual(detect_compression(path), compression)
+                with open_input(path, text=True) as file:
+                    self.assertEqual(file.read(), self.content)
+
+    def test_read(self):
+        """
+        Test that compressed files give the store of the plain file, whatever the block size and
+        the number of workers
+        """
+        expected = BulkReader(self.plain_path).read()
+        for compression, compress in self.COMPRESSORS.items():
+            path = self._write(compression, compress(self.content.encode()))
+            for block_size, workers in ((16, 1), (1 << 20, 1), (16, 2)):
+                with self.subTest(compression=compression, block_size=block_size, workers=workers):
+                    store = BulkReader(path, block_size=block_size, workers=workers).read()
+                    self.assertEqual(store.neighborhood_columns, expected.neighborhood_columns)
+                    self.assertEqual(store.homebuyer_columns, expected.homebuyer_columns)
+                    self.assertEqual(store.priorities, expected.priorities)
+                    self.assertEqual(store.priority_offsets, expected.priority_offsets)
+
+        chunks = list(BulkReader(path, block_size=16).chunks())
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(sum(chunk.homebuyer_count for chunk in chunks), 3)
+
+    def test_malformed_line(self):
+        """
+        Test that a malformed line found by a worker is reported with its line number
+        """
+        path = self._write('malformed', gzip.compress((self.content + 'H H3 E:x W:9 R:2 N0>N1\n').encode()))
+
+        with self.assertRaises(InputFormatError) as context:
+            BulkReader(path, block_size=8, workers=2).read()
+
+        self.assertEqual(context.exception.line_number, 7)
+        self.assertEqual(context.exception.line, 'H H3 E:x W:9 R:2 N0>N1')
+        with self.assertRaises(ValueError):
+            BulkReader(path, workers=0)
+
+    @skipIf(importlib.util.find_spec('zstandard'), 'zstandard is installed')
+    def test_zstd_requires_zstandard(self):
+        """
+        Test that a Zstandard file asks for the optional `zstandard` package
+        """
+        path = self._write('zstd', MAGIC['zstd'] + bytes(16))
+
+        self.assertEqual(detect_compression(path), 'zstd')
+        with self.assertRaises(ImportError):
+            BulkReader(path).read()
+
+
+class AttributeSchemaTest(TestCase):
+    def setUp(self):
+        self.schema = AttributeSchema.parse(','.join(f'A{idx}' for idx in range(12)))
+        self.neighborhood = Neighborhood.create_from_string(
+            'N N0 ' + ' '.join(f'A{idx}:{idx}' for idx in range(12)), self.schema
+        )
+
+    def test_parse(self):
+        """
+        Test the text form of a schema
+        """
+        self.assertEqual(str(DEFAULT_SCHEMA), 'E=energy,W=water,R=resilience')
+        self.assertEqual(AttributeSchema.parse(str(DEFAULT_SCHEMA)), DEFAULT_SCHEMA)
+        self.assertEqual(self.schema.names[:2], ('a0', 'a1'))
+        self.assertEqual(len(self.schema), 12)
+
+        for spec in ('', 'E,E', 'E=energy,W=energy', 'E=entity_id', 'E:1=energy'):
+            with self.subTest(spec=spec), self.assertRaises(ValueError):
+                AttributeSchema.parse(spec)
+
+    def test_parse_tokens(self):
+        """
+        Test that the attributes are parsed in any order, missing ones being 0
+        """
+        self.assertEqual(DEFAULT_SCHEMA.parse_tokens(['E:1', 'W:2', 'R:3']).tolist(), [1, 2, 3])
+        self.assertEqual(DEFAULT_SCHEMA.parse_tokens(['R:3', 'E:1']).tolist(), [1, 0, 3])
+
+        for tokens in (['X:1'], ['E1'], ['E:'], ['E:1', 'E:2'], ['E:x']):
+            with self.subTest(tokens=tokens), self.assertRaises(ValueError):
+                DEFAULT_SCHEMA.parse_tokens(tokens)
+
+    def test_entities(self):
+        """
+        Test entities with twelve attributes
+        """
+        homebuyer = HomeBuyer.create_from_string(
+            'H H3 ' + ' '.join(f'A{idx}:2' for idx in range(12)) + ' N0>N1', self.schema
+        )
+
+        homebuyer.set_neighborhoods_score({0: self.neighborhood})
+
+        self.assertEqual(self.neighborhood.a11, 11)
+        self.assertEqual(homebuyer.neighborhood_scores, {0: 2 * sum(range(12))})
+        self.assertEqual(str(HomeBuyer.create_from_string(str(homebuyer), self.schema)), str(homebuyer))
+        self.assertEqual(
+            str(Neighborhood(entity_id=1, a3=5, schema=self.schema)),
+            'N N1 ' + ' '.join(f'A{idx}:{5 if idx == 3 else 0}' for idx in range(12)),
+        )
+        with self.assertRaises(AttributeError):
+            self.neighborhood.energy
+        with self.assertRaises(ValueError):
+            Neighborhood(entity_id=1, energy=5, schema=self.schema)
+
+    def test_store(self):
+        """
+        Test that the store's views and scores follow the schema
+        """
+        homebuyer = HomeBuyer(0, *range(12), neighborhood_priority=['N0'], schema=self.schema)
+        homebuyer.set_neighborhoods_score({0: self.neighborhood})
+        store = EntityStore.from_entities({0: self.neighborhood}, {0: homebuyer}, self.schema)
+
+        self.assertEqual(store.columns, ('entity_id', *self.schema.names))
+        self.assertEqual(store.score(0, 0), homebuyer.neighborhood_scores[0])
+        self.assertEqual(str(store.homebuyers[0]), str(homebuyer))
+        self.assertEqual(store.neighborhoods[0].a5, 5)
+        self.assertEqual(list(store.homebuyers[0].attributes), list(range(12)))